@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+batch.py
+
+Collects several live data samples per inverter into one message.
+At sub-second polling the per-message overhead (envelope, MQTT headers)
+costs more than the data itself, so samples are flushed as one batch
+when it is full, too old, or the service shuts down.
+"""
+
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+LAYOUTS = ("rows", "columns")
+
+
+class _Batch:
+    """Pending samples of one inverter."""
+    __slots__ = ("measurement", "samples", "started")
+
+    def __init__(self, measurement, started):
+        self.measurement = measurement
+        self.samples = []
+        self.started = started
+
+
+class SampleBatcher:
+    """
+    Buffers samples per key (inverter name) and builds batch messages.
+    """
+
+    def __init__(self, max_samples=10, max_age_ms=0, layout="rows"):
+        """
+        :param max_samples: Flush when a batch holds this many samples (0 = no limit)
+        :param max_age_ms: Flush when the oldest sample is this old (0 = no limit)
+        :param layout: 'rows' (list of {time, fields}) or 'columns' (one array per field)
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown batch layout: {layout} (supported: {', '.join(LAYOUTS)})")
+        self.max_samples = max_samples
+        self.max_age = max_age_ms / 1000.0
+        self.layout = layout
+        self._batches = {}
+
+    @classmethod
+    def from_config(cls, settings):
+        """
+        Builds the batcher from the [batch] section.
+        :param settings: RawConfigParser instance
+        :return: SampleBatcher or None if batching is disabled
+        """
+        max_samples = settings.getint('batch', 'max_samples', fallback=0)
+        max_age_ms = settings.getint('batch', 'max_age_ms', fallback=0)
+        if max_samples <= 1 and max_age_ms <= 0:
+            return None
+        return cls(
+            max_samples=max_samples,
+            max_age_ms=max_age_ms,
+            layout=settings.get('batch', 'layout', fallback='rows').lower(),
+        )
+
+    def add(self, key, measurement, sample_time, fields, now=None):
+        """
+        Adds a sample.
+        :param key: Batch key (inverter name)
+        :param measurement: Measurement name of the inverter
+        :param sample_time: Timestamp of the sample
+        :param fields: Decoded field dict
+        :param now: Optional timestamp for the age check (defaults to time.monotonic())
+        :return: Batch message if the batch is full, otherwise None
+        """
+        if now is None:
+            now = time.monotonic()
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch(measurement, now)
+        batch.samples.append((sample_time, fields))
+        if self.max_samples and len(batch.samples) >= self.max_samples:
+            return self._take(key)
+        return None
+
+    def due(self, now=None):
+        """
+        Returns the batches whose oldest sample exceeded the maximum age.
+        :return: List of (key, batch message)
+        """
+        if not self.max_age or not self._batches:
+            return []
+        if now is None:
+            now = time.monotonic()
+        keys = [key for key, batch in self._batches.items() if now - batch.started >= self.max_age]
+        return [(key, self._take(key)) for key in keys]
+
+    def flush_all(self):
+        """
+        Returns all pending batches (e.g. on shutdown).
+        :return: List of (key, batch message)
+        """
+        return [(key, self._take(key)) for key in list(self._batches)]
+
+    def _take(self, key):
+        """Removes a batch and builds its message."""
+        batch = self._batches.pop(key)
+        if self.layout == "columns":
+            names = {}
+            for _, fields in batch.samples:
+                for name in fields:
+                    names[name] = None
+            columns = {name: [fields.get(name) for _, fields in batch.samples] for name in names}
+            return {
+                'measurement': batch.measurement,
+                'time': [sample_time for sample_time, _ in batch.samples],
+                'fields': columns,
+            }
+        return {
+            'measurement': batch.measurement,
+            'samples': [{'time': sample_time, 'fields': fields} for sample_time, fields in batch.samples],
+        }
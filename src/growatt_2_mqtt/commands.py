@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+commands.py
+
+Queue for control commands received via MQTT.
+on_message runs on paho's network thread; writing to the bus there would
+block keepalives and all other incoming messages until the polling loop
+releases the Modbus lock. Commands are therefore queued and written by a
+worker. Only the last value per inverter and command is kept, and a command
+is written once it has been stable for a short settle time, so dragging a
+slider in Home Assistant results in a single register write.
+"""
+
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class CommandQueue:
+    """
+    Coalescing queue of (inverter, command) -> value, drained by a worker thread.
+    """
+
+    def __init__(self, execute, settle=0.5):
+        """
+        :param execute: Callable(inverter, command, value) -> bool, runs on the worker thread
+        :param settle: Seconds a command must stay unchanged before it is written
+        """
+        self.execute = execute
+        self.settle = settle
+        # (inverter, command) -> (value, time of the last update); insertion order = write order
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self.received = 0
+        self.coalesced = 0
+        self.written = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._worker, name="Commands", daemon=True)
+        self._thread.start()
+
+    def put(self, inverter, command, value):
+        """
+        Queues a command without blocking; replaces a pending value of the same command.
+        :param inverter: Inverter name
+        :param command: Command (register) name
+        :param value: Value to write (dict of field -> value for register groups)
+        """
+        key = (inverter, command)
+        with self._cond:
+            self.received += 1
+            if key in self._pending:
+                self.coalesced += 1
+                pending = self._pending[key][0]
+                if isinstance(value, dict) and isinstance(pending, dict):
+                    # Register groups: fields of both updates are written together
+                    value = {**pending, **value}
+            self._pending[key] = (value, time.monotonic())
+            self._cond.notify()
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def close(self, timeout=5):
+        """Writes the pending commands and stops the worker."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=timeout)
+
+    def _next(self):
+        """Waits for a settled command; returns (key, value) or None when closed and drained."""
+        with self._cond:
+            while True:
+                if not self._pending:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                wait = None
+                for key, (value, updated) in self._pending.items():
+                    remaining = updated + self.settle - now
+                    if remaining <= 0 or self._closed:
+                        del self._pending[key]
+                        return key, value
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+
+    def _worker(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            (inverter, command), value = entry
+            try:
+                ok = self.execute(inverter, command, value)
+            except Exception as e:
+                log.error(f"Command {command} for {inverter} failed: {e}")
+                ok = False
+            if ok:
+                self.written += 1
+            else:
+                self.failed += 1
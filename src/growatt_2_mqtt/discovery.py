@@ -1,28 +1,175 @@
 #!/usr/bin/env python3
+import hashlib
+import heapq
+import itertools
 import json
 import logging
+import os
+import threading
+import time
+
+from .register_maps.metadata import sensor_meta, setting_meta
 
 log = logging.getLogger(__name__)
 
 
+class DiscoveryCache:
+    """
+    Content hashes of the published (retained) discovery configs, persisted as JSON.
+    Lets the bridge skip configs that the broker already holds in identical form.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: JSON file; None keeps the hashes in memory only
+        """
+        self.path = path
+        self.hashes = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.hashes = json.load(f)
+                log.info(f"Loaded {len(self.hashes)} discovery hashes from {path}")
+            except (OSError, ValueError) as e:
+                log.warning(f"Ignoring unreadable discovery cache {path}: {e}")
+
+    @staticmethod
+    def digest(payload):
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def unchanged(self, topic, digest):
+        return self.hashes.get(topic) == digest
+
+    def store(self, topic, digest):
+        self.hashes[topic] = digest
+        self.dirty = True
+
+    def snapshot(self):
+        """Copy of the hashes to save, or None if nothing changed (call under the owner's lock)."""
+        if not self.path or not self.dirty:
+            return None
+        self.dirty = False
+        return dict(self.hashes)
+
+    def save(self, hashes=None):
+        """
+        Writes the hashes atomically if they changed.
+        :param hashes: Result of snapshot(), so the file I/O can run outside the owner's lock
+        """
+        if hashes is None:
+            hashes = self.snapshot()
+            if hashes is None:
+                return
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(hashes, f, separators=(",", ":"), sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            self.dirty = True
+            log.error(f"Failed to save discovery cache {self.path}: {e}")
+
+
+class TokenBucket:
+    """
+    Token bucket rate limit: bursts of up to `burst` messages, then `rate` messages per second.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: Tokens per second; <= 0 disables the limit
+        :param burst: Max. tokens that can accumulate
+        """
+        self.rate = rate
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def wait(self):
+        """Blocks until a token is available and takes it."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            time.sleep((1 - self.tokens) / self.rate)
+            self.tokens = 1.0
+            self.updated = time.monotonic()
+        self.tokens -= 1
+
+
+# Publishing order of the configs (lower first)
+PRIORITY_DEVICE = 0     # device-based discovery and its migration
+PRIORITY_ENERGY = 1     # power and energy: what the Energy dashboard needs
+PRIORITY_MEASURED = 2   # other sensors with statistics
+PRIORITY_CONTROL = 3    # switches and numbers
+PRIORITY_DIAGNOSTIC = 4 # status words, codes, read-only settings
+
+
 class HADiscoveryManager:
     """
     Handles Home Assistant MQTT Auto-Discovery.
-    Guesses sensor types based on their register names to make it plug & play.
+    Units, classes and limits come from the static metadata of the register maps.
     """
-    def __init__(self, mqtt_client, base_topic):
+    def __init__(self, mqtt_client, base_topic, partial_updates=False, field_topics=False,
+                 cache_path=None, rate=10, burst=20, device_mode=False):
         """
-        Docstring for __init__
-        
-        :param self: Description
-        :param mqtt_client: Description
-        :param base_topic: Description
+        :param mqtt_client: MQTT sink used to publish the retained configs
+        :param base_topic: Base topic of the live data (<base_topic>/<inverter>)
+        :param partial_updates: True if live messages may contain only a subset of fields (report-by-exception)
+        :param field_topics: True if live values are published as scalars to <base_topic>/<inverter>/<field>
+        :param cache_path: File for the content hashes of published configs (survives restarts)
+        :param rate: Max. configs per second (after an initial burst)
+        :param burst: Configs that may be sent back to back before the rate applies
+        :param device_mode: Use HA's device-based discovery (one message per inverter)
+
+        Every inverter has its own topic tree below <base_topic>/<inverter>:
+        the live JSON document, /settings, /availability and /control/<field>.
+
+        Configs are published by a background thread in priority order, so neither
+        the polling loop nor the publisher thread waits for discovery.
+        The queue, the configs and the hash cache are shared with that thread and
+        only accessed under _cond; its publish callbacks also run under _cond.
         """
         self.mqtt = mqtt_client
         self.base_topic = base_topic
+        self.partial_updates = partial_updates
+        self.field_topics = field_topics
         self.ha_status = "online"  # Assume HA is online at start (it will correct us if not)
-        # Keeps track of published components to avoid spamming the broker
-        self.published_components = set()
+        # cache_key ("<name>_live"/"<name>_settings") -> keys already processed in this run
+        self.published_components = {}
+        # Content hashes of the retained configs on the broker
+        self.cache = DiscoveryCache(cache_path)
+        # config topic -> payload of every config generated in this run (for resends)
+        self.configs = {}
+        # config topic -> publishing priority
+        self.priorities = {}
+        self.bucket = TokenBucket(rate, burst)
+        # Heap of (priority, seq, topic, payload, callback)
+        self._queue = []
+        self._queued_topics = set()
+        self._seq = itertools.count()
+        # Reentrant: callbacks run under the lock and queue further messages
+        self._cond = threading.Condition(threading.RLock())
+        self._thread = None
+        # Set by set_ha_status (paho's thread); the worker queues the resend
+        self._resend = False
+        # Progress counters
+        self.sent = 0
+        self.failed = 0
+        # Device-based discovery: one config per inverter instead of one per entity
+        self.device_mode = device_mode
+        # inverter name -> {component id: config} of all entities discovered so far
+        self.device_components = {}
+        # inverter name -> (safe name, device block, availability block)
+        self._device_blocks = {}
+        self._pending_devices = set()
+        # (key, is_settings) -> (component, static part of the config)
+        self._entity_templates = {}
+        # inverter name -> live fields pruned as absent (see pruning.py)
+        self.absent = {}
 
     def set_ha_status(self, status):
         """Called when Home Assistant sends its online/offline status.
@@ -32,43 +179,208 @@ class HADiscoveryManager:
             log.info(f"Home Assistant status changed to: {status}")
             self.ha_status = status
             if status == "online":
-                # HA restarted, we need to republish all discovery messages
-                self.published_components.clear()
+                # HA restarted; the configs are retained, so a throttled resend is enough
+                self._start_resend()
 
-    def _guess_sensor_properties(self, key):
+    def _start_resend(self):
+        """Hands the resend of all configs of this run to the discovery thread."""
+        with self._cond:
+            if not self.configs:
+                return
+            self._resend = True
+            self._start_worker()
+            self._cond.notify()
+
+    def _queue_resend(self):
+        """Queues all configs of this run again; the broker retains them, so they go out rate-limited."""
+        log.info(f"Resending {len(self.configs)} discovery configs to Home Assistant...")
+        for topic, payload in self.configs.items():
+            if topic not in self._queued_topics:
+                self._enqueue(self.priorities.get(topic, PRIORITY_DIAGNOSTIC), topic, payload)
+
+    @property
+    def pending(self):
+        """Configs waiting to be published."""
+        with self._cond:
+            return len(self._queue)
+
+    def _start_worker(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name="Discovery", daemon=True)
+            self._thread.start()
+
+    def _enqueue(self, priority, topic, payload, callback=None):
         """
-        Infers the unit, device class, and state class from the sensor's name.
-        :param key: The name of the sensor (e.g. 'Pac', 'Vpv1', 'FaultCode')
-        :return: tuple (unit_of_measurement, device_class, state_class)
+        Queues a retained message for the discovery thread.
+        :param callback: Called with True/False after the publish attempt (under _cond)
         """
-        key_upper = key.upper()
-        
-        # 1. Text/Status Sensors (No unit, no measurement class)
-        if any(x in key_upper for x in ["STATUS", "MODE", "FAULT", "CODE", "TEXT", "DERATING", "WARNING"]):
-            return None, None, None
-            
-        # 2. Numeric Sensors
-        if key_upper.startswith("P") or "POWER" in key_upper:
-            return "W", "power", "measurement"
-        if key_upper.startswith("E") or "ENERGY" in key_upper or "TODAY" in key_upper or "TOTAL" in key_upper:
-            return "kWh", "energy", "total_increasing"
-        if key_upper.startswith("V") and "VERSION" not in key_upper:
-            return "V", "voltage", "measurement"
-        if key_upper.startswith("I"):
-            return "A", "current", "measurement"
-        if key_upper.startswith("F") or "FREQ" in key_upper:
-            return "Hz", "frequency", "measurement"
-        if "TEMP" in key_upper or "TINV" in key_upper:
-            return "°C", "temperature", "measurement"
-        if "SOC" in key_upper:
-            return "%", "battery", "measurement"
-        if "TIME" in key_upper:
-            return "s", "duration", "total_increasing"
-            
-        # Generic fallback for unknown numbers
-        return None, None, "measurement"
+        with self._cond:
+            heapq.heappush(self._queue, (priority, next(self._seq), topic, payload, callback))
+            self._queued_topics.add(topic)
+            self._cond.notify()
+            self._start_worker()
 
-    def publish_discovery(self, inverter_name, model, sensor_keys, is_settings=False):
+    def _worker(self):
+        started = None
+        while True:
+            with self._cond:
+                if self._resend:
+                    self._resend = False
+                    self._queue_resend()
+                if self._queue:
+                    _, _, topic, payload, callback = heapq.heappop(self._queue)
+                    self._queued_topics.discard(topic)
+                    remaining = len(self._queue)
+                    hashes = None
+                else:
+                    topic = None
+                    hashes = self.cache.snapshot()
+            if topic is None:
+                if started is not None:
+                    log.info(f"Discovery: {self.sent} configs published, {self.failed} failed "
+                             f"({time.monotonic() - started:.1f} s)")
+                    started = None
+                # Idle: persist the hashes of what went out
+                if hashes is not None:
+                    self.cache.save(hashes)
+                with self._cond:
+                    while not self._queue and not self._resend:
+                        self._cond.wait()
+                continue
+            if started is None:
+                started = time.monotonic()
+                self.sent = self.failed = 0
+            if self.ha_status != "online":
+                # Everything is queued again when Home Assistant comes back
+                ok = False
+            else:
+                self.bucket.wait()
+                ok = self.mqtt.publish(topic, payload, retain=True).rc == 0
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+            if callback:
+                try:
+                    with self._cond:
+                        callback(ok)
+                except Exception as e:
+                    log.error(f"Discovery callback for {topic} failed: {e}")
+            if ok and self.sent % 50 == 0:
+                log.info(f"Discovery: {self.sent} configs published, {remaining} pending")
+
+    @staticmethod
+    def _priority(component, payload):
+        """Publishing priority of an entity config."""
+        if component == "sensor":
+            if payload.get("device_class") in ("power", "energy", "battery"):
+                return PRIORITY_ENERGY
+            if payload.get("state_class"):
+                return PRIORITY_MEASURED
+            return PRIORITY_DIAGNOSTIC
+        return PRIORITY_CONTROL
+
+    def _entity_template(self, key, is_settings, writable=False):
+        """
+        The static part of an entity config, built once per field from the register map metadata.
+        :return: tuple (component, payload without name, ids and topics)
+        """
+        cached = self._entity_templates.get((key, is_settings, writable))
+        if cached is not None:
+            return cached
+        payload = {}
+        if is_settings:
+            # Only registers in the write map of the inverter get a switch or number
+            component, unit, minimum, maximum, step = setting_meta(key, allow_protected=True)
+            if not writable:
+                component = "sensor"
+            if component == "switch":
+                # HA expects ON/OFF states for switches, but Modbus uses 1/0
+                payload["value_template"] = f"{{% if value_json.{key} == 1 %}}ON{{% else %}}OFF{{% endif %}}"
+                # Translate HA's "ON/OFF" back into the register value
+                payload["command_template"] = "{% if value == 'ON' %}1{% else %}0{% endif %}"
+            else:
+                payload["value_template"] = f"{{{{ value_json.{key} }}}}"
+            if component == "number":
+                # Limits prevent invalid Modbus writes
+                payload["min"] = minimum
+                payload["max"] = maximum
+                payload["step"] = step
+            if unit:
+                payload["unit_of_measurement"] = unit
+            if component == "sensor":
+                payload["entity_category"] = "diagnostic"
+            else:
+                payload["entity_category"] = "config"
+        else:
+            component = "sensor"
+            unit, dev_class, state_class, precision = sensor_meta(key)
+            if self.field_topics:
+                # Plain scalar per topic, no JSON parsing needed in HA
+                pass
+            elif self.partial_updates:
+                # Keep the current state if the field is not part of this message
+                payload["value_template"] = f"{{{{ value_json.fields.{key} | default(this.state) }}}}"
+            else:
+                payload["value_template"] = f"{{{{ value_json.fields.{key} }}}}"
+            if unit:
+                payload["unit_of_measurement"] = unit
+            if dev_class:
+                payload["device_class"] = dev_class
+            if state_class:
+                payload["state_class"] = state_class
+            else:
+                # Status words and codes
+                payload["entity_category"] = "diagnostic"
+            if precision is not None:
+                payload["suggested_display_precision"] = precision
+        cached = (component, payload)
+        self._entity_templates[(key, is_settings, writable)] = cached
+        return cached
+
+    def _component_config(self, inverter_name, safe_name, device_topic, key, is_settings, writable=False):
+        """
+        Builds the discovery config of one entity (without device and availability).
+        :param writable: Settings only: the field can be written (switch/number instead of sensor)
+        :return: tuple (component, payload)
+        """
+        component, template = self._entity_template(key, is_settings, writable)
+        payload = {
+            "name": f"{inverter_name} {key}",
+            "unique_id": f"growatt_{safe_name}_{key.lower()}",
+        }
+        payload.update(template)
+        if is_settings:
+            payload["state_topic"] = f"{device_topic}/settings"
+            if component != "sensor":
+                # The topic where HA sends the command
+                payload["command_topic"] = f"{device_topic}/control/{key}"
+        elif self.field_topics:
+            payload["state_topic"] = f"{device_topic}/{key}"
+        else:
+            payload["state_topic"] = device_topic
+        if not is_settings and key in self.absent.get(inverter_name, ()):
+            # Not published anymore: hidden by default and keeps its last state
+            payload["enabled_by_default"] = False
+            payload["entity_category"] = "diagnostic"
+            if "value_template" in payload:
+                payload["value_template"] = f"{{{{ value_json.fields.{key} | default(this.state) }}}}"
+        return component, payload
+
+    def set_absent(self, inverter_name, keys):
+        """
+        Updates the live fields of an inverter that are no longer published.
+        Their configs (and those of revived fields) are regenerated with the next publish_discovery().
+        :param keys: Set of absent field names
+        """
+        with self._cond:
+            old = self.absent.get(inverter_name, set())
+            self.absent[inverter_name] = set(keys)
+            done = self.published_components.get(f"{inverter_name}_live")
+            if done:
+                done.difference_update(old.symmetric_difference(keys))
+
+    def publish_discovery(self, inverter_name, model, sensor_keys, is_settings=False, writable=()):
         """
         Publishes HA Auto-Discovery config. 
         Differentiates between live sensors (read-only) and settings (read/write),
@@ -77,116 +389,131 @@ class HADiscoveryManager:
         :param model: Model of the inverter
         :param sensor_keys: List of sensor keys to publish
         :param is_settings: If True, creates interactive components (switches/sliders) for settings; otherwise, creates read-only sensors for live data.
+        :param writable: Settings that can be written (the write map of the inverter); all others become read-only sensors
         """
         # If set to offline, we just silently return (no logging)
         if self.ha_status != "online":
             return
             
-        # Prevent spamming the MQTT broker if already published
-        cache_key = f"{inverter_name}_{'settings' if is_settings else 'live'}"
-        if cache_key in self.published_components:
-            return
-            
-        log.info(f"Publishing HA Auto-Discovery for '{inverter_name}' ({'Settings' if is_settings else 'Live Data'})...")
-        safe_name = inverter_name.replace(" ", "_").lower()
-        
-        # Device information to group all sensors under one device in HA
-        device_info = {
-            "identifiers": [f"growatt_{safe_name}"],
-            "name": f"Growatt {inverter_name}",
-            "manufacturer": "Growatt",
-            "model": model
-        }
-        
-        count = 0
-        for key in sensor_keys:
-            payload = {}
-            component = "sensor"  # Default to read-only sensor
-            
-            # ==========================================
-            # CASE 1: HOLDING REGISTERS (WRITABLE)
-            # ==========================================
-            if is_settings:
-                state_topic = f"{self.base_topic}/settings"
-                
-                # A: Is it a switch? (e.g., "ACChargeEnable" or "OnOff")
-                if any(x in key.upper() for x in ["ENABLE", "ONOFF"]):
-                    component = "switch"
-                    
-                    # HA expects ON/OFF states for switches, but Modbus uses 1/0
-                    val_template = f"{{% if value_json.{key} == 1 %}}ON{{% else %}}OFF{{% endif %}}"
-                    
-                    payload = {
-                        "name": f"{inverter_name} {key}",
-                        "unique_id": f"growatt_{safe_name}_{key.lower()}",
-                        "state_topic": state_topic,
-                        "value_template": val_template,
-                        # The topic where HA sends the command
-                        "command_topic": f"{self.base_topic}/set",
-                        # Translate HA's "ON/OFF" back into our custom JSON command format
-                        "command_template": f'{{"command": "{key}", "value": {{% if value == "ON" %}}1{{% else %}}0{{% endif %}} }}',
-                        "device": device_info
-                    }
-                
-                # B: Is it a number / slider? (e.g., Power limits or percentages)
-                else:
-                    component = "number"
-                    val_template = f"{{{{ value_json.{key} }}}}"
-                    
-                    payload = {
-                        "name": f"{inverter_name} {key}",
-                        "unique_id": f"growatt_{safe_name}_{key.lower()}",
-                        "state_topic": state_topic,
-                        "value_template": val_template,
-                        "command_topic": f"{self.base_topic}/set",
-                        # Send the new slider value as a JSON command
-                        "command_template": f'{{"command": "{key}", "value": {{{{ value }}}} }}',
-                        "device": device_info
-                    }
-                    
-                    # Set smart limits for specific sliders to prevent invalid Modbus writes
-                    if "Rate" in key or "Limit" in key:
-                        payload["min"] = 0
-                        payload["max"] = 100
-                    elif "Time" in key or "Hour" in key:
-                        payload["min"] = 0
-                        payload["max"] = 23
-                    elif "Min" in key:
-                        payload["min"] = 0
-                        payload["max"] = 59
-            
-            # ==========================================
-            # CASE 2: INPUT REGISTERS (READ-ONLY)
-            # ==========================================
+        with self._cond:
+            # Only keys not processed in this run (new fields may show up later)
+            cache_key = f"{inverter_name}_{'settings' if is_settings else 'live'}"
+            done = self.published_components.setdefault(cache_key, set())
+            sensor_keys = [key for key in sensor_keys if key not in done]
+            if not sensor_keys:
+                return
+
+            log.debug(f"Checking HA Auto-Discovery for '{inverter_name}' ({'Settings' if is_settings else 'Live Data'})...")
+            safe_name = inverter_name.replace(" ", "_").lower()
+            device_topic = f"{self.base_topic}/{inverter_name}"
+
+            # Device information to group all sensors under one device in HA
+            device_info = {
+                "identifiers": [f"growatt_{safe_name}"],
+                "name": f"Growatt {inverter_name}",
+                "manufacturer": "Growatt",
+                "model": model
+            }
+
+            components = [(key, *self._component_config(inverter_name, safe_name, device_topic, key, is_settings,
+                                                        key in writable))
+                          for key in sensor_keys]
+            availability = [
+                {"topic": f"{self.base_topic}/availability"},
+                {"topic": f"{device_topic}/availability"},
+            ]
+            if self.device_mode:
+                # Collected here, published by flush_device() once live data and settings are known
+                cmps = self.device_components.setdefault(inverter_name, {})
+                for key, component, payload in components:
+                    payload["platform"] = component
+                    cmps[key.lower()] = payload
+                self._device_blocks[inverter_name] = (safe_name, device_info, availability)
+                self._pending_devices.add(inverter_name)
+                done.update(key for key, _, _ in components)
+                return
+
+            queued = 0
+            for key, component, payload in components:
+                # --- Tell Home Assistant to monitor our LWT topic and the inverter itself ---
+                payload["device"] = device_info
+                payload["availability"] = availability
+                payload["availability_mode"] = "all"
+                config_topic = f"homeassistant/{component}/{safe_name}/{key.lower()}/config"
+                # Stable serialization, so identical configs hash identically
+                config = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+                self.configs[config_topic] = config
+                priority = self._priority(component, payload)
+                self.priorities[config_topic] = priority
+                done.add(key)
+                digest = self.cache.digest(config)
+                if self.cache.unchanged(config_topic, digest):
+                    continue
+                self._enqueue(priority, config_topic, config,
+                              self._entity_callback(config_topic, digest, done, key))
+                queued += 1
+
+            if queued:
+                log.info(f"Queued {queued} discovery configs for '{inverter_name}' "
+                         f"({len(components) - queued} unchanged).")
+
+    def _entity_callback(self, topic, digest, done, key):
+        def callback(ok):
+            if ok:
+                self.cache.store(topic, digest)
             else:
-                component = "sensor"
-                state_topic = self.base_topic
-                val_template = f"{{{{ value_json.fields.{key} }}}}"
-                
-                # Guess units and HA classes based on the sensor name
-                unit, dev_class, state_class = self._guess_sensor_properties(key)
-                
-                payload = {
-                    "name": f"{inverter_name} {key}",
-                    "unique_id": f"growatt_{safe_name}_{key.lower()}",
-                    "state_topic": state_topic,
-                    "value_template": val_template,
-                    "device": device_info
-                }
-                
-                # Only append attributes if they were successfully guessed
-                if unit: payload["unit_of_measurement"] = unit
-                if dev_class: payload["device_class"] = dev_class
-                if state_class: payload["state_class"] = state_class
-
-            # ==========================================
-            # PUBLISH TO HOME ASSISTANT
-            # ==========================================
-            # --- Tell Home Assistant to monitor our LWT topic ---
-            payload["availability_topic"] = f"{self.base_topic}/availability"
-            config_topic = f"homeassistant/{component}/{safe_name}/{key.lower()}/config"
-            self.mqtt.publish(config_topic, json.dumps(payload), retain=True)
-            count += 1
-            
-        self.published_components.add(cache_key)
-        log.info(f"Successfully published {count} discovery {component}s for '{inverter_name}'.")
\ No newline at end of file
+                # Not connected or HA offline: queued again with the next sample
+                done.discard(key)
+        return callback
+
+    def flush_device(self, inverter_name):
+        """
+        Device-based discovery: publishes one retained message for the inverter listing all
+        of its components (live and settings), with shared device and availability blocks.
+        Entity configs of the per-entity schema are migrated and then removed.
+        No-op in per-entity mode or if nothing changed since the last call.
+        """
+        with self._cond:
+            if inverter_name not in self._pending_devices:
+                return
+            self._pending_devices.discard(inverter_name)
+            safe_name, device_info, availability = self._device_blocks[inverter_name]
+            cmps = self.device_components[inverter_name]
+            config_topic = f"homeassistant/device/growatt_{safe_name}/config"
+            config = json.dumps({
+                "device": device_info,
+                "origin": {"name": "growatt2mqtt"},
+                "availability": availability,
+                "availability_mode": "all",
+                "components": cmps,
+            }, sort_keys=True, separators=(",", ":"))
+            self.configs[config_topic] = config
+            self.priorities[config_topic] = PRIORITY_DEVICE
+            digest = self.cache.digest(config)
+            if self.cache.unchanged(config_topic, digest):
+                return
+            # Entity configs published by the per-entity schema for this device:
+            # homeassistant/<component>/<safe_name>/<key>/config
+            old_topics = [topic for topic in list(self.cache.hashes)
+                          if topic.split("/")[1] != "device" and topic.split("/")[2] == safe_name]
+            for topic in old_topics:
+                # Keeps the entities (and their history) while the device config takes over
+                self._enqueue(PRIORITY_DEVICE, topic, '{"migrate_discovery":true}')
+
+            def callback(ok):
+                # Runs on the discovery thread under _cond
+                if not ok:
+                    # Try again with the next sample
+                    self._pending_devices.add(inverter_name)
+                    return
+                for topic in old_topics:
+                    self._enqueue(PRIORITY_DEVICE, topic, "")
+                    self.cache.hashes.pop(topic, None)
+                    self.configs.pop(topic, None)
+                if old_topics:
+                    log.info(f"Migrated {len(old_topics)} entity discovery configs of '{inverter_name}' "
+                             f"to device-based discovery.")
+                self.cache.store(config_topic, digest)
+                log.info(f"Published device discovery for '{inverter_name}' ({len(cmps)} components).")
+
+            self._enqueue(PRIORITY_DEVICE, config_topic, config, callback)
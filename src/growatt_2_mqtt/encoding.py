@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+encoding.py
+
+Payload encodings for live data messages.
+Besides JSON, samples can be encoded as CBOR or MessagePack (optional packages).
+In schema-indexed mode the field names are not sent at all: values go out as a
+positional array and a retained schema message per model describes the field
+order and types.
+"""
+
+import logging
+import zlib
+
+from .serializer import JsonSerializer
+
+log = logging.getLogger(__name__)
+
+# Optional dependencies
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+ENCODINGS = ("json", "cbor", "msgpack")
+
+
+def _type_name(value):
+    """Schema type name of a decoded value."""
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    return "str"
+
+
+class Schema:
+    """Field order and types of one model. Fields are only ever appended."""
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = []
+        self.types = []
+        self.positions = {}
+        self.id = 0
+
+    def extend(self, fields):
+        """
+        Appends unknown fields of a sample.
+        :param fields: Decoded field dict
+        :return: True if the schema changed
+        """
+        changed = False
+        for name, value in fields.items():
+            if name not in self.positions:
+                self.positions[name] = len(self.fields)
+                self.fields.append(name)
+                self.types.append(_type_name(value))
+                changed = True
+        if changed:
+            self.id = zlib.crc32("\0".join(self.fields).encode("utf-8"))
+        return changed
+
+    def as_dict(self):
+        """JSON description published on the retained schema topic."""
+        return {
+            "model": self.model,
+            "id": self.id,
+            "fields": [[name, dtype] for name, dtype in zip(self.fields, self.types)],
+        }
+
+
+class PayloadEncoder:
+    """
+    Encodes live data payloads ({'time', 'measurement', 'fields'}).
+    """
+
+    def __init__(self, encoding="json", schema_indexed=False):
+        """
+        :param encoding: 'json', 'cbor' or 'msgpack'
+        :param schema_indexed: Send values as positional array described by a schema message
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown payload encoding: {encoding} (supported: {', '.join(ENCODINGS)})")
+        if encoding == "cbor" and cbor2 is None:
+            raise RuntimeError("Payload encoding 'cbor' requires the 'cbor2' package (pip install cbor2)")
+        if encoding == "msgpack" and msgpack is None:
+            raise RuntimeError("Payload encoding 'msgpack' requires the 'msgpack' package (pip install msgpack)")
+        self.encoding = encoding
+        self.schema_indexed = schema_indexed
+        self.json = JsonSerializer()
+        self.schemas = {}
+
+    @classmethod
+    def from_config(cls, settings, section='mqtt'):
+        """
+        Builds the encoder from the 'encoding' and 'schema_indexed' options of a section.
+        :param settings: RawConfigParser instance
+        :param section: Config section to read
+        """
+        return cls(
+            settings.get(section, 'encoding', fallback='json').lower(),
+            schema_indexed=settings.getboolean(section, 'schema_indexed', fallback=False),
+        )
+
+    @property
+    def is_json(self):
+        """True if the payloads are plain JSON documents (usable by HA templates)."""
+        return self.encoding == "json" and not self.schema_indexed
+
+    def dumps(self, obj):
+        """Serializes an object with the configured encoding."""
+        if self.encoding == "cbor":
+            return cbor2.dumps(obj)
+        if self.encoding == "msgpack":
+            return msgpack.packb(obj, use_bin_type=True)
+        return self.json.dumps(obj)
+
+    def encode(self, model, payload):
+        """
+        Encodes a live data payload.
+        :param model: Inverter model (selects the schema in indexed mode)
+        :param payload: dict with 'time', 'measurement' and 'fields'
+        :return: tuple (encoded payload, schema or None). The schema is only returned if it changed
+                 and must be (re)published before the payload.
+        """
+        if not self.schema_indexed:
+            return self.dumps(payload), None
+
+        schema = self.schemas.get(model)
+        if schema is None:
+            schema = self.schemas[model] = Schema(model)
+        fields = payload['fields']
+        changed = schema.extend(fields)
+        # Fields missing from this sample (e.g. report-by-exception) are sent as null
+        values = [None] * len(schema.fields)
+        positions = schema.positions
+        for name, value in fields.items():
+            values[positions[name]] = value
+        encoded = self.dumps([payload['time'], schema.id, values])
+        if changed:
+            log.info(f"Payload schema for {model} now has {len(schema.fields)} fields (id {schema.id})")
+            return encoded, schema
+        return encoded, None
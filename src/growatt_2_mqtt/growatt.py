@@ -11,6 +11,8 @@ import struct
 from pymodbus.exceptions import ModbusIOException, ModbusException
 from pymodbus.pdu import ExceptionResponse
 
+from .register_maps.metadata import setting_meta
+
 
 # --- Import Register Maps ---
 # Ensure these files are located in the same directory.
@@ -106,57 +108,184 @@ except ImportError:
 
 # Holding Registers 
 try:
-    from .register_maps.growatt_MOD_TL3_XH_holding import REG_HOLDING_MOD_TL3_XH_MAP, REG_HOLDING_MOD_TL3_XH_WRITE_MAP
+    from .register_maps.growatt_MOD_TL3_XH_holding import REG_HOLDING_MOD_TL3_XH_MAP
     from .register_maps.growatt_MOD_TL3_XH_holding import REG_HOLDING_MOD_TL3_XH_ADVANCED_SETTINGS_MAP
+    from .register_maps.growatt_MOD_TL3_XH_holding import REG_HOLDING_MOD_TL3_XH_WRITE_GROUPS
 except ImportError:
     REG_HOLDING_MOD_TL3_XH_MAP = {}
     REG_HOLDING_MOD_TL3_XH_ADVANCED_SETTINGS_MAP = {}
-    REG_HOLDING_MOD_TL3_XH_WRITE_MAP = {}
+    REG_HOLDING_MOD_TL3_XH_WRITE_GROUPS = {}
     logging.warning("Could not import growatt_MOD_TL3_XH_holding. Holding register functionality might be limited.")
 
 try:
     from .register_maps.growatt_MAX_holding import REG_HOLDING_MAX_MAP
     from .register_maps.growatt_MAX_holding import REG_HOLDING_MAX_MAP_EXTENDED
+    from .register_maps.growatt_MAX_holding import REG_HOLDING_MAX_WRITE_GROUPS
 except ImportError:
     REG_HOLDING_MAX_MAP = {}
     REG_HOLDING_MAX_MAP_EXTENDED = {}
+    REG_HOLDING_MAX_WRITE_GROUPS = {}
     logging.warning("Could not import growatt_MAX_holding.")
 
 try:
     from .register_maps.growatt_TLXH_min_holding import REG_HOLDING_TLXH_MIN_MAP
     from .register_maps.growatt_TLXH_min_holding import REG_HOLDING_TLXH_MIN_BAT_MAP
     from .register_maps.growatt_TLXH_min_holding import REG_HOLDING_TLXH_US_MAP
+    from .register_maps.growatt_TLXH_min_holding import REG_HOLDING_TLXH_MIN_WRITE_GROUPS
 except ImportError:
     REG_HOLDING_TLXH_MIN_MAP = {}
     REG_HOLDING_TLXH_MIN_BAT_MAP = {}
     REG_HOLDING_TLXH_US_MAP = {}
+    REG_HOLDING_TLXH_MIN_WRITE_GROUPS = {}
     logging.warning("Could not import growatt_TLXH_min_holding.")
 
 try:
     from .register_maps.growatt_storage_mix_holding import REG_HOLDING_MIX_MAP
     from .register_maps.growatt_storage_mix_holding import REG_HOLDING_MIX_STORAGE_MAP
+    from .register_maps.growatt_storage_mix_holding import REG_HOLDING_MIX_WRITE_GROUPS
 except ImportError:
     REG_HOLDING_MIX_MAP = {}
     REG_HOLDING_MIX_STORAGE_MAP = {}
+    REG_HOLDING_MIX_WRITE_GROUPS = {}
     logging.warning("Could not import growatt_storage_mix_holding.")
 
 try:
     from .register_maps.growatt_storage_spa_holding import REG_HOLDING_SPA_MAP
     from .register_maps.growatt_storage_spa_holding import REG_HOLDING_SPA_STRAT_CHRG_MAP
+    from .register_maps.growatt_storage_spa_holding import REG_HOLDING_SPA_WRITE_GROUPS
 except ImportError:
     REG_HOLDING_SPA_MAP = {}
     REG_HOLDING_SPA_STRAT_CHRG_MAP = {}
+    REG_HOLDING_SPA_WRITE_GROUPS = {}
     logging.warning("Could not import growatt_storage_spa_holding.")
 
 try:
     from .register_maps.growatt_storage_sph_holding import REG_HOLDING_SPH_MAP
     from .register_maps.growatt_storage_sph_holding import REG_HOLDING_SPH_H_BAT_MAP
+    from .register_maps.growatt_storage_sph_holding import REG_HOLDING_SPH_WRITE_GROUPS
 except ImportError:
     REG_HOLDING_SPH_MAP = {}
     REG_HOLDING_SPH_H_BAT_MAP = {}
+    REG_HOLDING_SPH_WRITE_GROUPS = {}
     logging.warning("Could not import growatt_storage_sph_holding.")
 
+try:
+    from .register_maps.growatt_TL3X_holding import REG_HOLDING_TL3X_MAP
+    from .register_maps.growatt_TL3X_holding import REG_HOLDING_TL3X_ADVANCED_SETTINGS_MAP
+    from .register_maps.growatt_TL3X_holding import REG_HOLDING_TL3X_ID_MAP
+    from .register_maps.growatt_TL3X_holding import REG_HOLDING_TL3X_WRITE_GROUPS
+except ImportError:
+    REG_HOLDING_TL3X_MAP = {}
+    REG_HOLDING_TL3X_ADVANCED_SETTINGS_MAP = {}
+    REG_HOLDING_TL3X_ID_MAP = {}
+    REG_HOLDING_TL3X_WRITE_GROUPS = {}
+    logging.warning("Could not import growatt_TL3X_holding.")
+
+# Holding registers per model: ((base register, map), ...), write groups.
+# Map offsets are relative to the base. Write maps, write groups and the model
+# aliases are all derived from this one table.
+_HOLDING_TLXH_MIN = (((0, REG_HOLDING_TLXH_MIN_MAP), (3000, REG_HOLDING_TLXH_MIN_BAT_MAP),
+                      (3000, REG_HOLDING_TLXH_US_MAP)), REG_HOLDING_TLXH_MIN_WRITE_GROUPS)
+HOLDING_MODELS = {
+    "MOD-XH": (((0, REG_HOLDING_MOD_TL3_XH_MAP), (3000, REG_HOLDING_MOD_TL3_XH_ADVANCED_SETTINGS_MAP)),
+               REG_HOLDING_MOD_TL3_XH_WRITE_GROUPS),
+    "MAX": (((0, REG_HOLDING_MAX_MAP), (125, REG_HOLDING_MAX_MAP_EXTENDED)), REG_HOLDING_MAX_WRITE_GROUPS),
+    "TL-XH": _HOLDING_TLXH_MIN,
+    "TL-XH-MIN": _HOLDING_TLXH_MIN,
+    "TL-XH_MIN": _HOLDING_TLXH_MIN,
+    "TL_X_MIN": _HOLDING_TLXH_MIN,
+    # The offsets of the MIX storage map are absolute addresses
+    "MIX": (((0, REG_HOLDING_MIX_MAP), (0, REG_HOLDING_MIX_STORAGE_MAP)), REG_HOLDING_MIX_WRITE_GROUPS),
+    "SPA": (((0, REG_HOLDING_SPA_MAP), (1000, REG_HOLDING_SPA_STRAT_CHRG_MAP)), REG_HOLDING_SPA_WRITE_GROUPS),
+    "SPH": (((0, REG_HOLDING_SPH_MAP), (1000, REG_HOLDING_SPH_H_BAT_MAP)), REG_HOLDING_SPH_WRITE_GROUPS),
+    "TL3X": (((0, REG_HOLDING_TL3X_MAP), (125, REG_HOLDING_TL3X_ADVANCED_SETTINGS_MAP),
+              (3000, REG_HOLDING_TL3X_ID_MAP)), REG_HOLDING_TL3X_WRITE_GROUPS),
+}
+HOLDING_BLOCKS = {model: blocks for model, (blocks, _) in HOLDING_MODELS.items()}
+
+# Indices into a compiled write map entry
+_W_REG, _W_SCALE, _W_LO, _W_HI, _W_SIGNED = range(5)
+
+
+def compile_write_map(blocks, allow_protected=False):
+    """
+    Derives the write map of a model from its holding register maps.
+    Only fields the register map metadata declares as switch or number are writable;
+    scale and allowed range are resolved here once, so validating a command is a
+    dict lookup and two comparisons.
+    :param blocks: Tuple of (base register, holding map)
+    :param allow_protected: Include the PROTECTED_SETTING_META fields (grid code, protection limits, address, battery type)
+    :return: dict field -> (register, scale, raw min, raw max, signed)
+    """
+    write_map = {}
+    for base, map_ref in blocks:
+        for field, (offset, length, scale, dtype) in map_ref.items():
+            # Only single-register numbers can be written; ASCII ids and 32 bit values are read-only
+            if length != 1 or dtype not in ("uint", "int"):
+                continue
+            component, _, minimum, maximum, _ = setting_meta(field, allow_protected)
+            signed = dtype == "int"
+            lo, hi = (-0x8000, 0x7FFF) if signed else (0, 0xFFFF)
+            if component == "switch":
+                lo, hi = 0, 1
+            elif component == "number":
+                lo = max(lo, round(minimum * scale))
+                hi = min(hi, round(maximum * scale))
+            else:
+                # Clock, ids, codes and fields without metadata stay read-only
+                continue
+            write_map[field] = (base + offset, scale, lo, hi, signed)
+    return write_map
+
+
+def compile_write_groups(model, blocks, write_map, groups):
+    """
+    Checks the write groups of a model against its holding register maps.
+    A group must cover consecutive registers from its first register, and all of its
+    fields must be writable; other groups are left out.
+    :param model: Model name (for the log)
+    :param blocks: Tuple of (base register, holding map)
+    :param write_map: Compiled write map of the model
+    :param groups: dict group name -> (first register, field names in register order)
+    :return: dict of the usable groups
+    """
+    registers = {field: base + spec[0] for base, map_ref in blocks for field, spec in map_ref.items()}
+    valid = {}
+    for group, (start, fields) in groups.items():
+        if [registers.get(field) for field in fields] != list(range(start, start + len(fields))):
+            logging.warning(f"{model}: Write group {group} does not match the holding register map, ignored")
+            continue
+        read_only = [field for field in fields if field not in write_map]
+        if read_only:
+            logging.debug(f"{model}: Write group {group} not available, read-only: {', '.join(read_only)}")
+            continue
+        valid[group] = (start, fields)
+    if write_map and not valid:
+        logging.warning(f"{model}: No write groups, settings are written one register at a time (FC06)")
+    return valid
+
+
+_WRITE_TABLES = {}
+
+
+def write_tables(allow_protected=False):
+    """
+    Write maps and write groups of all models, compiled once per variant and shared
+    by all inverters of a model.
+    :param allow_protected: Variant including the protected fields (see PROTECTED_SETTING_META)
+    :return: tuple (model -> write map, model -> write groups)
+    """
+    tables = _WRITE_TABLES.get(allow_protected)
+    if tables is None:
+        write_maps, write_groups = {}, {}
+        for model, (blocks, groups) in HOLDING_MODELS.items():
+            write_maps[model] = compile_write_map(blocks, allow_protected)
+            write_groups[model] = compile_write_groups(model, blocks, write_maps[model], groups)
+        tables = _WRITE_TABLES[allow_protected] = (write_maps, write_groups)
+    return tables
+
 
+WRITE_MAPS, WRITE_GROUPS = write_tables()
 
 
 # --- Constants & Lookups ---
@@ -241,7 +370,7 @@ class Growatt:
     Main class to control and read data from Growatt Inverters via Modbus RTU.
     """
 
-    def __init__(self, client, name, unit, model, log=None):
+    def __init__(self, client, name, unit, model, log=None, allow_protected=False):
         """
         Initialize the inverter object.
         
@@ -250,6 +379,7 @@ class Growatt:
         :param unit: Modbus Unit ID (Slave Address)
         :param model: Model variant, e.g., "TL-XH" or "TL3X"
         :param log: Optional logger (if None, a default logger will be created)
+        :param allow_protected: Make the PROTECTED_SETTING_META fields writable
         """
         self.client = client
         self.name = name
@@ -258,6 +388,13 @@ class Growatt:
         self.offline_counter = 0
         self.is_sleeping = False
         self.log = logging.getLogger(f"Growatt_{name}")
+        # Register blocks read by update(): start_reg -> (length, map_ref, is_input_reg)
+        self.blocks = {}
+        write_maps, write_groups = write_tables(allow_protected)
+        # Writable registers: field -> (register, scale, raw min, raw max, signed)
+        self.write_map = write_maps.get(model, {})
+        # Writable register groups: name -> (start_reg, field names)
+        self.write_groups = write_groups.get(model, {})
 
     def read_settings(self):
         """
@@ -416,6 +553,8 @@ class Growatt:
                 self.log.info(f"{self.name}: Inverter is back ONLINE after {self.offline_counter} failed cycles.")
             self.offline_counter = 0
             self.is_sleeping = False
+            if is_input_reg and start_reg not in self.blocks:
+                self.blocks[start_reg] = (length, map_ref, is_input_reg)
             # Parse raw data using the register map
             return self._parse_registers(rr, start_reg, map_ref)
         except Exception as e:
@@ -717,6 +856,32 @@ class Growatt:
             data = self._process_logic(data)
         return data
 
+    def reread_fields(self, field_names):
+        """
+        Re-reads only the register blocks that contain the given fields.
+        Used to get a second opinion on values rejected as implausible.
+        :param field_names: Iterable of field names from a previous update()
+        :return: Dictionary of freshly parsed data (may be empty)
+        """
+        data = {}
+        for start_reg, (length, map_ref, is_input_reg) in self.blocks.items():
+            if any(name in map_ref for name in field_names):
+                block = self._read_block(start_reg, length, map_ref, is_input_reg=is_input_reg)
+                if block:
+                    data.update(block)
+        return data
+
+    def field_types(self):
+        """
+        Register types of the live data fields read so far.
+        :return: Dictionary field name -> (dtype, scale) from the register maps
+        """
+        types = {}
+        for length, map_ref, is_input_reg in list(self.blocks.values()):
+            for name, (offset, reg_len, scale, dtype) in map_ref.items():
+                types[name] = (dtype, scale)
+        return types
+
     def get_supported_models_help(self):
         return """
         Supported Inverter Models (Protocol Shortcodes):
@@ -763,31 +928,146 @@ class Growatt:
         python growatt2mqtt.py --model TL-XH
         """
     
-    def write_command(self, command: str, value: int, lock) -> bool:
+    def to_raw(self, field: str, value) -> int:
+        """
+        Converts a setting value (as published in <topic>/settings) into the register value.
+        :param field: Field name (must be in write_map)
+        :param value: Value in engineering units, e.g. 253.5 for GridVoltHigh
+        :return: Register value (two's complement for signed fields)
+        :raises ValueError: If the value is out of range
+        """
+        entry = self.write_map[field]
+        raw = round(value * entry[_W_SCALE])
+        if not entry[_W_LO] <= raw <= entry[_W_HI]:
+            raise ValueError(f"{field} = {value} is out of range "
+                             f"({entry[_W_LO] / entry[_W_SCALE]:g}..{entry[_W_HI] / entry[_W_SCALE]:g})")
+        return raw & 0xFFFF
+
+    def to_setting(self, field: str, raw: int):
+        """
+        Converts a raw holding register value into the value published in <topic>/settings.
+        :param field: Field name
+        :param raw: Register value
+        """
+        entry = self.write_map.get(field)
+        if entry is None:
+            return raw
+        if entry[_W_SIGNED] and raw >= 0x8000:
+            raw -= 0x10000
+        scale = entry[_W_SCALE]
+        return raw / scale if scale != 1 else raw
+
+    def write_command(self, command: str, value, lock) -> bool:
         """
         Write a command to the inverter using Modbus.
         :param command: The command name to write (must be in write_map)
-        :param value: The value to write to the command's register
+        :param value: The new value in engineering units (scaled and range checked here)
         :param lock: A threading.Lock object to ensure thread-safe access
         :return: True if successful, False otherwise
         """
-        if self.model == "MOD-XH" and command not in REG_HOLDING_MOD_TL3_XH_WRITE_MAP:
-            logging.error(f"Unbekannter Befehl für Inverter {self.name}: {command}")
+        if command not in self.write_map:
+            logging.error(f"Unknown command for inverter {self.name} ({self.model}): {command}")
+            return False
+        try:
+            raw = self.to_raw(command, value)
+        except ValueError as e:
+            logging.error(f"{self.name}: CMD rejected, {e}")
             return False
-        register = REG_HOLDING_MOD_TL3_XH_WRITE_MAP[command]
+        register = self.write_map[command][_W_REG]
         try:
             with lock:
                 # Modbus Function Code 06 (Write Single Register)
-                response = self.client.write_register(address=register, value=value, slave=self.unit)
+                response = self.client.write_register(address=register, value=raw, slave=self.unit)
             if isinstance(response, (ModbusException, ExceptionResponse)):
                 logging.error(f"Modbus Write Error of CMD {command} (Reg {register}): {response}")
                 return False
-            logging.info(f"{self.name}: CMD '{command}' executed. Register {register} = {value}")
+            logging.info(f"{self.name}: CMD '{command}' executed. Register {register} = {raw}")
             return True
         except Exception as e:
             logging.error(f"Write exception {command}: {e}")
             return False
 
+    def write_targets(self, command: str):
+        """
+        Registers changed by a command or register group.
+        :param command: Command or group name
+        :return: tuple (start register, field names in register order) or None if not writable
+        """
+        if command in self.write_groups:
+            return self.write_groups[command]
+        if command in self.write_map:
+            return self.write_map[command][_W_REG], (command,)
+        return None
+
+    def read_back(self, command: str, lock):
+        """
+        Reads just the registers of a command or register group (e.g. to verify a write).
+        :param command: Command or group name
+        :param lock: A threading.Lock object to ensure thread-safe access
+        :return: dict field -> setting value, or None on error
+        """
+        targets = self.write_targets(command)
+        if targets is None:
+            return None
+        start, fields = targets
+        try:
+            with lock:
+                rr = self.client.read_holding_registers(address=start, count=len(fields), slave=self.unit)
+            if isinstance(rr, (ModbusException, ExceptionResponse)):
+                logging.error(f"Modbus Read Error of {command} (Reg {start}): {rr}")
+                return None
+            return {field: self.to_setting(field, raw) for field, raw in zip(fields, rr.registers)}
+        except Exception as e:
+            logging.error(f"Read-back exception {command}: {e}")
+            return None
+
+    def write_group(self, group: str, values: dict, lock) -> bool:
+        """
+        Writes a group of adjacent holding registers in one transaction.
+        Fields missing in values keep their current value, which is read in the same locked section.
+        :param group: Group name (see the *_WRITE_GROUPS of the holding maps)
+        :param values: dict field name -> value in engineering units
+        :param lock: A threading.Lock object to ensure thread-safe access
+        :return: True if successful, False otherwise
+        """
+        if group not in self.write_groups:
+            logging.error(f"Unknown register group for inverter {self.name}: {group}")
+            return False
+        start, fields = self.write_groups[group]
+        unknown = set(values).difference(fields)
+        if unknown:
+            logging.error(f"Group {group} has no field(s) {', '.join(sorted(unknown))}")
+            return False
+        try:
+            raw_values = {field: self.to_raw(field, value) for field, value in values.items()}
+        except (KeyError, ValueError) as e:
+            logging.error(f"{self.name}: Group {group} rejected, {e}")
+            return False
+        try:
+            with lock:
+                if len(values) < len(fields):
+                    # Function Code 03: current values of the fields that are not changed
+                    rr = self.client.read_holding_registers(address=start, count=len(fields), slave=self.unit)
+                    if isinstance(rr, (ModbusException, ExceptionResponse)):
+                        logging.error(f"Modbus Read Error of group {group} (Reg {start}): {rr}")
+                        return False
+                    registers = list(rr.registers)
+                else:
+                    registers = [0] * len(fields)
+                for i, field in enumerate(fields):
+                    if field in raw_values:
+                        registers[i] = raw_values[field]
+                # Function Code 16 (Write Multiple Registers)
+                response = self.client.write_registers(address=start, values=registers, slave=self.unit)
+            if isinstance(response, (ModbusException, ExceptionResponse)):
+                logging.error(f"Modbus Write Error of group {group} (Reg {start}-{start + len(fields) - 1}): {response}")
+                return False
+            logging.info(f"{self.name}: Group '{group}' written. Registers {start}-{start + len(fields) - 1} = {registers}")
+            return True
+        except Exception as e:
+            logging.error(f"Write exception {group}: {e}")
+            return False
+
     def write_register(self, register, value):
         """
         Write a single holding register.
@@ -10,19 +10,26 @@ import json
 import logging
 import sys
 import argparse
+import signal
 import threading
 from configparser import RawConfigParser
 from typing import List, Dict, Any
 
-import paho.mqtt.client as mqtt
-from paho.mqtt.properties import Properties
-from paho.mqtt.packettypes import PacketTypes
 from pymodbus.client import ModbusSerialClient
 
 # Import our new Inverter class
 from .growatt import Growatt
 # Import Discovery Manager for Home Assistant Auto-Discovery
 from .discovery import HADiscoveryManager
+from .commands import CommandQueue
+from .plausibility import PlausibilityFilter
+from .pruning import FieldPruner
+from .sinks import Sample, build_sinks
+from .mqtt_sink import MqttSink, broker_sections
+from .prometheus import PrometheusExporter
+from .publisher import Publisher
+from .sparkplug import SparkplugSink
+from .templates import load_templates
 
 # --- Constants ---
 DEFAULT_CONFIG_PATH = 'growatt2mqtt.cfg'
@@ -39,8 +46,15 @@ class GrowattService:
         # Internals
         self.client_modbus = None
         self.client_mqtt = None
-        self.mqtt_props = None
+        self.mqtt = None
+        self.mqtt_sinks = []
+        self.templates = {}
+        self.sinks = []
+        self.publisher = None
+        self.commands = None
+        self.cycle_duration = 0.0
         self.inverters: List[Dict[str, Any]] = []
+        self.inverters_by_name: Dict[str, Dict[str, Any]] = {}
         # threading lock for Modbus access
         self.modbus_lock = threading.Lock()
         # Logger Setup
@@ -66,6 +80,10 @@ class GrowattService:
         if self.settings.has_section('time') and self.settings.has_option('time', 'settings_interval'):
             self.settings_interval = self.settings.getint('time', 'settings_interval')
         self.log.setLevel(logging.getLevelName(log_level_str))
+        # Optional plausibility filter for decoded samples
+        self.plausibility = PlausibilityFilter.from_config(self.settings)
+        # Optional learning of fields that never carry data on this installation
+        self.pruner = FieldPruner.from_config(self.settings)
         self.log.info(f"Configuration loaded from {self.config_path}")
 
     def _setup_modbus(self):
@@ -88,52 +106,147 @@ class GrowattService:
             self.log.info("Modbus connection established.")
 
     def _setup_mqtt(self):
-        """Initializes the MQTT connection."""
-        host = self.settings.get('mqtt', 'host', fallback='localhost')
-        port = self.settings.getint('mqtt', 'port', fallback=1883)
-        self.mqtt_topic = self.settings.get('mqtt', 'topic', fallback='inverter/growatt')
-        self.mqtt_error_topic = self.settings.get('mqtt', 'error_topic', fallback='inverter/growatt/error')
-        self.log.info(f"Connecting to MQTT Broker at {host}:{port}...")
-        self.client_mqtt = mqtt.Client()
-        self.client_mqtt.on_connect = self._on_mqtt_connect
-        self.client_mqtt.on_disconnect = self._on_mqtt_disconnect
+        """Initializes the MQTT connections ([mqtt] and every [mqtt.<name>] broker)."""
+        try:
+            # Payload templates are compiled once here and shared by all outputs
+            self.templates = load_templates(self.settings)
+            self.mqtt_sinks = [MqttSink(self.settings, section, self.templates)
+                               for section in broker_sections(self.settings)]
+        except (ValueError, RuntimeError) as e:
+            self.log.fatal(f"Invalid MQTT configuration: {e}")
+            sys.exit(1)
+        # The primary broker also carries discovery and the control topics
+        self.mqtt = self.mqtt_sinks[0]
+        self.client_mqtt = self.mqtt.client
+        self.mqtt_topic = self.mqtt.topic
         self.client_mqtt.on_message = self.on_message
-        # Set Last Will and Testament (LWT) for availability
-        availability_topic = f"{self.mqtt_topic}/availability"
-        # If the script crashes, the broker will publish 'offline' here
-        self.client_mqtt.will_set(availability_topic, payload="offline", qos=0, retain=True)
-        self.discovery = HADiscoveryManager(self.client_mqtt, self.mqtt_topic)
+        self.mqtt.on_connected.append(self._subscribe)
+        self.discovery = HADiscoveryManager(self.client_mqtt, self.mqtt_topic,
+                                            partial_updates=self.mqtt.reporter is not None,
+                                            field_topics=self.mqtt.output != 'json',
+                                            cache_path=self.settings.get('mqtt', 'discovery_cache',
+                                                                         fallback='growatt2mqtt_discovery.json') or None,
+                                            rate=self.settings.getfloat('mqtt', 'discovery_rate', fallback=10),
+                                            burst=self.settings.getint('mqtt', 'discovery_burst', fallback=20),
+                                            device_mode=self.settings.get('mqtt', 'discovery_mode',
+                                                                          fallback='entity').lower() == 'device')
+        if self.pruner:
+            # Fields pruned in an earlier run stay hidden
+            for name in self.pruner.units:
+                self.discovery.set_absent(name, self.pruner.absent(name))
+        for sink in self.mqtt_sinks:
+            # Retained availability is lost with a broker restart or an early publish
+            # before the CONNACK, so it is sent again on every connect
+            sink.on_connected.append(self._republish_availability)
+            sink.connect()
+
+    def _setup_sinks(self):
+        """Creates the output sinks; the MQTT brokers always come first."""
         try:
-            self.client_mqtt.connect(host, port, 60)
-            topic_control = f"{self.mqtt_topic}/control/#" 
-            self.client_mqtt.subscribe(topic_control)
-            self.log.info(f"subscribe control topics: {topic_control}")
-            self.client_mqtt.loop_start()  
-            # MQTT v5 Properties (optional, if supported by broker)
-            self.mqtt_props = Properties(PacketTypes.PUBLISH)
-            self.mqtt_props.MessageExpiryInterval = 30
-        except Exception as e:
-            self.log.fatal(f"Failed to connect to MQTT Broker: {e}")
+            self.sinks = self.mqtt_sinks + build_sinks(self.settings, self.templates)
+        except (ValueError, RuntimeError) as e:
+            self.log.fatal(f"Invalid sink configuration: {e}")
             sys.exit(1)
-
-    def _on_mqtt_connect(self, client, userdata, flags, rc):
-        if rc == 0:
-            self.log.info("MQTT connected successfully.")
-            # --- Subscribe to Home Assistant status ---
-            self.client_mqtt.subscribe("homeassistant/status")
-            # --- Publish 'online' status to availability topic ---
-            availability_topic = f"{self.mqtt_topic}/availability"
-            self.client_mqtt.publish(availability_topic, payload="online", qos=0, retain=True)
-        else:
-            self.log.error(f"MQTT connection failed with code {rc}")
-
-    def _on_mqtt_disconnect(self, client, userdata, rc):
-        self.log.warning(f"MQTT disconnected (rc={rc})")
+        # Optional Sparkplug B edge node (one device per inverter)
+        sparkplug = SparkplugSink.from_config(self.settings, type_lookup=self._field_types)
+        if sparkplug:
+            sparkplug.connect()
+            self.sinks.append(sparkplug)
+        # Optional /metrics endpoint, fed like any other sink
+        exporter = PrometheusExporter.from_config(self.settings)
+        if exporter:
+            exporter.collectors.append(self._health_metrics)
+            try:
+                exporter.start()
+            except OSError as e:
+                self.log.fatal(f"Failed to start Prometheus exporter: {e}")
+                sys.exit(1)
+            self.sinks.append(exporter)
+
+    def _field_types(self, name: str) -> dict:
+        """Register map types of an inverter's fields (for Sparkplug B datatypes)."""
+        item = self.inverters_by_name.get(name)
+        return item['obj'].field_types() if item else {}
+
+    def _health_metrics(self):
+        """
+        Bridge health metrics for the Prometheus exporter.
+        Runs on the HTTP thread: only reads plain attributes, never takes modbus_lock.
+        """
+        for sink in self.mqtt_sinks:
+            yield ("growatt2mqtt_mqtt_connected", "gauge", "1 if connected to the MQTT broker",
+                   {"broker": sink.section}, sink.client.is_connected())
+        yield ("growatt2mqtt_cycle_duration_seconds", "gauge", "Duration of the last polling cycle", None,
+               self.cycle_duration)
+        for item in list(self.inverters):
+            labels = {"inverter": item['obj'].name}
+            yield ("growatt2mqtt_inverter_online", "gauge", "1 if the inverter delivered data", labels,
+                   bool(item['online']))
+            yield ("growatt2mqtt_inverter_errors_total", "counter", "Failed polling cycles", labels,
+                   item['errors'])
+            yield ("growatt2mqtt_modbus_read_seconds", "gauge", "Time the bus was locked for the last read",
+                   labels, item['read_duration'])
+        if self.publisher:
+            yield ("growatt2mqtt_publish_latency_seconds", "gauge", "Time from read to hand-off to the sinks (last sample)",
+                   None, self.publisher.latency)
+            yield ("growatt2mqtt_publish_latency_max_seconds", "gauge", "Max. time from read to hand-off to the sinks",
+                   None, self.publisher.max_latency)
+            yield ("growatt2mqtt_publisher_queue_depth", "gauge", "Jobs waiting for the publisher thread",
+                   None, self.publisher.depth)
+            yield ("growatt2mqtt_publisher_dropped_total", "counter", "Jobs dropped on a full publisher queue",
+                   None, self.publisher.dropped)
+        if self.commands:
+            yield ("growatt2mqtt_commands_pending", "gauge", "Control commands waiting to be written", None,
+                   self.commands.depth)
+            yield ("growatt2mqtt_commands_coalesced_total", "counter", "Control commands replaced by a newer value",
+                   None, self.commands.coalesced)
+            yield ("growatt2mqtt_commands_failed_total", "counter", "Control commands that could not be written",
+                   None, self.commands.failed)
+        if self.discovery:
+            yield ("growatt2mqtt_discovery_pending", "gauge", "Discovery configs waiting to be published", None,
+                   self.discovery.pending)
+        if self.plausibility:
+            yield ("growatt2mqtt_plausibility_rejections_total", "counter", "Rejected implausible values", None,
+                   self.plausibility.total_rejections)
+        for sink in self.mqtt_sinks:
+            if sink.spool:
+                yield ("growatt2mqtt_spool_pending", "gauge", "Messages waiting in the spool",
+                       {"broker": sink.section}, sink.spool.pending)
+        for sink in self.sinks:
+            if not hasattr(sink, 'queue_stats'):
+                continue
+            labels = {"sink": sink.name}
+            stats = sink.queue_stats()
+            yield ("growatt2mqtt_sink_queue_depth", "gauge", "Samples waiting in the sink queue", labels,
+                   stats['depth'])
+            yield ("growatt2mqtt_sink_queue_capacity", "gauge", "Max. samples in the sink queue", labels,
+                   stats['capacity'])
+            yield ("growatt2mqtt_sink_queue_oldest_age_seconds", "gauge", "Age of the oldest queued sample",
+                   labels, stats['oldest_age'])
+            yield ("growatt2mqtt_sink_dropped_total", "counter", "Samples dropped on queue overflow", labels,
+                   stats['dropped'])
+            yield ("growatt2mqtt_sink_coalesced_total", "counter", "Queued samples replaced by newer ones",
+                   labels, stats['coalesced'])
+            yield ("growatt2mqtt_sink_failures_total", "counter", "Failed sink writes", labels,
+                   sink.failures)
+        for sink in self.mqtt_sinks:
+            yield ("growatt2mqtt_mqtt_unpublished", "gauge", "Messages handed to paho but not yet sent/acknowledged",
+                   {"broker": sink.section}, sink.unpublished)
+
+    def _subscribe(self, sink: MqttSink):
+        """Subscribes to Home Assistant status and control topics after (re)connecting."""
+        # --- Subscribe to Home Assistant status ---
+        sink.client.subscribe("homeassistant/status")
+        # --- Subscribe to control topics (per inverter and legacy shared topic) ---
+        for topic_control in (f"{sink.topic}/+/control/#", f"{sink.topic}/control/#"):
+            sink.client.subscribe(topic_control)
+            self.log.info(f"subscribe control topics: {topic_control}")
 
     def on_message(self, client, userdata, msg):
         """
         Callback for incoming MQTT messages to control the inverter.
-        Expected topic format: <base_topic>/control/<COMMAND>
+        Expected topic format: <base_topic>/<inverter>/control/<COMMAND>
+        (legacy <base_topic>/control/<COMMAND> addresses the first inverter)
         :param client: MQTT client
         :param userdata: User data
         :param msg: MQTT message
@@ -144,30 +257,112 @@ class GrowattService:
             return
         try:
             # 1. Parse incoming message
-            # e.g. inverter/growatt/control/BatDischargePowerLimit -> BatDischargePowerLimit Payload -> value 50
-            command = msg.topic.split("/")[-1]
+            # e.g. inverter/growatt/main/control/BatDischargePowerLimit -> BatDischargePowerLimit Payload -> value 50
+            parts = msg.topic[len(self.mqtt_topic) + 1:].split("/")
+            command = parts[-1]
+            if len(parts) == 3 and parts[1] == "control":
+                item = self.inverters_by_name.get(parts[0])
+            elif len(parts) == 2 and parts[0] == "control" and self.inverters:
+                item = self.inverters[0]
+            else:
+                item = None
+            if item is None:
+                self.log.warning(f"No inverter found for control topic {msg.topic}")
+                return
+            inv_obj: Growatt = item['obj']
+            if command not in inv_obj.write_map and command not in inv_obj.write_groups:
+                self.log.warning(f"CM {command} is not writable on {inv_obj.name} ({inv_obj.model})")
+                return
             payload_str = msg.payload.decode()
             try:
-                value = int(float(payload_str))
-            except ValueError:
+                # Values in engineering units (as in <topic>/settings); the write map scales them
+                if command in inv_obj.write_groups:
+                    # Register group: JSON object of field -> value, written in one transaction
+                    value = {field: float(v) for field, v in json.loads(payload_str).items()}
+                else:
+                    value = float(payload_str)
+            except (ValueError, TypeError, AttributeError):
                 self.log.error(f"Illegal payload for {command}: {payload_str}")
                 return
 
             self.log.info(f"MQTT received: {command} -> {value}")
 
-            # 2. Send command to inverter
-            if self.inverters:
-                inv_obj = self.inverters[0]['inverter']
-                success = inv_obj.write_command(command, value, self.modbus_lock)
-                if not success:
-                    self.log.warning(f"CM {command} could not be executed.")
+            # 2. Queue the command; the bus write happens on the command worker
+            if self.commands is None:
+                self.log.warning(f"CM {command} ignored, service is not running yet.")
+                return
+            self.commands.put(inv_obj.name, command, value)
 
         except Exception as e:
             self.log.error(f"Critical error in on_message: {e}")
 
+    def _execute_command(self, name: str, command: str, value) -> bool:
+        """Command worker: writes a (coalesced) command to the inverter."""
+        item = self.inverters_by_name.get(name)
+        if item is None:
+            return False
+        inv: Growatt = item['obj']
+        if isinstance(value, dict):
+            success = inv.write_group(command, value, self.modbus_lock)
+            written = value
+        else:
+            success = inv.write_command(command, value, self.modbus_lock)
+            written = {command: value}
+        if not success:
+            self.log.warning(f"CM {command} could not be executed.")
+            return False
+        # Write-through: publish the new value now instead of after the next settings sweep
+        written = {field: inv.to_setting(field, inv.to_raw(field, value)) for field, value in written.items()}
+        self.publisher.submit(self._update_settings, item, written)
+        # Confirm with a read of just the written registers
+        if self.readback_delay >= 0:
+            timer = threading.Timer(self.readback_delay, self._read_back, (item, command, written))
+            timer.daemon = True
+            timer.start()
+        return True
+
+    def _read_back(self, item: Dict[str, Any], command: str, written: dict):
+        """Timer thread: reads the registers of a written command back and publishes the actual values."""
+        inv: Growatt = item['obj']
+        values = inv.read_back(command, self.modbus_lock)
+        if values is None:
+            self.log.warning(f"CM {command}: read-back failed, settings are confirmed with the next sweep.")
+            return
+        mismatch = {field: values.get(field) for field, value in written.items() if values.get(field) != value}
+        if mismatch:
+            self.log.warning(f"CM {command}: inverter reports {mismatch} instead of the written value.")
+        self.publisher.submit(self._update_settings, item, values)
+
+    def _update_settings(self, item: Dict[str, Any], values: dict):
+        """Publisher thread: merges written or read-back values into the settings cache and publishes it."""
+        if not item['settings_full']:
+            # The retained <topic>/settings document would shrink to the written fields;
+            # the first complete sweep publishes them
+            self.log.debug(f"{item['obj'].name}: No complete settings sweep yet, not publishing {', '.join(values)}")
+            return
+        cache = item['settings']
+        if all(cache.get(field) == value for field, value in values.items()):
+            # e.g. a read-back that confirms the written value
+            return
+        cache.update(values)
+        self._publish_settings(item)
+
+    def _publish_settings(self, item: Dict[str, Any]):
+        """Publishes the cached settings of an inverter to all brokers."""
+        name = item['obj'].name
+        for sink in self.mqtt_sinks:
+            sink.publish_json(f"{sink.inverter_topic(name)}/settings", item['settings'],
+                              retain=True, topic_class='settings')
+        self.log.debug(f"Published settings for {name}")
+
     def _init_inverters(self):
         """Creates instances of the Growatt class based on config."""
         self.inverters = []
+        self.inverters_by_name = {}
+        # Grid code, grid protection limits, Modbus address and battery type stay read-only unless explicitly allowed
+        allow_protected = self.settings.getboolean('control', 'allow_protected', fallback=False)
+        if allow_protected:
+            self.log.warning("Writing protected settings (grid code, protection limits, Modbus address, battery type) is enabled")
         for section in self.settings.sections():
             if not section.startswith('inverters.'):
                 continue
@@ -180,108 +375,212 @@ class GrowattService:
             self.log.info(f"Initializing Inverter '{name}' (Unit: {unit}, Model: {model})")
             
             # Using the new signature from growatt.py
-            inverter_obj = Growatt(self.client_modbus, name, unit, model)
+            inverter_obj = Growatt(self.client_modbus, name, unit, model, allow_protected=allow_protected)
             
-            self.inverters.append({
+            item = {
                 'obj': inverter_obj,
                 'measurement': measurement,
+                'topic': self.mqtt.inverter_topic(name),
+                'online': None,
                 'error_sleep': 0,
+                'errors': 0,
+                'read_duration': 0.0,
+                # Last published holding register values (settings sweep + confirmed writes)
+                'settings': {},
+                # True once a complete settings sweep filled 'settings'
+                'settings_full': False,
                 'cycles_since_settings': 999  # Force immediate read on start
-            })
+            }
+            self.inverters.append(item)
+            self.inverters_by_name[name] = item
+
+    def _set_inverter_availability(self, item: Dict[str, Any], online: bool):
+        """Publishes the retained per-inverter availability if it changed."""
+        if item['online'] == online:
+            return
+        item['online'] = online
+        for sink in self.mqtt_sinks:
+            self._publish_availability(sink, item)
+
+    @staticmethod
+    def _publish_availability(sink: MqttSink, item: Dict[str, Any]):
+        sink.client.publish(f"{sink.inverter_topic(item['obj'].name)}/availability",
+                            payload="online" if item['online'] else "offline", qos=0, retain=True)
+
+    def _republish_availability(self, sink: MqttSink):
+        """Publishes the known availability of every inverter after a (re)connect (paho's thread)."""
+        for item in list(self.inverters):
+            if item['online'] is not None:
+                self._publish_availability(sink, item)
 
     def run(self):
         """Main loop of the service."""
+        # Everything after the bus I/O runs on the publisher thread
+        self.publisher = Publisher(maxsize=self.settings.getint('general', 'publisher_queue_size', fallback=100))
+        # Control commands from MQTT are written by their own worker, never on paho's thread
+        self.commands = CommandQueue(self._execute_command,
+                                     settle=self.settings.getfloat('control', 'settle', fallback=0.5))
+        # Seconds until a written register is read back; < 0 disables the read-back
+        self.readback_delay = self.settings.getfloat('control', 'readback_delay', fallback=1.0)
         self._setup_modbus()
         self._setup_mqtt()
+        self._setup_sinks()
         self._init_inverters()
 
-        interval = self.settings.getint('time', 'interval', fallback=10)
+        # Float to allow sub-second polling (e.g. 0.5)
+        interval = self.settings.getfloat('time', 'interval', fallback=10)
         offline_interval = self.settings.getint('time', 'offline_interval', fallback=60)
         error_interval = self.settings.getint('time', 'error_interval', fallback=60)
-        discovery = self.settings.getboolean('mqtt', 'discovery', fallback=True)
 
         self.log.info("Starting main loop...")
         while True:
             any_inverter_online = False
             start_time = time.time()
-            with self.modbus_lock:
-                for item in self.inverters:
-                    inv: Growatt = item['obj']
-                    
-                    # Check error backoff
-                    if item['error_sleep'] > 0:
-                        item['error_sleep'] -= interval
-                        continue
-
-                    try:
+            for item in self.inverters:
+                inv: Growatt = item['obj']
+
+                # Check error backoff
+                if item['error_sleep'] > 0:
+                    item['error_sleep'] -= interval
+                    continue
+
+                settings = None
+                read_start = time.monotonic()
+                try:
+                    # The bus is only locked for Modbus I/O
+                    with self.modbus_lock:
                         # 1. Read Live Data
                         data = inv.update()
                         item['cycles_since_settings'] += 1
-                        
-                        if not data:
-                            # No data (Inverter offline or Com error)
-                            continue
-                        
-                        any_inverter_online = True
-                        # Trigger Discovery for Live Data
-                        if discovery:
-                            self.discovery.publish_discovery(inv.name, inv.model, data.keys(), is_settings=False)
-                        
-                        # 2. Read Settings / Holding Registers (Interval based)
-                        if item['cycles_since_settings'] >= self.settings_interval:  #every 2h
-                            settings = inv.read_settings()  # The new method from growatt.py
-                            if settings:
-                                self._publish(f"{self.mqtt_topic}/settings", settings, retain=True)
-                                self.log.debug(f"Published settings for {inv.name}")
-                                if discovery:
-                                    self.discovery.publish_discovery(inv.name, inv.model, settings.keys(), is_settings=True)
-                                    self.log.debug(f"Published discovery for {inv.name}")
-                            item['cycles_since_settings'] = 0
-
-                        # 3. Prepare and Send Data
-                        payload = {
-                            'time': int(time.time()),
-                            'measurement': item['measurement'],
-                            'fields': data
-                        }
-                        
-                        self.log.info(f"Data received from {inv.name}: {len(data)} registers")
-                        self.log.debug(f"Payload: {data}")
-                        
-                        self._publish(self.mqtt_topic, payload)
-
-                    except Exception as e:
-                        self.log.error(f"Error processing inverter {inv.name}: {e}")
-                        # Send Error Payload
-                        error_payload = {
-                            "name": inv.name,
-                            "error": str(e)
-                        }
-                        self._publish(self.mqtt_error_topic, error_payload)
-                        item['error_sleep'] = error_interval
+                        if data:
+                            if self.plausibility:
+                                self._check_plausibility(inv, data)
+                            # 2. Read Settings / Holding Registers (Interval based)
+                            if item['cycles_since_settings'] >= self.settings_interval:
+                                settings = inv.read_settings()
+                                item['cycles_since_settings'] = 0
+                except Exception as e:
+                    self.log.error(f"Error processing inverter {inv.name}: {e}")
+                    item['errors'] += 1
+                    item['error_sleep'] = error_interval
+                    self.publisher.submit(self._publish_error, item, str(e))
+                    continue
+                finally:
+                    item['read_duration'] = time.monotonic() - read_start
+
+                if not data:
+                    # No data (Inverter offline or Com error)
+                    continue
+
+                any_inverter_online = True
+                self.log.info(f"Data received from {inv.name}: {len(data)} registers")
+                # 3. Hand the sample over; the bus is already free again
+                sample = Sample(inv.name, inv.model, item['measurement'], time.time(), data)
+                self.publisher.submit(self._publish_sample, item, sample, settings)
+
+            # Time based work of the sinks (due batches, spool replay, ...)
+            for sink in self.sinks:
+                try:
+                    sink.tick()
+                except Exception as e:
+                    self.log.error(f"Sink '{sink.name}' failed: {e}")
 
             # Sleep Logic
             sleep_time = interval if any_inverter_online else offline_interval
             
             # Calculate actual sleep time (subtracting processing time)
             elapsed = time.time() - start_time
+            self.cycle_duration = elapsed
             actual_sleep = max(0.1, sleep_time - elapsed)
             
             time.sleep(actual_sleep)
 
-    def _publish(self, topic: str, payload: dict, retain: bool = False):
-        """Helper method to safely publish JSON."""
-        try:
-            json_str = json.dumps(payload, default=str)
-            self.client_mqtt.publish(
-                topic, 
-                json_str, 
-                qos=0, 
-                retain=retain, 
-                properties=self.mqtt_props
-            )
-        except Exception as e:
-            self.log.error(f"Failed to publish MQTT message: {e}")
+    def _publish_sample(self, item: Dict[str, Any], sample: Sample, settings: dict):
+        """Publisher thread: availability, discovery, settings and the sample itself."""
+        inv: Growatt = item['obj']
+        self._set_inverter_availability(item, True)
+        keys = list(sample.fields)
+        # Pruning only thins out the MQTT/HA output; the other sinks keep every field
+        mqtt_sample = sample
+        if self.pruner:
+            fields, changed = self.pruner.process(inv.name, sample.fields, sample.time)
+            if fields is not sample.fields:
+                mqtt_sample = Sample(sample.inverter, sample.model, sample.measurement, sample.time, fields)
+            if changed and self.mqtt.discovery:
+                self.discovery.set_absent(inv.name, self.pruner.absent(inv.name))
+        # Trigger Discovery for Live Data (absent fields keep a hidden entity)
+        if self.mqtt.discovery:
+            self.discovery.publish_discovery(inv.name, inv.model, keys, is_settings=False)
+        if settings:
+            # The cache is only changed on this thread (sweeps here, writes via _update_settings)
+            item['settings'] = dict(settings)
+            # A sleeping inverter only answers with a placeholder
+            item['settings_full'] = not inv.is_sleeping
+            self._publish_settings(item)
+            if self.mqtt.discovery:
+                self.discovery.publish_discovery(inv.name, inv.model, settings.keys(), is_settings=True,
+                                                 writable=inv.write_map)
+                self.log.debug(f"Published discovery for {inv.name}")
+        if self.mqtt.discovery:
+            # Device-based discovery sends live and settings components in one message
+            self.discovery.flush_device(inv.name)
+        self._write_sinks(sample, mqtt_sample)
+
+    def _publish_error(self, item: Dict[str, Any], error: str):
+        """Publisher thread: error payload and availability of a failed inverter."""
+        error_payload = {
+            "name": item['obj'].name,
+            "error": error
+        }
+        for sink in self.mqtt_sinks:
+            sink.publish_json(sink.error_topic, error_payload, topic_class='error')
+        self._set_inverter_availability(item, False)
+
+    def _check_plausibility(self, inv: Growatt, data: dict):
+        """
+        Runs the plausibility filter on a sample (in place).
+        Optionally re-reads the affected register blocks once and checks again.
+        """
+        reread = self.plausibility.reread
+        # With re-read, the first attempt is only final once the fresh values are checked
+        rejected = self.plausibility.check(inv.name, data, final=not reread)
+        if not rejected:
+            return
+        if not reread:
+            self.log.warning(f"{inv.name}: Rejected implausible values: {', '.join(rejected)}")
+            return
+        fresh = inv.reread_fields(rejected)
+        for name in rejected:
+            if name in fresh:
+                data[name] = fresh[name]
+        rejected = self.plausibility.check(inv.name, data, fields=set(rejected))
+        if rejected:
+            self.log.warning(f"{inv.name}: Values still implausible after re-read: {', '.join(rejected)}")
+
+    def _write_sinks(self, sample: Sample, mqtt_sample: Sample = None):
+        """
+        Hands a sample to every sink; a failing sink does not affect the others.
+        :param mqtt_sample: Pruned variant of the sample for the MQTT brokers (default: sample)
+        """
+        mqtt_sample = mqtt_sample or sample
+        for sink in self.sinks:
+            try:
+                sink.write(mqtt_sample if sink in self.mqtt_sinks else sample)
+            except Exception as e:
+                self.log.error(f"Sink '{sink.name}' failed to write sample of {sample.inverter}: {e}")
+
+    def shutdown(self):
+        """Flushes and closes all sinks (MQTT last, so it can still report 'offline')."""
+        if self.commands:
+            self.commands.close()
+        if self.publisher:
+            self.publisher.close()
+        sinks = self.sinks or self.mqtt_sinks
+        for sink in reversed(sinks):
+            try:
+                sink.close()
+            except Exception as e:
+                self.log.error(f"Failed to close sink '{sink.name}': {e}")
 
 def main():
     parser = argparse.ArgumentParser(description='Growatt2MQTT Service')
@@ -297,12 +596,16 @@ def main():
     """)
 
     service = GrowattService(config_path=args.config)
+    # Treat 'docker stop' / 'systemctl stop' like Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     
     try:
         service.run()
     except KeyboardInterrupt:
         print("\nStopping service (KeyboardInterrupt)...")
         sys.exit(0)
+    finally:
+        service.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+mqtt_sink.py
+
+MQTT output sink.
+Owns the paho client and the live data pipeline: report-by-exception,
+per-field topics, payload encoding, batching, MQTT v5 session features and
+the disk spool for broker outages.
+Every broker ([mqtt] and each [mqtt.<name>] section) gets its own sink with its
+own client, outbound queue and publisher thread, so a slow or unreachable
+broker never holds up the others.
+"""
+
+import collections
+import logging
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from .sinks import BufferedSink
+from .report import ReportByException
+from .spool import Spool
+from .encoding import PayloadEncoder
+from .batch import SampleBatcher
+from .mqtt_v5 import MQTTv5Session
+from .templates import template_from_config
+
+log = logging.getLogger(__name__)
+
+
+def broker_sections(settings):
+    """
+    Config sections of all brokers: [mqtt] first, then every [mqtt.<name>].
+    :param settings: RawConfigParser instance
+    :return: List of section names
+    """
+    return ['mqtt'] + [s for s in settings.sections() if s.startswith('mqtt.')]
+
+
+def _is_published(info):
+    """
+    MQTTMessageInfo.is_published() that also works for QoS>0 messages paho accepted
+    with MQTT_ERR_NO_CONN (it raises for those, although paho resends them after the reconnect).
+    """
+    if info.rc == mqtt.MQTT_ERR_SUCCESS:
+        return info.is_published()
+    return info._published
+
+
+class MqttSink(BufferedSink):
+    """
+    Publishes samples to an MQTT broker from its own publisher thread.
+    """
+
+    def __init__(self, settings, section='mqtt', templates=None):
+        """
+        :param settings: RawConfigParser instance
+        :param section: Config section with the broker settings
+        :param templates: Compiled payload templates (see templates.load_templates)
+        """
+        self.settings = settings
+        self.section = section
+        # The [mqtt] broker is the primary one (discovery, control topics)
+        self.primary = section == 'mqtt'
+        self.host = settings.get(section, 'host', fallback='localhost')
+        self.port = settings.getint(section, 'port', fallback=1883)
+        self.topic = settings.get(section, 'topic', fallback='inverter/growatt')
+        self.error_topic = settings.get(section, 'error_topic', fallback=f"{self.topic}/error")
+        self.discovery = self.primary and settings.getboolean(section, 'discovery', fallback=True)
+        # QoS of all messages, retain flag of the live state/batch messages
+        self.qos = settings.getint(section, 'qos', fallback=0)
+        if self.qos not in (0, 1, 2):
+            raise ValueError(f"Invalid MQTT QoS in [{section}]: {self.qos}")
+        self.retain = settings.getboolean(section, 'retain', fallback=False)
+        # Output mode: 'json' (one document per cycle), 'fields' (one retained topic per field) or 'both'
+        self.output = settings.get(section, 'output', fallback='json').lower()
+        if self.output not in ('json', 'fields', 'both'):
+            raise ValueError(f"Invalid MQTT output mode: {self.output}")
+        # Last value published per field topic (only changes are sent)
+        self.field_cache = {}
+        # Optional report-by-exception (deadbands + periodic keyframes)
+        self.reporter = ReportByException.from_config(settings)
+        # Encoding of live data messages (json, cbor, msgpack; optionally schema-indexed)
+        self.encoder = PayloadEncoder.from_config(settings, section)
+        if not self.encoder.is_json and self.output == 'json' and self.discovery:
+            log.warning("Binary/indexed payloads cannot be parsed by HA discovery templates; "
+                        "use 'output = fields' or 'both' for Home Assistant.")
+        # Optional batching of several samples per message (published to <topic>/<name>/batch)
+        self.batcher = SampleBatcher.from_config(settings)
+        if self.batcher and self.output == 'json' and self.discovery:
+            log.warning("Batching replaces the live JSON document; "
+                        "use 'output = fields' or 'both' for Home Assistant.")
+        # Optional user-defined shape of the live data messages
+        self.template = template_from_config(settings, section, templates or {})
+        if self.template and (self.batcher or self.encoder.schema_indexed):
+            raise ValueError(f"[{section}] payload templates cannot be combined with batching "
+                             f"or schema_indexed payloads")
+        if self.template and self.output != 'fields' and self.discovery:
+            log.warning(f"Payload template '{self.template.name}' changes the live JSON document; "
+                        f"HA discovery needs 'output = fields' to keep working.")
+        # Optional disk spool for samples that cannot be delivered (one file per broker)
+        self.spool = Spool.from_config(settings, suffix=None if self.primary else section.split('.', 1)[1])
+        self._replay_thread = None
+        # Callables(sink) run after every successful (re)connect
+        self.on_connected = []
+
+        self.protocol = settings.get(section, 'protocol', fallback='3.1.1')
+        self.v5 = None
+        if self.protocol == '5':
+            # Topic aliases, message expiry per topic class and flow control
+            self.v5 = MQTTv5Session.from_config(settings, section)
+            self.client = mqtt.Client(protocol=mqtt.MQTTv5)
+        elif self.protocol == '3.1.1':
+            self.client = mqtt.Client()
+        else:
+            raise ValueError(f"Unsupported MQTT protocol version: {self.protocol} (use 3.1.1 or 5)")
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        # Set Last Will and Testament (LWT) for availability
+        # If the script crashes, the broker will publish 'offline' here
+        self.client.will_set(f"{self.topic}/availability", payload="offline", qos=0, retain=True)
+        # paho buffers without limit (its max_queued_messages only applies to QoS>0 messages
+        # beyond the inflight window and then fails the publish), so _wait_for_paho caps the
+        # messages it holds that are not yet written/acknowledged
+        self.max_pending = settings.getint(section, 'max_pending', fallback=100)
+        # (connection generation, MQTTMessageInfo) of messages not yet published
+        self._pending = collections.deque()
+        # Incremented on every disconnect; paho drops the unsent QoS 0 messages of older connections
+        self._generation = 0
+        super().__init__(
+            section,
+            batch_size=1,  # wake up for every sample
+            flush_interval=1.0,  # period of the time based work (due batches, spool replay)
+            buffer_size=settings.getint(section, 'queue_size', fallback=1000),
+            policy=settings.get(section, 'queue_policy', fallback='drop_oldest').lower(),
+        )
+
+    def connect(self):
+        """
+        Connects to the broker and starts paho's network thread.
+        Only the primary broker is required at startup; the others connect in the
+        background and keep retrying, so an unreachable broker cannot block startup.
+        """
+        log.info(f"Connecting to MQTT Broker [{self.section}] at {self.host}:{self.port} "
+                 f"(MQTT {self.protocol})...")
+        kwargs = {'clean_start': True, 'properties': self.v5.connect_properties()} if self.v5 else {}
+        try:
+            if self.primary:
+                self.client.connect(self.host, self.port, 60, **kwargs)
+            else:
+                self.client.connect_async(self.host, self.port, 60, **kwargs)
+            self.client.loop_start()
+        except Exception as e:
+            log.fatal(f"Failed to connect to MQTT Broker [{self.section}]: {e}")
+            sys.exit(1)
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            log.info(f"MQTT [{self.section}] connected successfully.")
+            if self.v5:
+                self.v5.on_connack(client, properties)
+            # The broker may have lost the retained field topics (restart without persistence):
+            # send a full set again, even for values that did not change
+            self.field_cache = {}
+            if self.reporter:
+                self.reporter.reset()
+            # --- Publish 'online' status to availability topic ---
+            self.client.publish(f"{self.topic}/availability", payload="online", qos=0, retain=True)
+            for callback in self.on_connected:
+                callback(self)
+            self._start_spool_replay()
+        else:
+            log.error(f"MQTT [{self.section}] connection failed with code {rc}")
+
+    def _on_disconnect(self, client, userdata, rc, properties=None):
+        self._generation += 1
+        log.warning(f"MQTT [{self.section}] disconnected (rc={rc})")
+
+    def inverter_topic(self, name):
+        """Base topic of a single inverter: <topic>/<name>"""
+        return f"{self.topic}/{name}"
+
+    # =================================================================
+    # Live data
+    # =================================================================
+
+    def _write_batch(self, samples):
+        for sample in samples:
+            self._wait_for_paho()
+            self._write_sample(sample)
+
+    def _wait_for_paho(self):
+        """
+        Backpressure: blocks the publisher thread while paho holds max_pending unpublished
+        messages, so a slow uplink fills the bounded sample queue instead of paho's buffer.
+        A message counts until paho wrote (QoS 0) or the broker acknowledged (QoS>0) it.
+        Unsent QoS 0 messages are only forgotten when a disconnect drops them; QoS>0
+        messages are resent by paho after a reconnect and keep counting. While the
+        client is disconnected, send() does not hand QoS>0 messages to paho at all.
+        """
+        pending = self._pending
+        while pending:
+            generation = self._generation
+            while pending and (_is_published(pending[0][1])
+                               or (self.qos == 0 and pending[0][0] != generation)):
+                pending.popleft()
+            if len(pending) < self.max_pending or self._closing:
+                return
+            time.sleep(0.05)
+
+    @property
+    def unpublished(self):
+        """Messages handed to paho that are not yet written (QoS 0) or acknowledged (QoS>0)."""
+        return len(self._pending)
+
+    def _write_sample(self, sample):
+        """
+        Publishes a sample according to the output mode (publisher thread).
+        """
+        fields = sample.fields
+        if self.reporter:
+            now = time.monotonic()
+            fields, is_keyframe = self.reporter.select(sample.inverter, sample.fields, now)
+            if not fields:
+                log.debug(f"No field of {sample.inverter} moved past its deadband")
+                return
+            log.debug(f"Publishing {len(fields)} fields (keyframe: {is_keyframe})")
+
+        log.debug(f"Payload: {fields}")
+        ok = True
+        if self.output != 'json':
+            ok = self._publish_fields(sample.inverter, fields)
+        if self.output != 'fields':
+            ok = self._publish_sample(sample, fields) and ok
+        if self.reporter and ok:
+            # Fields of a failed publish stay "changed" and go out with the next sample
+            self.reporter.commit(sample.inverter, fields, is_keyframe, now)
+
+    def _periodic(self):
+        # Flush batches whose oldest sample is too old
+        if self.batcher:
+            for name, batch in self.batcher.due():
+                self._publish_batch(name, batch)
+        # Deliver samples spooled because of a failed publish
+        self._start_spool_replay()
+
+    def close(self):
+        """Publishes the queued samples, flushes pending batches and disconnects from the broker."""
+        super().close()
+        if self.batcher:
+            for name, batch in self.batcher.flush_all():
+                self._publish_batch(name, batch)
+        self.client.publish(f"{self.topic}/availability", payload="offline", qos=0, retain=True)
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def _publish_fields(self, inverter_name, fields):
+        """
+        Publishes every changed field as a plain retained scalar to <topic>/<inverter>/<field>.
+        :return: True if every changed field was handed to paho
+        """
+        ok = True
+        for key, value in fields.items():
+            topic = f"{self.inverter_topic(inverter_name)}/{key}"
+            if self.field_cache.get(topic) == value:
+                continue
+            if self.send(topic, str(value), retain=True, topic_class='fields'):
+                self.field_cache[topic] = value
+            else:
+                ok = False
+        return ok
+
+    def _publish_sample(self, sample, fields):
+        """
+        Encodes and publishes a live data sample to the inverter's state topic.
+        In schema-indexed mode a changed schema is published (retained) first.
+        :return: True if the sample was handed to paho, spooled or added to a batch
+        """
+        if self.batcher:
+            # Millisecond timestamps to keep sub-second samples apart
+            batch = self.batcher.add(sample.inverter, sample.measurement, round(sample.time, 3), fields)
+            if batch:
+                return self._publish_batch(sample.inverter, batch)
+            return True
+        if self.template:
+            self.template.check(sample.model, sample.fields)
+            try:
+                encoded = self.encoder.dumps(self.template.build(sample, fields))
+            except Exception as e:
+                log.error(f"Failed to build payload of {sample.inverter} from template '{self.template.name}': {e}")
+                return False
+            return self.send(self.inverter_topic(sample.inverter), encoded, retain=self.retain, store=True,
+                             ts=int(sample.time))
+        payload = {
+            'time': int(sample.time),
+            'measurement': sample.measurement,
+            'fields': fields
+        }
+        try:
+            encoded, schema = self.encoder.encode(sample.model, payload)
+        except Exception as e:
+            log.error(f"Failed to encode payload of {sample.inverter}: {e}")
+            return False
+        if schema is not None:
+            self.send(f"{self.topic}/schema/{sample.model}", self.encoder.json.dumps(schema.as_dict()),
+                      retain=True, topic_class='schema')
+        return self.send(self.inverter_topic(sample.inverter), encoded, retain=self.retain, store=True,
+                         ts=payload['time'])
+
+    def _publish_batch(self, inverter_name, batch):
+        """Encodes and publishes a batch of samples to <topic>/<name>/batch."""
+        try:
+            encoded = self.encoder.dumps(batch)
+        except Exception as e:
+            log.error(f"Failed to encode batch of {inverter_name}: {e}")
+            return False
+        first = batch['time'][0] if 'time' in batch else batch['samples'][0]['time']
+        return self.send(f"{self.inverter_topic(inverter_name)}/batch", encoded, retain=self.retain, store=True,
+                         ts=first, topic_class='batch')
+
+    # =================================================================
+    # Spool replay
+    # =================================================================
+
+    def _start_spool_replay(self):
+        """Starts a background replay of spooled messages if needed."""
+        if not self.spool or not self.spool.pending or not self.client.is_connected():
+            return
+        if self._replay_thread and self._replay_thread.is_alive():
+            return
+        log.info(f"Replaying {self.spool.pending} spooled messages...")
+        self._replay_thread = threading.Thread(
+            target=self.spool.replay,
+            args=(self._publish_confirmed, self.client.is_connected),
+            name="SpoolReplay",
+            daemon=True
+        )
+        self._replay_thread.start()
+
+    def _publish_confirmed(self, topic, payload, retain):
+        """Publishes with QoS 1 and waits for the broker's acknowledgement."""
+        info = self.client.publish(topic, payload, qos=1, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            return False
+        info.wait_for_publish(timeout=10)
+        return info.is_published()
+
+    # =================================================================
+    # Low level publishing
+    # =================================================================
+
+    def publish_json(self, topic, payload, retain=False, topic_class='state'):
+        """Helper method to safely publish JSON."""
+        try:
+            json_str = self.encoder.json.dumps(payload)
+        except Exception as e:
+            log.error(f"Failed to serialize MQTT message: {e}")
+            return False
+        return self.send(topic, json_str, retain=retain, topic_class=topic_class)
+
+    def send(self, topic, data, retain=False, store=False, ts=None, topic_class='state'):
+        """
+        Publishes an already encoded payload.
+        :param store: If True and the spool is enabled, undeliverable messages are spooled to disk
+        :param ts: Sample time stored with spooled messages
+        :param topic_class: Selects message expiry and topic alias use in MQTT v5 mode
+        :return: True if the message was handed to paho (or spooled). A message is only
+                 spooled if paho did not keep a copy of its own.
+        """
+        try:
+            store = store and self.spool is not None
+            connected = self.client.is_connected()
+            # Keep the original order: while messages are spooled, new ones queue up behind them
+            if store and (self.spool.pending or not connected):
+                self.spool.append(topic, data, retain, ts=ts)
+                return True
+            if self.qos > 0 and not connected:
+                # paho would keep a QoS>0 message until the reconnect, without any limit
+                return False
+            send_topic, properties = topic, None
+            if self.v5:
+                send_topic, properties = self.v5.publish_args(topic, topic_class, qos=self.qos)
+            info = self.client.publish(
+                send_topic,
+                data,
+                qos=self.qos,
+                retain=retain,
+                properties=properties
+            )
+            if self.v5:
+                self.v5.confirm_alias(topic, send_topic, info.rc == mqtt.MQTT_ERR_SUCCESS)
+            if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                if not info.is_published():
+                    self._pending.append((self._generation, info))
+                return True
+            if self.qos > 0 and info.rc == mqtt.MQTT_ERR_NO_CONN:
+                # Connection lost since the check above: paho still keeps the message
+                # and resends it after the reconnect, so it counts against max_pending.
+                # Spooling it as well would deliver it twice.
+                self._pending.append((self._generation, info))
+                return True
+            if store:
+                self.spool.append(topic, data, retain, ts=ts)
+                return True
+            return False
+        except Exception as e:
+            log.error(f"Failed to publish MQTT message: {e}")
+            return False
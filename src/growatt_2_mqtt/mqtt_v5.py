@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+mqtt_v5.py
+
+MQTT v5 session features for the publisher:
+- Topic aliases for high-frequency topics (the topic string is sent only once per connection)
+- Message expiry per topic class (state, fields, settings, ...)
+- Receive maximum / flow control negotiated with the broker
+"""
+
+import logging
+import threading
+
+from paho.mqtt.properties import Properties
+from paho.mqtt.packettypes import PacketTypes
+
+log = logging.getLogger(__name__)
+
+# Topic classes that get topic aliases (few topics, one message per cycle each)
+ALIAS_CLASSES = ("state", "batch")
+
+# Default message expiry in seconds per topic class (0 = never expires)
+DEFAULT_EXPIRY = {
+    "state": 30,
+    "batch": 300,
+    "fields": 0,
+    "settings": 0,
+    "error": 300,
+}
+
+
+class MQTTv5Session:
+    """
+    Per-connection MQTT v5 state (topic aliases, flow control) and publish properties.
+    """
+
+    def __init__(self, expiry=None, receive_maximum=20, topic_aliases=True):
+        """
+        :param expiry: dict topic class -> message expiry in seconds (0 = none)
+        :param receive_maximum: Max. number of unacknowledged QoS>0 messages we accept from the broker
+        :param topic_aliases: Use topic aliases for state and batch topics
+        """
+        self.expiry = dict(DEFAULT_EXPIRY)
+        self.expiry.update(expiry or {})
+        self.receive_maximum = receive_maximum
+        self.topic_aliases = topic_aliases
+        self.lock = threading.Lock()
+        # Prebuilt properties per topic class (expiry only, no alias)
+        self._class_props = {cls: self._build_props(cls) for cls in self.expiry}
+        self._alias_max = 0
+        self._aliases = {}
+
+    @classmethod
+    def from_config(cls, settings, section='mqtt'):
+        """
+        Builds the session from a [mqtt] section (message_expiry_<class>, receive_maximum, topic_aliases).
+        :param settings: RawConfigParser instance
+        :param section: Config section to read
+        """
+        expiry = {}
+        for topic_class in DEFAULT_EXPIRY:
+            option = f"message_expiry_{topic_class}"
+            if settings.has_option(section, option):
+                expiry[topic_class] = settings.getint(section, option)
+        return cls(
+            expiry=expiry,
+            receive_maximum=settings.getint(section, 'receive_maximum', fallback=20),
+            topic_aliases=settings.getboolean(section, 'topic_aliases', fallback=True),
+        )
+
+    def _build_props(self, topic_class, alias=None):
+        """Creates the PUBLISH properties for a topic class (and optional alias)."""
+        props = Properties(PacketTypes.PUBLISH)
+        if self.expiry.get(topic_class):
+            props.MessageExpiryInterval = self.expiry[topic_class]
+        if alias is not None:
+            props.TopicAlias = alias
+        return props
+
+    def connect_properties(self):
+        """Properties sent with CONNECT."""
+        props = Properties(PacketTypes.CONNECT)
+        props.ReceiveMaximum = self.receive_maximum
+        return props
+
+    def on_connack(self, client, properties):
+        """
+        Applies the limits announced by the broker. Topic aliases are per connection,
+        so all aliases are forgotten here.
+        :param client: paho client
+        :param properties: CONNACK properties (may be None)
+        """
+        broker_alias_max = getattr(properties, "TopicAliasMaximum", 0) if properties else 0
+        broker_receive_max = getattr(properties, "ReceiveMaximum", 65535) if properties else 65535
+        with self.lock:
+            self._alias_max = broker_alias_max if self.topic_aliases else 0
+            self._aliases.clear()
+        # Flow control: never have more QoS>0 messages in flight than the broker accepts
+        client.max_inflight_messages_set(min(broker_receive_max, 65535))
+        log.info(f"MQTT v5 session: {self._alias_max} topic aliases, receive maximum {broker_receive_max}")
+
+    def publish_args(self, topic, topic_class, qos=0):
+        """
+        Resolves topic and properties for a publish.
+        :param topic: Full topic
+        :param topic_class: 'state', 'batch', 'fields', 'settings', 'error', ...
+        :param qos: QoS of the message. Aliases are only used for QoS 0, because paho
+                    resends queued QoS>0 messages after a reconnect when the alias is gone.
+        :return: tuple (topic to send, Properties)
+        """
+        if qos != 0 or topic_class not in ALIAS_CLASSES or not self._alias_max:
+            return topic, self._class_props.get(topic_class)
+        with self.lock:
+            entry = self._aliases.get(topic)
+            if entry is None:
+                if len(self._aliases) >= self._alias_max:
+                    return topic, self._class_props.get(topic_class)
+                entry = [self._build_props(topic_class, alias=len(self._aliases) + 1), False]
+                self._aliases[topic] = entry
+            if entry[1]:
+                # Alias is known to the broker: send an empty topic
+                return "", entry[0]
+            # Topic and alias are sent together; the alias only counts as known
+            # once confirm_alias() reports that paho accepted the publish
+            return topic, entry[0]
+
+    def confirm_alias(self, topic, sent_topic, ok):
+        """
+        Records the outcome of a publish that used the arguments of publish_args().
+        :param topic: Full topic
+        :param sent_topic: Topic returned by publish_args
+        :param ok: True if paho accepted the publish (rc == MQTT_ERR_SUCCESS)
+        """
+        if not self._alias_max or not sent_topic:
+            return
+        with self.lock:
+            entry = self._aliases.get(topic)
+            if entry is not None:
+                # A failed publish never reached the broker, so the next one must carry the topic again
+                entry[1] = ok
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+plausibility.py
+
+Streaming plausibility filter for decoded inverter samples.
+Rejects values that are out of bounds, change faster than physically possible,
+or run backwards on monotonic energy counters (e.g. spikes caused by corrupt
+frames or the uint32 word swap heuristic in Growatt._parse_registers).
+
+Rules are compiled once per inverter into a flat list of checks, so checking a
+sample is a single pass over its fields without building new objects.
+"""
+
+import fnmatch
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+# Applied when the config has no [plausibility.rules] section.
+# Lifetime energy counters must never run backwards, and never grow faster
+# than 0.1 kWh per second (360 kW), so upward spikes are caught as well.
+DEFAULT_RULES = {
+    "e*_total": "monotonic, rate=0.1",
+}
+
+# Indices into a compiled check entry (a flat list per field)
+_NAME, _LO, _HI, _RATE, _MONO = range(5)
+
+_NO_REJECTS = ()
+
+
+def parse_rule(text):
+    """
+    Parses a rule string like 'min=0, max=30000, rate=5000, monotonic'.
+    :param text: Rule definition from the config file
+    :return: tuple (min, max, max_rate_per_second, monotonic)
+    """
+    lo = hi = rate = None
+    monotonic = False
+    for token in text.replace(",", " ").split():
+        key, _, value = token.partition("=")
+        key = key.strip().lower()
+        if key == "monotonic":
+            monotonic = True
+        elif key == "min":
+            lo = float(value)
+        elif key == "max":
+            hi = float(value)
+        elif key == "rate":
+            rate = float(value)
+        else:
+            raise ValueError(f"Unknown plausibility option '{key}' in rule '{text}'")
+    return lo, hi, rate, monotonic
+
+
+class _InverterState:
+    """Compiled checks and last accepted values for one inverter."""
+    __slots__ = ("checks", "n_keys", "last_value", "last_time", "strikes", "candidates")
+
+    def __init__(self):
+        self.checks = []
+        self.n_keys = -1
+        self.last_value = {}
+        self.last_time = {}
+        self.strikes = {}
+        # name -> (value, time) of a first value waiting for confirmation
+        self.candidates = {}
+
+
+def _passes(check, prev, prev_time, value, now):
+    """Rate and monotonic guard of one check against the previous value."""
+    if check[_MONO] and value < prev:
+        return False
+    if check[_RATE] is not None:
+        return abs(value - prev) <= check[_RATE] * max(now - prev_time, 1.0)
+    return True
+
+
+class PlausibilityFilter:
+    """
+    Validates samples against per-field bounds, rate-of-change limits
+    and monotonic guards.
+    """
+
+    def __init__(self, rules, action="hold", reread=False, rebase_after=10):
+        """
+        :param rules: dict of field name pattern (fnmatch, case-insensitive) -> rule string
+        :param action: 'hold' replaces bad values with the last good one, 'drop' removes them
+        :param reread: If True, the caller should re-read the affected register block once
+        :param rebase_after: Accept a value as new baseline after this many consecutive rejections
+        """
+        if action not in ("hold", "drop"):
+            raise ValueError(f"Invalid plausibility action: {action}")
+        self.rules = [(pattern.lower(), parse_rule(text)) for pattern, text in rules.items()]
+        self.action = action
+        self.reread = reread
+        self.rebase_after = rebase_after
+        self.rejections = {}
+        self.total_rejections = 0
+        self._states = {}
+
+    @classmethod
+    def from_config(cls, settings):
+        """
+        Builds the filter from the [plausibility] and [plausibility.rules] sections.
+        :param settings: RawConfigParser instance
+        :return: PlausibilityFilter or None if disabled
+        """
+        if not settings.getboolean('plausibility', 'enabled', fallback=False):
+            return None
+        if settings.has_section('plausibility.rules'):
+            rules = dict(settings.items('plausibility.rules'))
+        else:
+            rules = DEFAULT_RULES
+        return cls(
+            rules,
+            action=settings.get('plausibility', 'action', fallback='hold').lower(),
+            reread=settings.getboolean('plausibility', 'reread', fallback=False),
+            rebase_after=settings.getint('plausibility', 'rebase_after', fallback=10),
+        )
+
+    def _compile(self, state, data):
+        """Resolves the rule patterns against the actual field names of a sample."""
+        checks = []
+        for name, value in data.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lo = hi = rate = None
+            monotonic = False
+            lname = name.lower()
+            for pattern, (r_lo, r_hi, r_rate, r_mono) in self.rules:
+                if not fnmatch.fnmatchcase(lname, pattern):
+                    continue
+                # Later rules refine earlier ones
+                lo = r_lo if r_lo is not None else lo
+                hi = r_hi if r_hi is not None else hi
+                rate = r_rate if r_rate is not None else rate
+                monotonic = monotonic or r_mono
+            if lo is None and hi is None and rate is None and not monotonic:
+                continue
+            checks.append([
+                name,
+                float("-inf") if lo is None else lo,
+                float("inf") if hi is None else hi,
+                rate,
+                monotonic,
+            ])
+            state.strikes[name] = 0
+        state.checks = checks
+        state.n_keys = len(data)
+        log.debug(f"Compiled {len(checks)} plausibility checks")
+
+    def check(self, inverter_name, data, now=None, fields=None, final=True):
+        """
+        Validates a sample in place.
+        :param inverter_name: Name of the inverter the sample belongs to
+        :param data: Decoded field dict (modified in place)
+        :param now: Optional timestamp (defaults to time.monotonic())
+        :param fields: Only check these fields (e.g. after a re-read)
+        :param final: False for a first attempt that is checked again after a re-read:
+                      rejected values are reported but neither counted nor replaced
+        :return: Sequence of rejected field names (empty tuple if all passed)
+        """
+        state = self._states.get(inverter_name)
+        if state is None:
+            state = self._states[inverter_name] = _InverterState()
+        # Recompile only when the sample grows (e.g. first full read after the
+        # minimal 'sleeping' dict); fields missing from a sample are skipped.
+        if len(data) > state.n_keys:
+            self._compile(state, data)
+        if now is None:
+            now = time.monotonic()
+
+        rejected = _NO_REJECTS
+        last_value = state.last_value
+        last_time = state.last_time
+        for check in state.checks:
+            name = check[_NAME]
+            if fields is not None and name not in fields:
+                continue
+            value = data.get(name)
+            if value is None:
+                continue
+            prev = last_value.get(name)
+            in_bounds = check[_LO] <= value <= check[_HI]
+            if in_bounds and prev is None and (check[_MONO] or check[_RATE] is not None):
+                # No baseline yet: a single (possibly corrupt) value is not trusted.
+                # It is withheld until the next sample confirms it.
+                candidate = state.candidates.get(name)
+                if candidate is not None and _passes(check, candidate[0], candidate[1], value, now):
+                    del state.candidates[name]
+                    last_value[name] = value
+                    last_time[name] = now
+                    continue
+                state.candidates[name] = (value, now)
+                del data[name]
+                continue
+            ok = in_bounds
+            if ok and prev is not None:
+                ok = _passes(check, prev, last_time[name], value, now)
+
+            # A persistent step change (e.g. counter reset after a firmware update)
+            # must not lock the field forever, so it becomes the new baseline.
+            if ok or (in_bounds and state.strikes[name] >= self.rebase_after):
+                if not ok:
+                    log.warning(f"{inverter_name}: Accepting {name}={value} as new baseline "
+                                f"after {state.strikes[name]} rejections")
+                last_value[name] = value
+                last_time[name] = now
+                state.strikes[name] = 0
+                continue
+
+            # Rejected
+            if rejected is _NO_REJECTS:
+                rejected = []
+            rejected.append(name)
+            if not final:
+                continue
+            state.strikes[name] += 1
+            self.total_rejections += 1
+            self.rejections[name] = self.rejections.get(name, 0) + 1
+            log.debug(f"{inverter_name}: Implausible value {name}={value} (last good: {prev})")
+            if prev is not None and self.action == "hold":
+                data[name] = prev
+            else:
+                del data[name]
+        return rejected
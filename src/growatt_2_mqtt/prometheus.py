@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+prometheus.py
+
+Embedded Prometheus exporter.
+Serves the latest decoded fields of all inverters and the bridge's own health
+metrics on /metrics. Scrapes only read an in-memory snapshot that is updated
+as a sink, so they never touch the Modbus bus or wait for the polling loop.
+"""
+
+import logging
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .sinks import Sink
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+_INVALID_CHARS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def metric_name(prefix, field):
+    """Prometheus metric name of a field, e.g. ('growatt', 'Eac_Today') -> growatt_eac_today"""
+    return f"{prefix}_{_INVALID_CHARS.sub('_', field).lower()}"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def _numeric(value):
+    """Sample value as float, or None for values Prometheus cannot represent (strings)."""
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+def _format(value):
+    """Sample value in the text format (NaN/+Inf/-Inf spelled the Prometheus way)."""
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+class PrometheusExporter(Sink):
+    """
+    Keeps the latest sample per inverter and renders it in the Prometheus text format.
+    """
+    name = "prometheus"
+
+    def __init__(self, host="0.0.0.0", port=9120, prefix="growatt"):
+        """
+        :param host: Listen address
+        :param port: Listen port
+        :param prefix: Prefix of the field metrics
+        """
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self.started = time.time()
+        self.scrapes = 0
+        # inverter name -> Sample; replaced as a whole, never modified in place
+        self._latest = {}
+        self._lock = threading.Lock()
+        # Callables returning iterables of (name, type, help, labels, value)
+        self.collectors = []
+        self._server = None
+
+    @classmethod
+    def from_config(cls, settings):
+        """
+        Builds the exporter from the [prometheus] section.
+        :param settings: RawConfigParser instance
+        :return: PrometheusExporter or None if disabled
+        """
+        if not settings.getboolean('prometheus', 'enabled', fallback=False):
+            return None
+        return cls(
+            host=settings.get('prometheus', 'host', fallback='0.0.0.0'),
+            port=settings.getint('prometheus', 'port', fallback=9120),
+            prefix=settings.get('prometheus', 'prefix', fallback='growatt'),
+        )
+
+    def start(self):
+        """Starts the HTTP server in a daemon thread."""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug(f"{self.address_string()} {format % args}")
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="Prometheus", daemon=True).start()
+        log.info(f"Prometheus metrics on http://{self.host}:{self.port}/metrics")
+
+    def write(self, sample):
+        with self._lock:
+            self._latest[sample.inverter] = sample
+
+    def close(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def render(self):
+        """Renders all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            samples = list(self._latest.values())
+            self.scrapes += 1
+
+        # name -> [type, help, [lines]]; keeps all series of a metric together
+        metrics = {}
+
+        def add(name, mtype, help_text, labels, value):
+            entry = metrics.get(name)
+            if entry is None:
+                entry = metrics[name] = [mtype, help_text, []]
+            entry[2].append(f"{name}{_labels(labels)} {_format(value)}")
+
+        for sample in samples:
+            labels = {"inverter": sample.inverter, "model": sample.model}
+            add(f"{self.prefix}_last_sample_timestamp_seconds", "gauge",
+                "Unix time of the latest sample", labels, float(sample.time))
+            for field, value in sample.fields.items():
+                value = _numeric(value)
+                if value is not None:
+                    add(metric_name(self.prefix, field), "gauge", f"Inverter field {field}", labels, value)
+
+        add("growatt2mqtt_uptime_seconds", "gauge", "Seconds since the bridge started", None,
+            time.time() - self.started)
+        add("growatt2mqtt_scrapes_total", "counter", "Number of /metrics scrapes", None, float(self.scrapes))
+        for collector in self.collectors:
+            try:
+                for name, mtype, help_text, labels, value in collector():
+                    add(name, mtype, help_text, labels, float(value))
+            except Exception as e:
+                log.error(f"Metrics collector failed: {e}")
+
+        out = []
+        for name, (mtype, help_text, lines) in metrics.items():
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {mtype}")
+            out.extend(lines)
+        return "\n".join(out) + "\n"
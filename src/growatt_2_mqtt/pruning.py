@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+pruning.py
+
+Learns which mapped fields an installation never uses (e.g. PV3-PV8 on a unit
+with two MPPTs, the BDC block without a battery) and leaves them out of the
+published samples. A field is absent when it was zero or missing in every
+sample of the learning window. The result is remembered per inverter in a
+JSON file; a pruned field that ever reports a non-zero value is published again.
+
+Only measurements (fields with a state class in the register map metadata)
+are candidates: a status word or fault code that is always 0 is still information.
+"""
+
+import json
+import logging
+import os
+import time
+
+from .register_maps.metadata import sensor_meta
+
+log = logging.getLogger(__name__)
+
+
+class _UnitState:
+    """Learning progress and result of one inverter."""
+    __slots__ = ("since", "samples", "seen", "absent", "learned")
+
+    def __init__(self, since):
+        self.since = since
+        self.samples = 0
+        # Candidate fields that carried data at least once
+        self.seen = set()
+        self.absent = set()
+        self.learned = False
+
+
+class FieldPruner:
+    """
+    Drops fields that never carry data from the samples of each inverter.
+    """
+
+    def __init__(self, path=None, window=86400, min_samples=100):
+        """
+        :param path: JSON file for the learned state; None keeps it in memory only
+        :param window: Learning window in seconds (should cover a day and a night)
+        :param min_samples: Min. samples before the window may end
+        """
+        self.path = path
+        self.window = window
+        self.min_samples = min_samples
+        self.units = {}
+        self._candidates = {}
+        self._dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for name, entry in json.load(f).items():
+                        state = _UnitState(entry.get("since", time.time()))
+                        state.samples = entry.get("samples", 0)
+                        state.seen = set(entry.get("seen", ()))
+                        state.absent = set(entry.get("absent", ()))
+                        state.learned = entry.get("learned", False)
+                        self.units[name] = state
+                log.info(f"Loaded field pruning state of {len(self.units)} inverters from {path}")
+            except (OSError, ValueError, AttributeError) as e:
+                log.warning(f"Ignoring unreadable field pruning state {path}: {e}")
+
+    @classmethod
+    def from_config(cls, settings):
+        """
+        Builds the pruner from the [pruning] section.
+        :param settings: RawConfigParser instance
+        :return: FieldPruner or None if disabled
+        """
+        if not settings.getboolean('pruning', 'enabled', fallback=False):
+            return None
+        return cls(
+            settings.get('pruning', 'path', fallback='growatt2mqtt_pruning.json') or None,
+            window=settings.getfloat('pruning', 'window', fallback=24) * 3600,
+            min_samples=settings.getint('pruning', 'min_samples', fallback=100),
+        )
+
+    def _is_candidate(self, key):
+        candidate = self._candidates.get(key)
+        if candidate is None:
+            candidate = sensor_meta(key)[2] is not None
+            self._candidates[key] = candidate
+        return candidate
+
+    def absent(self, name):
+        """Fields currently pruned for an inverter."""
+        state = self.units.get(name)
+        return state.absent if state else set()
+
+    def process(self, name, fields, now=None):
+        """
+        Learns from a sample and removes the absent fields.
+        :param name: Inverter name
+        :param fields: Decoded field dict
+        :param now: Sample time (defaults to now)
+        :return: tuple (fields without the absent ones, True if the set of absent fields changed)
+        """
+        now = time.time() if now is None else now
+        state = self.units.get(name)
+        if state is None:
+            state = self.units[name] = _UnitState(now)
+        changed = False
+
+        if not state.learned:
+            for key, value in fields.items():
+                if value and self._is_candidate(key):
+                    state.seen.add(key)
+            state.samples += 1
+            if state.samples % 100 == 0:
+                self._dirty = True
+            if state.samples >= self.min_samples and now - state.since >= self.window:
+                state.absent = {key for key in fields
+                                if key not in state.seen and self._is_candidate(key)}
+                state.learned = True
+                changed = bool(state.absent)
+                self._dirty = True
+                log.info(f"Field pruning for '{name}': {len(state.absent)} fields without data after "
+                         f"{state.samples} samples" + (f": {', '.join(sorted(state.absent))}" if state.absent else ""))
+            else:
+                self.save()
+                return fields, False
+
+        if state.absent:
+            # A pruned field that reports data is real after all
+            revived = [key for key in state.absent if fields.get(key)]
+            if revived:
+                state.absent.difference_update(revived)
+                state.seen.update(revived)
+                changed = True
+                self._dirty = True
+                log.info(f"Field pruning for '{name}': publishing {', '.join(sorted(revived))} again")
+            fields = {key: value for key, value in fields.items() if key not in state.absent}
+        self.save()
+        return fields, changed
+
+    def save(self):
+        """Writes the state atomically if it changed."""
+        if not self.path or not self._dirty:
+            return
+        data = {name: {"since": state.since, "samples": state.samples, "seen": sorted(state.seen),
+                       "absent": sorted(state.absent), "learned": state.learned}
+                for name, state in self.units.items()}
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+            self._dirty = False
+        except OSError as e:
+            log.error(f"Failed to save field pruning state {self.path}: {e}")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+publisher.py
+
+Publisher thread between acquisition and the outputs.
+The polling loop only holds the Modbus lock for bus I/O and hands everything
+else (availability, discovery, settings, errors, sinks) to this worker, so
+serialization and socket writes never lengthen the time the bus is locked.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class Publisher:
+    """
+    Runs submitted jobs in order on a dedicated thread and tracks their latency.
+    """
+
+    def __init__(self, maxsize=100):
+        """
+        :param maxsize: Max. queued jobs; further jobs are dropped so acquisition never blocks
+        """
+        self.jobs = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.failures = 0
+        # Seconds from submit() until the job finished (last / max since start)
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self._thread = threading.Thread(target=self._worker, name="Publisher", daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args):
+        """
+        Queues func(*args) without blocking.
+        :return: False if the queue was full and the job was dropped
+        """
+        try:
+            self.jobs.put_nowait((time.monotonic(), func, args))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            log.warning(f"Publisher queue full, job {getattr(func, '__name__', func)} dropped "
+                        f"({self.dropped} so far)")
+            return False
+
+    @property
+    def depth(self):
+        return self.jobs.qsize()
+
+    def close(self, timeout=10):
+        """Runs the queued jobs and stops the thread."""
+        self.jobs.put((time.monotonic(), None, ()))
+        self._thread.join(timeout=timeout)
+
+    def _worker(self):
+        while True:
+            submitted, func, args = self.jobs.get()
+            if func is None:
+                return
+            try:
+                func(*args)
+            except Exception as e:
+                self.failures += 1
+                log.error(f"Publisher job {getattr(func, '__name__', func)} failed: {e}")
+            self.latency = time.monotonic() - submitted
+            self.max_latency = max(self.max_latency, self.latency)
@@ -26,7 +26,7 @@ REG_HOLDING_MAX_MAP = {
     # 4: Fixed Reactive Power Percentage (0-100%)
     "ReactivePowerRate": (4, 1, 1, "uint"),
 
-    # 5: Power Factor (Scale 10000, e.g., 10000 = 1.0)
+    # 5: Power Factor (0-20000, 10000 = 1.0; below: underexcited, above: overexcited)
     "PowerFactor": (5, 1, 10000, "uint"),
 
     # 16-17: Grid Voltage High/Low Limits (0.1V)
@@ -60,4 +60,15 @@ REG_HOLDING_MAX_MAP_EXTENDED = {
 
     # 232: Export Limit Power Rate (0.1% or 0.1W depending on specific firmware)
     "ExportLimitRate": (107, 1, 1, "uint"),
-}
\ No newline at end of file
+}
+
+# --- Write Groups (MQTT command -> adjacent holding registers) ---
+# Written in one transaction with Function Code 16 (Write Multiple Registers).
+# Based on Protocol V1.24 for MAX.
+# Group name: (First register (absolute), field names in register order)
+REG_HOLDING_MAX_WRITE_GROUPS = {
+    # 16-19
+    "GridLimits": (16, ("GridVoltHigh", "GridVoltLow", "GridFreqHigh", "GridFreqLow")),
+    # 231-232
+    "ExportLimit": (231, ("ExportLimitEnable", "ExportLimitRate")),
+}
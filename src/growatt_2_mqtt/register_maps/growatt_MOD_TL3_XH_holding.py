@@ -32,7 +32,7 @@ REG_HOLDING_MOD_TL3_XH_MAP = {
     # 4: Reactive Power Percentage (0-100%)
     "ReactivePowerRate": (4, 1, 1, "uint"),
 
-    # 5: Power Factor (0-10000, 10000 = 1.0)
+    # 5: Power Factor (0-20000, 10000 = 1.0; below: underexcited, above: overexcited)
     "PowerFactor": (5, 1, 10000, "uint"),
 
     # 8: PV Voltage High Limit (0.1V)
@@ -114,13 +114,15 @@ REG_HOLDING_MOD_TL3_XH_ADVANCED_SETTINGS_MAP = {
     "BatPriority": (80, 1, 1, "uint"),
 }
 
-# --- Write Mapping (MQTT Topic -> Register Address) ---
-# This defines which registers are writable via MQTT.
+# --- Write Groups (MQTT command -> adjacent holding registers) ---
+# Written in one transaction with Function Code 16 (Write Multiple Registers).
 # Based on Protocol V1.24 for MOD-XH (3000 range).
-REG_HOLDING_MOD_TL3_XH_WRITE_MAP = {
-    # Topic Name                  # Register Adresse (Absolut)
-    "BatDischargePowerLimit":     3048,  # Entladeleistung (0-100%)
-    "BatChargePowerLimit":        3047,  # Ladeleistung (0-100%)
-    "ACChargeEnable":             3049,  # AC Ladung (0=Aus, 1=Ein)
-    "OnOff":                      0      # Inverter An/Aus
-}
\ No newline at end of file
+# Group name: (First register (absolute), field names in register order)
+REG_HOLDING_MOD_TL3_XH_WRITE_GROUPS = {
+    # 3038-3039
+    "ExportLimit": (3038, ("ExportLimitEnable", "ExportLimitRate")),
+    # 3047-3049
+    "BatteryControl": (3047, ("BatChargePowerLimit", "BatDischargePowerLimit", "ACChargeEnable")),
+    # AC charge slot 1, 3050-3052
+    "ACChargeTime1": (3050, ("ACChargeTime1_StartH", "ACChargeTime1_StartM", "ACChargeTime1_EndH")),
+}
@@ -29,7 +29,7 @@ REG_HOLDING_TL3X_MAP = {
     # 4: Reactive Power Rate (0-100%)
     "ReactivePowerRate": (4, 1, 1, "uint"),
 
-    # 5: Power Factor (0-10000, where 10000 = 1.0)
+    # 5: Power Factor (0-20000, 10000 = 1.0; below: underexcited, above: overexcited)
     "PowerFactor": (5, 1, 10000, "uint"),
 
     # 16-17: Grid Voltage High/Low Limits (0.1V)
@@ -69,4 +69,15 @@ REG_HOLDING_TL3X_ID_MAP = {
 
     # 3021-3024: Firmware Version (ASCII, 4 Registers)
     "FirmwareVersion": (21, 4, 1, "ascii"), # Relative to base 3000
-}
\ No newline at end of file
+}
+
+# --- Write Groups (MQTT command -> adjacent holding registers) ---
+# Written in one transaction with Function Code 16 (Write Multiple Registers).
+# Based on Protocol V1.24 for TL3-X (same layout as MAX).
+# Group name: (First register (absolute), field names in register order)
+REG_HOLDING_TL3X_WRITE_GROUPS = {
+    # 16-19
+    "GridLimits": (16, ("GridVoltHigh", "GridVoltLow", "GridFreqHigh", "GridFreqLow")),
+    # 231-232
+    "ExportLimit": (231, ("ExportLimitEnable", "ExportLimitRate")),
+}
@@ -24,7 +24,7 @@ REG_HOLDING_TLXH_MIN_MAP = {
     # 3: Active Power Rate (0-100%)
     "ActivePowerRate": (3, 1, 1, "uint"),
 
-    # 5: Power Factor (0-10000, 10000 = 1.0)
+    # 5: Power Factor (0-20000, 10000 = 1.0; below: underexcited, above: overexcited)
     "PowerFactor": (5, 1, 10000, "uint"),
 
     # 88: Modbus Address (1-247)
@@ -79,4 +79,15 @@ REG_HOLDING_TLXH_US_MAP = {
 
     # 3129: Forced Discharge Enable
     "ForcedDischargeEnable": (129, 1, 1, "uint"),
-}
\ No newline at end of file
+}
+
+# --- Write Groups (MQTT command -> adjacent holding registers) ---
+# Written in one transaction with Function Code 16 (Write Multiple Registers).
+# Based on Protocol V1.24 for TL-XH / MIN (3000 range).
+# Group name: (First register (absolute), field names in register order)
+REG_HOLDING_TLXH_MIN_WRITE_GROUPS = {
+    # 3038-3039
+    "ExportLimit": (3038, ("ExportLimitEnable", "ExportLimitRate")),
+    # 3047-3049
+    "BatteryControl": (3047, ("MaxChargeRate", "MaxDischargeRate", "ACChargeEnable")),
+}
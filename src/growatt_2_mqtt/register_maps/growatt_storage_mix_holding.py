@@ -70,4 +70,18 @@ REG_HOLDING_MIX_STORAGE_MAP = {
     
     # 1056: EPS (Off-grid) Mode Enable (0: Disable, 1: Enable)
     "EPS_ModeEnable": (1056, 1, 1, "uint"),
-}
\ No newline at end of file
+}
+
+# --- Write Groups (MQTT command -> adjacent holding registers) ---
+# Written in one transaction with Function Code 16 (Write Multiple Registers).
+# Based on Protocol V1.24 for MIX (1000 range).
+# Group name: (First register (absolute), field names in register order)
+REG_HOLDING_MIX_WRITE_GROUPS = {
+    # 1010-1013
+    "BatteryLimits": (1010, ("ChargePowerRate", "DischargePowerRate", "StopChargeSOC", "StopDischargeSOC")),
+    # AC charge slot 1, 1014-1019
+    "ACChargeTime1": (1014, ("ACChargeEnable", "ACCharge_StartHour", "ACCharge_StartMin",
+                             "ACCharge_EndHour", "ACCharge_EndMin", "ACCharge_EnablePeriod")),
+    # 1047-1048
+    "ExportLimit": (1047, ("ExportLimitEnable", "ExportLimitRate")),
+}
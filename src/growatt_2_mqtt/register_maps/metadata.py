@@ -0,0 +1,374 @@
+"""
+metadata.py
+
+Home Assistant metadata of the fields in the register maps.
+Used by discovery instead of guessing from the field names.
+
+Sensor tuple structure:
+(Unit, Device class, State class, Display precision)
+
+Setting tuple structure:
+(Component, Unit, Min, Max, Step)
+Component is "switch" (0/1 registers) or "number".
+
+Fields without an entry are published as plain sensors without unit and
+state class, so Home Assistant does not record long-term statistics for them.
+"""
+
+import re
+
+# Shorthands for the recurring classes
+_W = ("W", "power", "measurement", 1)
+_VA = ("VA", "apparent_power", "measurement", 1)
+_VAR = ("var", "reactive_power", "measurement", 1)
+_V = ("V", "voltage", "measurement", 1)
+_A = ("A", "current", "measurement", 1)
+_HZ = ("Hz", "frequency", "measurement", 2)
+_C = ("°C", "temperature", "measurement", 1)
+_KWH = ("kWh", "energy", "total_increasing", 1)
+_PCT = ("%", None, "measurement", 0)
+_SOC = ("%", "battery", "measurement", 0)
+_PF = (None, "power_factor", "measurement", 3)
+# Status words, fault and warning codes: no unit, no statistics
+_CODE = (None, None, None, None)
+
+SENSOR_META = {
+    # --- Status / codes ---
+    "InverterStatus": _CODE,
+    "InverterStatus_SPA": _CODE,
+    "DeratingMode": _CODE,
+    "FaultCode": _CODE,
+    "FaultMain": _CODE,
+    "FaultSub": _CODE,
+    "WarnCode": _CODE,
+    "WarnMain": _CODE,
+    "WarnSub": _CODE,
+    "WarningBitH": _CODE,
+    "PV_Warning_Val": _CODE,
+    "SysFaultWord0": _CODE,
+    "SysFaultWord1": _CODE,
+    "SystemCmd": _CODE,
+    "SystemWorkMode": _CODE,
+    "PriorityMode": _CODE,
+    "Priority_SPA": _CODE,
+    "AFCI_Status": _CODE,
+    "DSP_Status": _CODE,
+    "PID_Status": _CODE,
+    "PID_FaultCode": _CODE,
+    "StringUnmatch": _CODE,
+    "StringUnmatch_1_16": _CODE,
+    "StringUnmatch_17_32": _CODE,
+    "StringCurrentUnbal_1_16": _CODE,
+    "StringCurrentUnbal_17_32": _CODE,
+    "StringDisconnect_1_16": _CODE,
+    "StringDisconnect_17_32": _CODE,
+    "StringWarning_1_16": _CODE,
+    "StringWarning_17_32": _CODE,
+    "BatteryType": _CODE,
+    "BatPackNum": _CODE,
+    "Bat_ISO_Status": _CODE,
+    "BDC_Mode": _CODE,
+    "BDC1_Mode": _CODE,
+    "BDC1_Status": _CODE,
+    "BDC_DeratingMode": _CODE,
+    "BMS_Status": _CODE,
+    "BMS2_Status": _CODE,
+    "BMS_Error": _CODE,
+
+    # --- PV ---
+    "PpvInput": _W,
+    "Epv_Total": _KWH,
+
+    # --- AC output ---
+    "Pac": _W,
+    "Pac_SPA": _W,
+    "Pac1": _W,
+    "Pac1_SPA": _W,
+    "Pac2": _W,
+    "Pac3": _W,
+    "Psys": _W,
+    "Psystem": _W,
+    "Pself": _W,
+    "Sac": _VA,
+    "Qac": _VAR,
+    "Qac_Real": _VAR,
+    "Vac1": _V,
+    "Vac1_SPA": _V,
+    "Vac2": _V,
+    "Vac3": _V,
+    "Vac_RS": _V,
+    "Vac_ST": _V,
+    "Vac_TR": _V,
+    "Iac1": _A,
+    "Iac1_SPA": _A,
+    "Iac2": _A,
+    "Iac3": _A,
+    "Fac": _HZ,
+    "Fac_SPA": _HZ,
+    "IPF": (None, None, "measurement", 0),  # 0-20000, 10000 = 1.0
+    "RealOPPercent": _PCT,
+    "ExportLimitApparent": _VA,
+
+    # --- Energy counters ---
+    "Eac_Today": _KWH,
+    "Eac_Today_SPA": _KWH,
+    "Eac_Total": _KWH,
+    "Eac_Total_SPA": _KWH,
+    "Esys_Today": _KWH,
+    "Esys_Total": _KWH,
+    "E_Reactive_Total": ("kvarh", None, "total_increasing", 1),
+    "E_ACCharge_Today": _KWH,
+    "E_ACCharge_Today_SPA": _KWH,
+    "E_ACCharge_Total": _KWH,
+    "E_Charge_Today": _KWH,
+    "E_Charge_Total": _KWH,
+    "E_Discharge_Today": _KWH,
+    "E_Discharge_Total": _KWH,
+    "E_Extra_ToUser_Today": _KWH,
+    "E_Extra_ToUser_Today_SPA": _KWH,
+    "E_Extra_ToUser_Total": _KWH,
+    "E_Load_Today": _KWH,
+    "E_Load_Total": _KWH,
+    "E_LocalLoad_Today": _KWH,
+    "E_LocalLoad_Total": _KWH,
+    "E_SelfUse_Today": _KWH,
+    "E_SelfUse_Total": _KWH,
+    "E_Self_Today": _KWH,
+    "E_Self_Total": _KWH,
+    "E_ToGrid_Today": _KWH,
+    "E_ToGrid_Total": _KWH,
+    "E_ToUser_Today": _KWH,
+    "E_ToUser_Total": _KWH,
+    "Ebat_Charge_Today": _KWH,
+    "Ebat_Charge_Total": _KWH,
+    "Ebat_Discharge_Today": _KWH,
+    "Ebat_Discharge_Total": _KWH,
+    "Eex1_Today": _KWH,
+    "Eex1_Total": _KWH,
+    "WorkTimeTotal": ("s", "duration", "total_increasing", 0),
+    "WorkTimeTotal_SPA": ("s", "duration", "total_increasing", 0),
+
+    # --- Grid / load flows ---
+    "P_ACCharge": _W,
+    "P_Extra_ToGrid": _W,
+    "P_GridToLoad": _W,
+    "P_Load_Total": _W,
+    "P_LocalLoad_R": _W,
+    "P_LocalLoad_Total": _W,
+    "P_ToGrid_R": _W,
+    "P_ToGrid_Total": _W,
+    "P_ToUser_R": _W,
+    "P_ToUser_Total": _W,
+    "Pex1": _W,
+
+    # --- Internals ---
+    "TempInverter": _C,
+    "TempInverter_SPA": _C,
+    "Temp_Inverter": _C,
+    "TempIPM": _C,
+    "TempIPM_SPA": _C,
+    "Temp_IPM": _C,
+    "TempBoost": _C,
+    "TempBoost_SPA": _C,
+    "Temp_Boost": _C,
+    "Vbus": _V,
+    "Vbus2": _V,
+    "VbusP": _V,
+    "VbusP_SPA": _V,
+    "VbusN": _V,
+    "VbusN_SPA": _V,
+    "ISO": ("kΩ", None, "measurement", 0),
+
+    # --- Battery ---
+    "SOC": _SOC,
+    "SOH": _PCT,
+    "Vbat": _V,
+    "Vbat_DSP": _V,
+    "Bat_Load_Voltage": ("V", "voltage", "measurement", 2),
+    "Ibat": _A,
+    "Pbat": _W,
+    "Pbat_Charge": _W,
+    "Pbat_Discharge": _W,
+    "Pcharge": _W,
+    "Pdischarge": _W,
+    "BDC2_Pcharge": _W,
+    "BDC2_Echr_Total": _KWH,
+    "BDC2_Edischr_Total": _KWH,
+    "TempBattery": _C,
+    "BMS_SOC": _SOC,
+    "BMS_SOH": _PCT,
+    "BMS_Vbat": ("V", "voltage", "measurement", 2),
+    "BMS_Ibat": ("A", "current", "measurement", 2),
+    "BMS_Temp": _C,
+    "BMS_FCC": ("Ah", None, "measurement", 0),
+    "BMS_RM": ("Ah", None, "measurement", 0),
+    "BMS_MaxCellVolt": ("V", "voltage", "measurement", 3),
+    "BMS_MinCellVolt": ("V", "voltage", "measurement", 3),
+    "MaxCellVolt_Ext": ("V", "voltage", "measurement", 3),
+    "MinCellVolt_Ext": ("V", "voltage", "measurement", 3),
+    "MaxCellTemp": _C,
+    "MinCellTemp": _C,
+    "MaxSOC_Parallel": _SOC,
+    "MinSOC_Parallel": _SOC,
+    "BMS2_SOC": _SOC,
+    "BMS2_SOH": _PCT,
+    "BMS2_Vbat": ("V", "voltage", "measurement", 2),
+    "BMS2_Ibat": ("A", "current", "measurement", 2),
+
+    # --- EPS (off-grid output) ---
+    "Peps": _W,
+    "EPS_Pac1": _VA,
+    "EPS_Pac_Total": _VA,
+    "Veps": _V,
+    "EPS_Vac1": _V,
+    "EPS_Iac1": _A,
+    "Feps": _HZ,
+    "EPS_Fac": _HZ,
+    "EPS_LoadPercent": _PCT,
+
+    # --- Smart meter ---
+    "Voltage_L1": _V,
+    "Voltage_L2": _V,
+    "Voltage_L3": _V,
+    "Current_L1": ("A", "current", "measurement", 2),
+    "Current_L2": ("A", "current", "measurement", 2),
+    "Current_L3": ("A", "current", "measurement", 2),
+    "Power_L1": _W,
+    "Power_L2": _W,
+    "Power_L3": _W,
+    "ApparentPower_L1": _VA,
+    "ApparentPower_L2": _VA,
+    "ApparentPower_L3": _VA,
+    "ReactivePower_L1": _VAR,
+    "ReactivePower_L2": _VAR,
+    "ReactivePower_L3": _VAR,
+    "PowerFactor_L1": _PF,
+    "PowerFactor_L2": _PF,
+    "PowerFactor_L3": _PF,
+    "TotalActivePower": _W,
+    "TotalApparentPower": _VA,
+    "TotalReactivePower": _VAR,
+    "TotalPowerFactor": _PF,
+    "Frequency": _HZ,
+    "ImportActiveEnergy": ("kWh", "energy", "total_increasing", 2),
+    "ExportActiveEnergy": ("kWh", "energy", "total_increasing", 2),
+    "TotalActiveEnergy": ("kWh", "energy", "total_increasing", 2),
+}
+
+# Numbered families (PV inputs and strings); full match on the field name
+SENSOR_META_PATTERNS = [
+    (r"(PID_)?Vpv\d+", _V),
+    (r"(PID_)?Ipv\d+", _A),
+    (r"Ppv\d+", _W),
+    (r"Epv\d+_(Today|Total)", _KWH),
+    (r"V_String\d+", _V),
+    (r"I_String\d+", _A),
+]
+
+_SWITCH = ("switch", None, None, None, None)
+_RATE = ("number", "%", 0, 100, 1)
+_HOUR = ("number", "h", 0, 23, 1)
+_MINUTE = ("number", "min", 0, 59, 1)
+
+SETTING_META = {
+    "OnOff": _SWITCH,
+    "ACChargeEnable": _SWITCH,
+    "ACCharge_EnablePeriod": _SWITCH,
+    "ACCharge_PeriodEnable": _SWITCH,
+    "ACCharge_SlotEnable": _SWITCH,
+    "EPS_Enable": _SWITCH,
+    "EPS_ModeEnable": _SWITCH,
+    "ExportLimitEnable": _SWITCH,
+    "ForcedDischargeEnable": _SWITCH,
+    "IslandingProt": _SWITCH,
+
+    "ActivePowerRate": _RATE,
+    "ReactivePowerRate": _RATE,
+    "ExportLimitRate": _RATE,
+    "ExportLimitFailSafe": _RATE,
+    "BatChargePowerLimit": _RATE,
+    "BatDischargePowerLimit": _RATE,
+    "ChargePowerRate": _RATE,
+    "DischargePowerRate": _RATE,
+    "MaxChargeRate": _RATE,
+    "MaxDischargeRate": _RATE,
+    "StopChargeSOC": _RATE,
+    "StopDischargeSOC": _RATE,
+    # Raw 0-20000: 1.0 = unity, below 1.0 underexcited, above 1.0 overexcited
+    "PowerFactor": ("number", None, 0, 2, 0.0001),
+
+    "ACChargeTime1_StartH": _HOUR,
+    "ACChargeTime1_EndH": _HOUR,
+    "ACCharge_StartHour": _HOUR,
+    "ACCharge_EndHour": _HOUR,
+    "ACChargeTime1_StartM": _MINUTE,
+    "ACCharge_StartMin": _MINUTE,
+    "ACCharge_EndMin": _MINUTE,
+
+    "BatPriority": ("number", None, 0, 2, 1),
+    "PriorityMode": ("number", None, 0, 2, 1),
+    "StorageMode": ("number", None, 0, 2, 1),
+    "VpvStart": ("number", "V", 80, 500, 0.1),
+    "StartDelay": ("number", "s", 20, 600, 1),
+
+    # Clock and identification: shown, not meant to be changed from HA
+    "Year": ("sensor", None, None, None, None),
+    "Month": ("sensor", None, None, None, None),
+    "Day": ("sensor", None, None, None, None),
+    "Hour": ("sensor", None, None, None, None),
+    "Minute": ("sensor", None, None, None, None),
+    "Second": ("sensor", None, None, None, None),
+    "SerialNumber": ("sensor", None, None, None, None),
+    "ModelNumber": ("sensor", None, None, None, None),
+    "FirmwareVersion": ("sensor", None, None, None, None),
+}
+
+# Grid code, grid protection trip points, bus address and battery chemistry: read-only
+# sensors unless [control] allow_protected = true. A wrong Modbus address cuts the bridge
+# off the bus, a wrong grid code or trip point violates the connection agreement and a
+# wrong battery type charges the battery with the wrong profile. The trip points are
+# limited to the band grid codes allow (0.8-1.2 Un around 230 V, 47-62 Hz).
+PROTECTED_SETTING_META = {
+    "GridStandard": ("number", None, 0, 255, 1),
+    "ModbusAddress": ("number", None, 1, 247, 1),
+    "ComAddress": ("number", None, 1, 247, 1),
+    "GridVoltHigh": ("number", "V", 230, 276, 0.1),
+    "GridVoltLow": ("number", "V", 184, 230, 0.1),
+    "GridFreqHigh": ("number", "Hz", 50.1, 62, 0.01),
+    "GridFreqLow": ("number", "Hz", 47, 59.9, 0.01),
+    # 0: Lead-acid, 1: Lithium
+    "BatteryType": ("number", None, 0, 1, 1),
+}
+
+_READ_ONLY = ("sensor", None, None, None, None)
+
+_COMPILED_PATTERNS = [(re.compile(pattern), meta) for pattern, meta in SENSOR_META_PATTERNS]
+
+
+def sensor_meta(key):
+    """
+    Metadata of a live field.
+    :param key: Field name
+    :return: (unit, device_class, state_class, precision); all None for unknown fields
+    """
+    meta = SENSOR_META.get(key)
+    if meta is not None:
+        return meta
+    for pattern, meta in _COMPILED_PATTERNS:
+        if pattern.fullmatch(key):
+            return meta
+    return _CODE
+
+
+def setting_meta(key, allow_protected=False):
+    """
+    Metadata of a holding register field.
+    :param key: Field name
+    :param allow_protected: Return the writable metadata of PROTECTED_SETTING_META fields
+    :return: (component, unit, min, max, step); a read-only sensor for unknown and protected fields
+    """
+    if allow_protected:
+        meta = PROTECTED_SETTING_META.get(key)
+        if meta is not None:
+            return meta
+    return SETTING_META.get(key, _READ_ONLY)
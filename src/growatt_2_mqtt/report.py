@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+report.py
+
+Report-by-exception for live data.
+Only fields that moved past their deadband since they were last published are
+sent. A full keyframe is sent periodically so late subscribers still converge.
+select() only proposes the fields; the caller commits them once the publish
+succeeded, so a failed publish is retried with the next sample.
+"""
+
+import fnmatch
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+def parse_deadband(text):
+    """
+    Parses a deadband definition.
+    :param text: Absolute value ('5', '0.1') or percentage ('2%')
+    :return: tuple (absolute, percent) - one of them is 0.0
+    """
+    text = text.strip()
+    if text.endswith("%"):
+        return 0.0, float(text[:-1]) / 100.0
+    return float(text), 0.0
+
+
+class _InverterState:
+    """Compiled deadbands and last published values for one inverter."""
+    __slots__ = ("deadbands", "last", "last_keyframe")
+
+    def __init__(self):
+        self.deadbands = {}
+        self.last = {}
+        self.last_keyframe = None
+
+
+class ReportByException:
+    """
+    Selects the fields of a sample that need to be published.
+    """
+
+    def __init__(self, deadbands, default_deadband="0", keyframe_interval=300):
+        """
+        :param deadbands: dict of field name pattern (fnmatch, case-insensitive) -> deadband string
+        :param default_deadband: Deadband for fields without a matching pattern
+        :param keyframe_interval: Seconds between full snapshots
+        """
+        self.patterns = [(pattern.lower(), parse_deadband(text)) for pattern, text in deadbands.items()]
+        self.default = parse_deadband(default_deadband)
+        self.keyframe_interval = keyframe_interval
+        self._states = {}
+
+    @classmethod
+    def from_config(cls, settings):
+        """
+        Builds the reporter from the [report] and [report.deadbands] sections.
+        :param settings: RawConfigParser instance
+        :return: ReportByException or None if full snapshots are configured
+        """
+        if settings.get('report', 'mode', fallback='full').lower() != 'exception':
+            return None
+        deadbands = {}
+        if settings.has_section('report.deadbands'):
+            deadbands = dict(settings.items('report.deadbands'))
+        return cls(
+            deadbands,
+            default_deadband=settings.get('report', 'deadband', fallback='0'),
+            keyframe_interval=settings.getint('report', 'keyframe_interval', fallback=300),
+        )
+
+    def _deadband_for(self, name):
+        """Resolves the deadband of a field (last matching pattern wins)."""
+        result = self.default
+        lname = name.lower()
+        for pattern, deadband in self.patterns:
+            if fnmatch.fnmatchcase(lname, pattern):
+                result = deadband
+        return result
+
+    def _state(self, inverter_name):
+        state = self._states.get(inverter_name)
+        if state is None:
+            state = self._states[inverter_name] = _InverterState()
+        return state
+
+    def select(self, inverter_name, data, now=None):
+        """
+        Returns the fields of a sample that should be published (without remembering them).
+        :param inverter_name: Name of the inverter the sample belongs to
+        :param data: Decoded field dict
+        :param now: Optional timestamp (defaults to time.monotonic())
+        :return: tuple (fields, is_keyframe). fields is the complete data dict on keyframes.
+        """
+        if now is None:
+            now = time.monotonic()
+        state = self._state(inverter_name)
+
+        if state.last_keyframe is None or now - state.last_keyframe >= self.keyframe_interval:
+            return data, True
+
+        last = state.last
+        deadbands = state.deadbands
+        changed = {}
+        for name, value in data.items():
+            prev = last.get(name)
+            if prev is None:
+                changed[name] = value
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or isinstance(prev, str):
+                if value != prev:
+                    changed[name] = value
+                continue
+            deadband = deadbands.get(name)
+            if deadband is None:
+                deadband = deadbands[name] = self._deadband_for(name)
+            absolute, percent = deadband
+            limit = absolute if percent == 0.0 else abs(prev) * percent
+            if abs(value - prev) > limit:
+                changed[name] = value
+        return changed, False
+
+    def commit(self, inverter_name, fields, is_keyframe, now=None):
+        """
+        Remembers fields returned by select() after they were published.
+        :param inverter_name: Name of the inverter the sample belongs to
+        :param fields: Published fields
+        :param is_keyframe: The fields were a keyframe
+        :param now: Optional timestamp (defaults to time.monotonic())
+        """
+        state = self._state(inverter_name)
+        if is_keyframe:
+            state.last_keyframe = time.monotonic() if now is None else now
+        state.last.update(fields)
+
+    def reset(self):
+        """Forgets all published values (e.g. after a reconnect); the next sample is a keyframe."""
+        self._states = {}
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+serializer.py
+
+JSON serialization of payloads.
+The speedup comes from orjson, the optional [fast] extra (about 6-8x faster
+than json.dumps for MOD-XH and MAX samples). Without it, one compact stdlib
+encoder is built once and reused. That path runs at about the speed of the
+old json.dumps(payload, default=str) and only makes the payloads ~10% smaller.
+Precomputed per-model key layouts were measured as well and gave no gain over
+the C-accelerated encoder, so they are not used.
+Unknown value types are converted with str() only as a last resort.
+
+See tools/bench_serializer.py for the micro-benchmark against the old path.
+"""
+
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+# Optional dependency
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonSerializer:
+    """
+    Serializes payloads to compact JSON; fast only with orjson installed.
+    """
+
+    def __init__(self, use_orjson=True):
+        """
+        :param use_orjson: Use orjson if it is installed
+        """
+        self.use_orjson = use_orjson and orjson is not None
+        # Built once; the C accelerated encoder is used for every call
+        self._encoder = json.JSONEncoder(
+            separators=(',', ':'),
+            check_circular=False,
+            default=str,
+        )
+
+    def dumps(self, obj):
+        """
+        Serializes any JSON-compatible object.
+        :return: bytes (orjson) or str
+        """
+        if self.use_orjson:
+            return orjson.dumps(obj, default=str)
+        return self._encoder.encode(obj)
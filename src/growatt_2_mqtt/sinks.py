@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+sinks.py
+
+Output sinks for decoded samples.
+Every sample is handed to all configured sinks (MQTT, InfluxDB line protocol,
+rotating NDJSON files). Buffered sinks have their own queue and worker thread,
+so a slow or failing sink never blocks acquisition or the other sinks.
+"""
+
+import collections
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.request
+
+from .serializer import JsonSerializer
+from .templates import template_from_config
+
+log = logging.getLogger(__name__)
+
+
+class Sample:
+    """One decoded sample of an inverter."""
+    __slots__ = ("inverter", "model", "measurement", "time", "fields")
+
+    def __init__(self, inverter, model, measurement, sample_time, fields):
+        """
+        :param inverter: Inverter name
+        :param model: Inverter model (protocol_version)
+        :param measurement: Measurement name from the config
+        :param sample_time: Unix timestamp (float) of the read
+        :param fields: Decoded field dict
+        """
+        self.inverter = inverter
+        self.model = model
+        self.measurement = measurement
+        self.time = sample_time
+        self.fields = fields
+
+
+class Sink:
+    """
+    Base class of all output sinks.
+    """
+    name = "sink"
+
+    def write(self, sample):
+        """Hands a sample to the sink. Must not block for long."""
+        raise NotImplementedError
+
+    def tick(self):
+        """Called once per polling cycle (time based flushing etc.)."""
+
+    def close(self):
+        """Flushes pending data and releases resources."""
+
+
+QUEUE_POLICIES = ("drop_oldest", "drop_newest", "coalesce")
+
+
+class SampleQueue:
+    """
+    Bounded FIFO of samples with an overflow policy.
+    drop_oldest / drop_newest: discard the oldest queued or the incoming sample when full.
+    coalesce: keep only the newest queued sample per inverter (it takes the queue position
+    of the one it replaces); only distinct inverters count against the limit.
+    Not thread safe, the owner serializes access.
+    """
+
+    def __init__(self, maxsize=10000, policy="drop_oldest"):
+        """
+        :param maxsize: Max. number of queued samples
+        :param policy: 'drop_oldest', 'drop_newest' or 'coalesce'
+        """
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy} (supported: {', '.join(QUEUE_POLICIES)})")
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.dropped = 0
+        self.coalesced = 0
+        self._queue = collections.deque()
+        # coalesce: inverter -> newest sample; the deque holds the inverter names
+        self._latest = {}
+
+    def __len__(self):
+        return len(self._queue)
+
+    def put(self, sample):
+        """
+        Queues a sample.
+        :return: False if a sample was dropped or replaced
+        """
+        if self.policy == "coalesce":
+            if sample.inverter in self._latest:
+                self._latest[sample.inverter] = sample
+                self.coalesced += 1
+                return False
+            self._latest[sample.inverter] = sample
+            item = sample.inverter
+        else:
+            item = sample
+        if len(self._queue) < self.maxsize:
+            self._queue.append(item)
+            return True
+        self.dropped += 1
+        if self.policy == "drop_newest":
+            return False
+        self._discard(self._queue.popleft())
+        self._queue.append(item)
+        return False
+
+    def get_batch(self, count):
+        """Removes and returns up to count samples (oldest first)."""
+        batch = []
+        while self._queue and len(batch) < count:
+            item = self._queue.popleft()
+            batch.append(self._latest.pop(item) if self.policy == "coalesce" else item)
+        return batch
+
+    def requeue(self, batch):
+        """Puts a failed batch back in front, without exceeding the limit."""
+        for sample in reversed(batch):
+            if self.policy == "coalesce":
+                if sample.inverter in self._latest:
+                    # A newer sample is already queued
+                    self.coalesced += 1
+                    continue
+                self._latest[sample.inverter] = sample
+                item = sample.inverter
+            else:
+                item = sample
+            if len(self._queue) >= self.maxsize:
+                self.dropped += 1
+                self._discard(item)
+                continue
+            self._queue.appendleft(item)
+
+    def oldest_age(self, now=None):
+        """Seconds since the oldest queued sample was taken (0 if empty)."""
+        if not self._queue:
+            return 0.0
+        item = self._queue[0]
+        sample = self._latest[item] if self.policy == "coalesce" else item
+        return max(0.0, (now or time.time()) - sample.time)
+
+    def _discard(self, item):
+        if self.policy == "coalesce":
+            self._latest.pop(item, None)
+
+
+class BufferedSink(Sink):
+    """
+    Sink with a bounded in-memory queue drained by a worker thread.
+    Subclasses implement _write_batch(samples); exceptions are logged and the
+    batch is retried with backoff. When the queue is full the overflow policy applies.
+    """
+
+    def __init__(self, name, batch_size=500, flush_interval=10.0, buffer_size=10000, max_backoff=300.0,
+                 policy="drop_oldest"):
+        """
+        :param name: Sink name (for logging)
+        :param batch_size: Max. samples per write
+        :param flush_interval: Seconds between writes if the batch is not full
+        :param buffer_size: Max. samples buffered while the target is unavailable
+        :param max_backoff: Max. seconds between retries after a failed write
+        :param policy: Overflow policy of the queue (see SampleQueue)
+        """
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.buffer = SampleQueue(buffer_size, policy)
+        self.failures = 0
+        self._cond = threading.Condition()
+        self._closing = False
+        self._thread = threading.Thread(target=self._worker, name=f"Sink-{name}", daemon=True)
+        self._thread.start()
+
+    @property
+    def dropped(self):
+        """Samples lost because the queue was full."""
+        return self.buffer.dropped
+
+    def queue_stats(self):
+        """
+        Backpressure metrics of the queue.
+        :return: dict with depth, capacity, dropped, coalesced and oldest_age (seconds)
+        """
+        with self._cond:
+            return {
+                'depth': len(self.buffer),
+                'capacity': self.buffer.maxsize,
+                'dropped': self.buffer.dropped,
+                'coalesced': self.buffer.coalesced,
+                'oldest_age': self.buffer.oldest_age(),
+            }
+
+    def write(self, sample):
+        with self._cond:
+            dropped = self.buffer.dropped
+            self.buffer.put(sample)
+            if self.buffer.dropped != dropped and self.buffer.dropped % 100 == 1:
+                log.warning(f"Sink '{self.name}': queue full ({self.buffer.maxsize}), "
+                            f"{self.buffer.dropped} samples dropped so far ({self.buffer.policy})")
+            if len(self.buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout=10)
+
+    def _worker(self):
+        backoff = 0.0
+        while True:
+            with self._cond:
+                # Wait for a full batch, the flush interval or the end of the backoff
+                deadline = time.monotonic() + (backoff or self.flush_interval)
+                while not self._closing and (backoff or len(self.buffer) < self.batch_size):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(timeout=remaining)
+                batch = self.buffer.get_batch(self.batch_size)
+                if not batch and self._closing:
+                    return
+            try:
+                if batch:
+                    self._write_batch(batch)
+                backoff = 0.0
+            except Exception as e:
+                self.failures += 1
+                backoff = min(self.max_backoff, max(self.flush_interval, backoff * 2))
+                log.error(f"Sink '{self.name}': write of {len(batch)} samples failed "
+                          f"(retry in {backoff:.0f}s): {e}")
+                with self._cond:
+                    # Put the batch back in front (within the queue limit)
+                    self.buffer.requeue(batch)
+                    if self._closing:
+                        return
+            try:
+                self._periodic()
+            except Exception as e:
+                log.error(f"Sink '{self.name}': {e}")
+
+    def _periodic(self):
+        """Time based work, run on the worker thread after every wakeup."""
+
+    def _write_batch(self, samples):
+        raise NotImplementedError
+
+
+# =================================================================
+# InfluxDB Line Protocol
+# =================================================================
+
+def _escape_key(text):
+    """Escapes measurement names, tag keys/values and field keys."""
+    return str(text).replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def _field_value(value):
+    """Formats a field value (ints get the 'i' suffix, strings are quoted)."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    if isinstance(value, float):
+        return repr(value)
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def to_line_protocol(sample):
+    """
+    Converts a sample into one InfluxDB line (nanosecond timestamp).
+    :param sample: Sample
+    :return: Line without trailing newline, or None if the sample has no usable fields
+    """
+    fields = ",".join(
+        f"{_escape_key(name)}={_field_value(value)}"
+        for name, value in sample.fields.items()
+        if value is not None and not (isinstance(value, float) and value != value)
+    )
+    if not fields:
+        return None
+    return (f"{_escape_key(sample.measurement)},inverter={_escape_key(sample.inverter)},"
+            f"model={_escape_key(sample.model)} {fields} {int(sample.time * 1e9)}")
+
+
+class InfluxSink(BufferedSink):
+    """
+    Writes samples in InfluxDB line protocol over HTTP (v1 /write or v2 /api/v2/write) or UDP.
+    """
+
+    def __init__(self, transport="http", url=None, token=None, host="localhost", port=8089,
+                 timeout=10, **kwargs):
+        """
+        :param transport: 'http' or 'udp'
+        :param url: Full write URL incl. query (e.g. http://influx:8086/api/v2/write?org=home&bucket=solar)
+        :param token: Optional API token (sent as 'Authorization: Token <token>')
+        :param host: UDP target host
+        :param port: UDP target port
+        :param timeout: HTTP timeout in seconds
+        """
+        if transport not in ("http", "udp"):
+            raise ValueError(f"Unknown InfluxDB transport: {transport}")
+        if transport == "http" and not url:
+            raise ValueError("InfluxDB sink with transport 'http' requires 'url'")
+        self.transport = transport
+        self.url = url
+        self.token = token
+        self.address = (host, port)
+        self.timeout = timeout
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if transport == "udp" else None
+        super().__init__("influxdb", **kwargs)
+
+    def _write_batch(self, samples):
+        lines = [line for line in map(to_line_protocol, samples) if line]
+        if not lines:
+            return
+        if self.transport == "udp":
+            self._send_udp(lines)
+            return
+        body = ("\n".join(lines) + "\n").encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, method="POST")
+        request.add_header("Content-Type", "text/plain; charset=utf-8")
+        if self.token:
+            request.add_header("Authorization", f"Token {self.token}")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise IOError(f"HTTP {response.status}")
+
+    def _send_udp(self, lines, max_datagram=1400):
+        """Packs whole lines into datagrams of at most max_datagram bytes."""
+        chunk, size = [], 0
+        for line in lines:
+            data = line.encode("utf-8")
+            if chunk and size + len(data) + 1 > max_datagram:
+                self._sock.sendto(b"\n".join(chunk), self.address)
+                chunk, size = [], 0
+            chunk.append(data)
+            size += len(data) + 1
+        if chunk:
+            self._sock.sendto(b"\n".join(chunk), self.address)
+
+
+# =================================================================
+# Rotating NDJSON files
+# =================================================================
+
+class FileSink(BufferedSink):
+    """
+    Appends samples as newline-delimited JSON and rotates the file by size.
+    """
+
+    def __init__(self, path, max_bytes=10485760, backup_count=5, template=None, **kwargs):
+        """
+        :param path: Target file (rotated files get .1, .2, ... suffixes)
+        :param max_bytes: Rotate when the file exceeds this size
+        :param backup_count: Number of rotated files to keep
+        :param template: Optional PayloadTemplate for the line shape
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.template = template
+        self.serializer = JsonSerializer()
+        super().__init__("file", **kwargs)
+
+    def _write_batch(self, samples):
+        lines = []
+        for sample in samples:
+            if self.template:
+                record = self.template.build(sample)
+            else:
+                record = {
+                    'time': sample.time,
+                    'inverter': sample.inverter,
+                    'measurement': sample.measurement,
+                    'fields': sample.fields,
+                }
+            data = self.serializer.dumps(record)
+            lines.append(data if isinstance(data, bytes) else data.encode("utf-8"))
+        with open(self.path, "ab") as f:
+            f.write(b"\n".join(lines) + b"\n")
+            size = f.tell()
+        if self.max_bytes and size >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        log.info(f"Rotated sample file {self.path}")
+
+
+def _buffer_options(settings, section):
+    """Common options of buffered sinks."""
+    return {
+        'batch_size': settings.getint(section, 'batch_size', fallback=500),
+        'flush_interval': settings.getfloat(section, 'flush_interval', fallback=10),
+        'buffer_size': settings.getint(section, 'buffer_size', fallback=10000),
+        'policy': settings.get(section, 'queue_policy', fallback='drop_oldest').lower(),
+    }
+
+
+def build_sinks(settings, templates=None):
+    """
+    Creates the additional (non-MQTT) sinks enabled in the config.
+    :param settings: RawConfigParser instance
+    :param templates: Compiled payload templates (see templates.load_templates)
+    :return: List of sinks
+    """
+    sinks = []
+    if settings.getboolean('influxdb', 'enabled', fallback=False):
+        sinks.append(InfluxSink(
+            transport=settings.get('influxdb', 'transport', fallback='http').lower(),
+            url=settings.get('influxdb', 'url', fallback=None),
+            token=settings.get('influxdb', 'token', fallback=None),
+            host=settings.get('influxdb', 'host', fallback='localhost'),
+            port=settings.getint('influxdb', 'port', fallback=8089),
+            **_buffer_options(settings, 'influxdb')
+        ))
+        log.info("InfluxDB sink enabled")
+    if settings.getboolean('file', 'enabled', fallback=False):
+        sinks.append(FileSink(
+            settings.get('file', 'path', fallback='growatt2mqtt.ndjson'),
+            max_bytes=int(settings.getfloat('file', 'max_size_mb', fallback=10) * 1024 * 1024),
+            backup_count=settings.getint('file', 'backup_count', fallback=5),
+            template=template_from_config(settings, 'file', templates or {}),
+            **_buffer_options(settings, 'file')
+        ))
+        log.info("NDJSON file sink enabled")
+    return sinks
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+sparkplug.py
+
+Sparkplug B output.
+The bridge is an edge node, every [inverters.*] entry a device. NBIRTH/DBIRTH
+declare all metrics with aliases and datatypes (derived from the register map
+types), DDATA carries only the metrics that changed, addressed by alias.
+Payloads are Sparkplug B protobuf messages, encoded by hand to avoid a
+protobuf dependency (only the fields used here are implemented).
+"""
+
+import logging
+import struct
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from .sinks import BufferedSink
+
+log = logging.getLogger(__name__)
+
+NAMESPACE = "spBv1.0"
+REBIRTH = "Node Control/Rebirth"
+
+# Sparkplug B datatypes
+INT16 = 2
+INT32 = 3
+INT64 = 4
+UINT16 = 6
+UINT32 = 7
+UINT64 = 8
+FLOAT = 9
+DOUBLE = 10
+BOOLEAN = 11
+STRING = 12
+
+# Datatype -> (Metric field number, protobuf wire type)
+_VALUE_FIELDS = {
+    INT16: (10, 0), INT32: (10, 0), UINT16: (10, 0), UINT32: (10, 0),
+    INT64: (11, 0), UINT64: (11, 0),
+    FLOAT: (12, 5),
+    DOUBLE: (13, 1),
+    BOOLEAN: (14, 0),
+    STRING: (15, 2),
+}
+
+
+# =================================================================
+# Protobuf encoding
+# =================================================================
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, data):
+    return _key(field, 2) + _varint(len(data)) + data
+
+
+def _encode_value(datatype, value):
+    field, wire_type = _VALUE_FIELDS[datatype]
+    if wire_type == 0:
+        # Signed values are sent as two's complement of the field width
+        mask = 0xFFFFFFFF if field == 10 else 0xFFFFFFFFFFFFFFFF
+        return _key(field, 0) + _varint(int(value) & mask)
+    if wire_type == 5:
+        return _key(field, 5) + struct.pack("<f", value)
+    if wire_type == 1:
+        return _key(field, 1) + struct.pack("<d", value)
+    return _bytes_field(field, str(value).encode("utf-8"))
+
+
+def encode_metric(value, alias, datatype, name=None, timestamp=None):
+    """
+    Encodes one Metric message.
+    :param value: Metric value (None is sent as is_null)
+    :param alias: Numeric alias
+    :param datatype: Sparkplug datatype (selects the value field)
+    :param name: Metric name; only given in births, which also declare the datatype
+    :param timestamp: Milliseconds since epoch
+    """
+    out = bytearray()
+    if name is not None:
+        out += _bytes_field(1, name.encode("utf-8"))
+    out += _key(2, 0) + _varint(alias)
+    if timestamp is not None:
+        out += _key(3, 0) + _varint(timestamp)
+    if name is not None:
+        out += _key(4, 0) + _varint(datatype)
+    if value is None:
+        out += _key(7, 0) + b"\x01"
+    else:
+        out += _encode_value(datatype, value)
+    return bytes(out)
+
+
+def encode_payload(timestamp, metrics, seq=None):
+    """
+    Encodes a Payload message.
+    :param timestamp: Milliseconds since epoch
+    :param metrics: List of encoded Metric messages
+    :param seq: Sequence number (omitted for NDEATH)
+    """
+    out = bytearray(_key(1, 0) + _varint(timestamp))
+    for metric in metrics:
+        out += _bytes_field(2, metric)
+    if seq is not None:
+        out += _key(3, 0) + _varint(seq)
+    return bytes(out)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(data):
+    """Yields (field number, wire type, value) of a protobuf message."""
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 5:
+            value, pos = data[pos:pos + 4], pos + 4
+        elif wire_type == 2:
+            size, pos = _read_varint(data, pos)
+            value, pos = data[pos:pos + size], pos + size
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield field, wire_type, value
+
+
+def decode_metrics(payload):
+    """
+    Decodes the metrics of a command payload (name, alias and boolean/integer value only).
+    :return: List of dicts with 'name', 'alias' and 'value'
+    """
+    metrics = []
+    for field, _, value in _fields(payload):
+        if field != 2:
+            continue
+        metric = {'name': None, 'alias': None, 'value': None}
+        for m_field, _, m_value in _fields(value):
+            if m_field == 1:
+                metric['name'] = m_value.decode("utf-8")
+            elif m_field == 2:
+                metric['alias'] = m_value
+            elif m_field in (10, 11):
+                metric['value'] = m_value
+            elif m_field == 14:
+                metric['value'] = bool(m_value)
+        metrics.append(metric)
+    return metrics
+
+
+# =================================================================
+# Datatypes
+# =================================================================
+
+def _datatype_of(value):
+    """Datatype inferred from a Python value."""
+    if isinstance(value, bool):
+        return BOOLEAN
+    if isinstance(value, int):
+        return INT64
+    if isinstance(value, float):
+        return DOUBLE
+    return STRING
+
+
+def datatype_for(value, register_type=None):
+    """
+    Datatype of a metric, derived from its register map type if known.
+    :param value: Decoded value
+    :param register_type: (dtype, scale) from the register map, or None for derived fields
+    """
+    inferred = _datatype_of(value)
+    if register_type is None:
+        return inferred
+    dtype, scale = register_type
+    if dtype == "uint" and scale == 1:
+        datatype = UINT16
+    elif dtype == "int":
+        datatype = INT16
+    elif dtype == "int32":
+        datatype = INT32
+    elif dtype == "float" or dtype == "uint":
+        datatype = FLOAT
+    elif dtype == "uint32":
+        # 32 bit counters keep their resolution only as double
+        datatype = DOUBLE
+    else:
+        return inferred
+    # The decoded value wins if it does not fit the declared type
+    if inferred == STRING or (inferred == DOUBLE and datatype not in (FLOAT, DOUBLE)):
+        return inferred
+    return datatype
+
+
+def _coerce(datatype, value):
+    if value is None:
+        return None
+    if datatype in (FLOAT, DOUBLE):
+        return float(value)
+    if datatype == BOOLEAN:
+        return bool(value)
+    if datatype == STRING:
+        return str(value)
+    return int(value)
+
+
+class _Device:
+    """Birth state of one device."""
+
+    def __init__(self):
+        # field name -> [alias, datatype]
+        self.metrics = {}
+        # field name -> last published value
+        self.last = {}
+        self.born = False
+
+
+class SparkplugSink(BufferedSink):
+    """
+    Publishes samples as Sparkplug B edge node with one device per inverter.
+    """
+
+    def __init__(self, host="localhost", port=1883, group_id="growatt", edge_node_id="growatt2mqtt",
+                 type_lookup=None, queue_size=1000):
+        """
+        :param host: Broker host
+        :param port: Broker port
+        :param group_id: Sparkplug group id
+        :param edge_node_id: Sparkplug edge node id
+        :param type_lookup: Callable(inverter name) -> {field: (dtype, scale)} from the register maps
+        :param queue_size: Max. samples queued for the publisher thread
+        """
+        self.host = host
+        self.port = port
+        self.group_id = group_id
+        self.edge_node_id = edge_node_id
+        self.type_lookup = type_lookup
+        self.devices = {}
+        self.bd_seq = 0
+        self.seq = 0
+        # Aliases 1 and 2 are the node metrics bdSeq and Node Control/Rebirth
+        self._next_alias = 3
+        self._lock = threading.RLock()
+
+        self.client = mqtt.Client()
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self._set_will()
+        super().__init__("sparkplug", batch_size=1, flush_interval=1.0, buffer_size=queue_size)
+
+    @classmethod
+    def from_config(cls, settings, type_lookup=None):
+        """
+        Builds the sink from the [sparkplug] section.
+        :param settings: RawConfigParser instance
+        :param type_lookup: See __init__
+        :return: SparkplugSink or None if disabled
+        """
+        if not settings.getboolean('sparkplug', 'enabled', fallback=False):
+            return None
+        return cls(
+            host=settings.get('sparkplug', 'host', fallback=settings.get('mqtt', 'host', fallback='localhost')),
+            port=settings.getint('sparkplug', 'port', fallback=settings.getint('mqtt', 'port', fallback=1883)),
+            group_id=settings.get('sparkplug', 'group_id', fallback='growatt'),
+            edge_node_id=settings.get('sparkplug', 'edge_node_id', fallback='growatt2mqtt'),
+            type_lookup=type_lookup,
+            queue_size=settings.getint('sparkplug', 'queue_size', fallback=1000),
+        )
+
+    def _topic(self, message_type, device=None):
+        topic = f"{NAMESPACE}/{self.group_id}/{message_type}/{self.edge_node_id}"
+        return f"{topic}/{device}" if device else topic
+
+    def _next_seq(self):
+        seq = self.seq
+        self.seq = (self.seq + 1) % 256
+        return seq
+
+    def _set_will(self):
+        """NDEATH as Last Will; its bdSeq must match the next NBIRTH."""
+        payload = encode_payload(int(time.time() * 1000), [encode_metric(self.bd_seq, 1, UINT64, "bdSeq")])
+        self.client.will_set(self._topic("NDEATH"), payload, qos=1, retain=False)
+
+    def connect(self):
+        """Connects in the background (paho keeps retrying)."""
+        log.info(f"Connecting Sparkplug B edge node {self.group_id}/{self.edge_node_id} "
+                 f"to {self.host}:{self.port}...")
+        self.client.connect_async(self.host, self.port, 60)
+        self.client.loop_start()
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc != 0:
+            log.error(f"Sparkplug B connection failed with code {rc}")
+            return
+        log.info("Sparkplug B connected.")
+        client.subscribe(self._topic("NCMD"))
+        self._rebirth()
+
+    def _on_disconnect(self, client, userdata, rc, properties=None):
+        log.warning(f"Sparkplug B disconnected (rc={rc})")
+        with self._lock:
+            # The broker publishes NDEATH for this session; the next one needs a new bdSeq
+            self.bd_seq = (self.bd_seq + 1) % 256
+            for device in self.devices.values():
+                device.born = False
+            self._set_will()
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            for metric in decode_metrics(msg.payload):
+                if (metric['name'] == REBIRTH or metric['alias'] == 2) and metric['value']:
+                    log.info("Sparkplug B rebirth requested")
+                    self._rebirth()
+        except Exception as e:
+            log.error(f"Invalid Sparkplug B command: {e}")
+
+    def _rebirth(self):
+        """Publishes NBIRTH and a DBIRTH for every known device."""
+        with self._lock:
+            self.seq = 0
+            now = int(time.time() * 1000)
+            metrics = [
+                encode_metric(self.bd_seq, 1, UINT64, "bdSeq"),
+                encode_metric(False, 2, BOOLEAN, REBIRTH),
+            ]
+            self.client.publish(self._topic("NBIRTH"), encode_payload(now, metrics, self._next_seq()), qos=0)
+            for name, device in self.devices.items():
+                self._publish_birth(name, device, now)
+
+    def _publish_birth(self, name, device, timestamp):
+        metrics = [encode_metric(device.last.get(field), alias, datatype, field)
+                   for field, (alias, datatype) in device.metrics.items()]
+        self.client.publish(self._topic("DBIRTH", name), encode_payload(timestamp, metrics, self._next_seq()),
+                            qos=0)
+        device.born = True
+
+    def _declare(self, name, device, fields):
+        """
+        Adds aliases/datatypes for new fields.
+        :return: True if the device must be reborn (new field or changed datatype)
+        """
+        pending = []
+        for field, value in fields.items():
+            if value is None:
+                continue
+            entry = device.metrics.get(field)
+            # A numeric metric turning into a string (or back) needs a new datatype
+            if entry is None or (entry[1] == STRING) != isinstance(value, str):
+                pending.append(field)
+        if not pending:
+            return False
+        register_types = {}
+        if self.type_lookup:
+            try:
+                register_types = self.type_lookup(name) or {}
+            except Exception as e:
+                log.debug(f"No register types for {name}: {e}")
+        for field in pending:
+            datatype = datatype_for(fields[field], register_types.get(field))
+            entry = device.metrics.get(field)
+            if entry is None:
+                device.metrics[field] = [self._next_alias, datatype]
+                self._next_alias += 1
+            else:
+                entry[1] = datatype
+        return True
+
+    def _write_batch(self, samples):
+        for sample in samples:
+            self._write_sample(sample)
+
+    def _write_sample(self, sample):
+        with self._lock:
+            device = self.devices.get(sample.inverter)
+            if device is None:
+                device = self.devices[sample.inverter] = _Device()
+            rebirth = self._declare(sample.inverter, device, sample.fields)
+            timestamp = int(sample.time * 1000)
+            if rebirth or not device.born:
+                device.last = {field: _coerce(device.metrics[field][1], value)
+                               for field, value in sample.fields.items() if field in device.metrics}
+                if self.client.is_connected():
+                    self._publish_birth(sample.inverter, device, timestamp)
+                return
+            # Report by exception: only metrics whose value changed
+            metrics = []
+            for field, value in sample.fields.items():
+                entry = device.metrics.get(field)
+                if entry is None:
+                    continue
+                value = _coerce(entry[1], value)
+                if device.last.get(field) == value:
+                    continue
+                device.last[field] = value
+                metrics.append(encode_metric(value, entry[0], entry[1]))
+            if metrics and self.client.is_connected():
+                self.client.publish(self._topic("DDATA", sample.inverter),
+                                    encode_payload(timestamp, metrics, self._next_seq()), qos=0)
+
+    def close(self):
+        """Publishes DDEATH for all devices and NDEATH, then disconnects."""
+        super().close()
+        with self._lock:
+            if self.client.is_connected():
+                now = int(time.time() * 1000)
+                for name in self.devices:
+                    self.client.publish(self._topic("DDEATH", name), encode_payload(now, [], self._next_seq()),
+                                        qos=0)
+                death = encode_payload(now, [encode_metric(self.bd_seq, 1, UINT64, "bdSeq")])
+                self.client.publish(self._topic("NDEATH"), death, qos=1).wait_for_publish(timeout=5)
+        self.client.loop_stop()
+        self.client.disconnect()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+spool.py
+
+Disk-backed store-and-forward queue for broker outages.
+Samples that cannot be delivered are appended to a SQLite database (WAL mode)
+and replayed in order, at a limited rate, once the broker is reachable again.
+Retention is bounded by age and total payload size.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Retention is enforced every N appends (and once on open)
+_PRUNE_EVERY = 100
+
+
+class Spool:
+    """
+    Append-only message spool backed by SQLite.
+    """
+
+    def __init__(self, path, max_age=604800, max_size_mb=50, replay_rate=20):
+        """
+        :param path: Path of the SQLite database file
+        :param max_age: Drop spooled messages older than this (seconds)
+        :param max_size_mb: Drop the oldest messages when the payloads exceed this size
+        :param replay_rate: Maximum number of replayed messages per second
+        """
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.replay_rate = replay_rate
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "ts REAL NOT NULL, "
+            "topic TEXT NOT NULL, "
+            "payload BLOB NOT NULL, "
+            "retain INTEGER NOT NULL)"
+        )
+        self._appends = 0
+        self._replaying = False
+        self.prune()
+        self.pending = self.db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        if self.pending:
+            log.info(f"Spool {path} contains {self.pending} undelivered messages")
+
+    @classmethod
+    def from_config(cls, settings, suffix=None):
+        """
+        Builds the spool from the [spool] section.
+        :param settings: RawConfigParser instance
+        :param suffix: Inserted before the file extension (one spool file per broker)
+        :return: Spool or None if disabled
+        """
+        if not settings.getboolean('spool', 'enabled', fallback=False):
+            return None
+        path = settings.get('spool', 'path', fallback='growatt2mqtt_spool.db')
+        if suffix:
+            root, ext = os.path.splitext(path)
+            path = f"{root}.{suffix}{ext}"
+        return cls(
+            path,
+            max_age=settings.getint('spool', 'max_age', fallback=604800),
+            max_size_mb=settings.getfloat('spool', 'max_size_mb', fallback=50),
+            replay_rate=settings.getfloat('spool', 'replay_rate', fallback=20),
+        )
+
+    def append(self, topic, payload, retain=False, ts=None):
+        """
+        Stores a message for later delivery.
+        :param topic: MQTT topic
+        :param payload: Encoded payload (str or bytes)
+        :param retain: MQTT retain flag
+        :param ts: Time the sample was taken (defaults to now)
+        """
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO spool (ts, topic, payload, retain) VALUES (?, ?, ?, ?)",
+                (ts or time.time(), topic, payload, int(retain))
+            )
+            self.pending += 1
+            self._appends += 1
+            if self._appends % _PRUNE_EVERY == 0:
+                self._prune_locked()
+
+    def prune(self):
+        """Applies the retention policy (age and size)."""
+        with self.lock:
+            self._prune_locked()
+
+    def _prune_locked(self):
+        cur = self.db.execute("DELETE FROM spool WHERE ts < ?", (time.time() - self.max_age,))
+        dropped = cur.rowcount
+        total = self.db.execute("SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM spool").fetchone()[0]
+        while total > self.max_bytes:
+            # Drop the oldest 10% (at least one message) until we are below the limit
+            rows = self.db.execute(
+                "SELECT id, LENGTH(payload) FROM spool ORDER BY id LIMIT "
+                "MAX(1, (SELECT COUNT(*) FROM spool) / 10)"
+            ).fetchall()
+            if not rows:
+                break
+            self.db.execute("DELETE FROM spool WHERE id <= ?", (rows[-1][0],))
+            total -= sum(length for _, length in rows)
+            dropped += len(rows)
+        if dropped:
+            self.pending = max(0, self.pending - dropped)
+            log.warning(f"Spool retention dropped {dropped} messages")
+
+    def replay(self, publish, is_connected, batch_size=100):
+        """
+        Delivers spooled messages in order until the spool is empty or the connection drops.
+        :param publish: Callable(topic, payload, retain) -> bool, True once the broker accepted the message
+        :param is_connected: Callable returning False to abort the replay
+        :param batch_size: Number of messages fetched from disk at once
+        :return: Number of delivered messages
+        """
+        with self.lock:
+            if self._replaying:
+                return 0
+            self._replaying = True
+        delay = 1.0 / self.replay_rate if self.replay_rate > 0 else 0.0
+        delivered = 0
+        try:
+            while is_connected():
+                with self.lock:
+                    rows = self.db.execute(
+                        "SELECT id, topic, payload, retain FROM spool ORDER BY id LIMIT ?", (batch_size,)
+                    ).fetchall()
+                if not rows:
+                    break
+                for row_id, topic, payload, retain in rows:
+                    if not is_connected() or not publish(topic, payload, bool(retain)):
+                        return delivered
+                    with self.lock:
+                        cur = self.db.execute("DELETE FROM spool WHERE id = ?", (row_id,))
+                        self.pending = max(0, self.pending - cur.rowcount)
+                    delivered += 1
+                    if delay:
+                        time.sleep(delay)
+            return delivered
+        finally:
+            with self.lock:
+                self._replaying = False
+            if delivered:
+                log.info(f"Replayed {delivered} spooled messages ({self.pending} left)")
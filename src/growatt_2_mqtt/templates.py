@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+templates.py
+
+User-defined payload templates.
+A template selects, renames, groups and scales fields, e.g.
+
+    [templates]
+    grouped =
+        time = $time
+        pv.power = Ppv
+        grid.power_kw = Pac * 0.001
+        battery.soc = SOC
+
+Each template is compiled once at startup into a plain Python function, so
+building a payload costs no more than writing the dict by hand.
+"""
+
+import logging
+import re
+
+log = logging.getLogger(__name__)
+
+# Sources that are not fields -> expression in the generated builder
+SPECIAL_SOURCES = {
+    "$time": "int(ts)",
+    "$time_ms": "int(ts * 1000)",
+    "$measurement": "measurement",
+    "$inverter": "inverter",
+    "$model": "model",
+    "$fields": "dict(fields)",
+}
+
+# The shape used when no template is configured
+DEFAULT_SPEC = """
+time = $time
+measurement = $measurement
+fields = $fields
+"""
+
+_LINE = re.compile(r"^(?P<path>[^=\s]+)\s*=\s*(?P<source>\S+)(?:\s*\*\s*(?P<factor>[-+0-9.eE]+))?$")
+
+
+def parse_template(spec):
+    """
+    Parses a template definition.
+    :param spec: One 'output.path = source [* factor]' assignment per line
+    :return: Nested dict; leaves are (source, factor or None)
+    """
+    tree = {}
+    for number, line in enumerate(spec.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith(("#", ";")):
+            continue
+        match = _LINE.match(line)
+        if not match:
+            raise ValueError(f"line {number}: expected 'path = source [* factor]', got '{line}'")
+        source = match.group("source")
+        if source.startswith("$") and source not in SPECIAL_SOURCES:
+            raise ValueError(f"line {number}: unknown source {source} "
+                             f"(supported: {', '.join(SPECIAL_SOURCES)})")
+        factor = float(match.group("factor")) if match.group("factor") else None
+        if factor is not None and source.startswith("$"):
+            raise ValueError(f"line {number}: {source} cannot be scaled")
+        *groups, key = match.group("path").split(".")
+        node = tree
+        for group in groups:
+            node = node.setdefault(group, {})
+            if not isinstance(node, dict):
+                raise ValueError(f"line {number}: '{group}' is both a value and a group")
+        if key in node:
+            raise ValueError(f"line {number}: '{match.group('path')}' is assigned twice")
+        node[key] = (source, factor)
+    if not tree:
+        raise ValueError("template is empty")
+    return tree
+
+
+def _generate(node, var, lines, counter):
+    """Appends the statements filling dict `var` from a template (sub)tree."""
+    for key, child in node.items():
+        if isinstance(child, dict):
+            counter[0] += 1
+            sub = f"g{counter[0]}"
+            lines.append(f"{sub} = {{}}")
+            _generate(child, sub, lines, counter)
+            # Groups without any present field are left out
+            lines.append(f"if {sub}: {var}[{key!r}] = {sub}")
+            continue
+        source, factor = child
+        if source in SPECIAL_SOURCES:
+            lines.append(f"{var}[{key!r}] = {SPECIAL_SOURCES[source]}")
+            continue
+        lines.append(f"v = get({source!r})")
+        if factor is None:
+            lines.append(f"if v is not None: {var}[{key!r}] = v")
+        else:
+            lines.append(f"if v is not None: {var}[{key!r}] = v if v.__class__ is str else round(v * {factor!r}, 6)")
+
+
+class PayloadTemplate:
+    """
+    A compiled payload template.
+    """
+
+    def __init__(self, name, spec):
+        """
+        :param name: Template name (for messages)
+        :param spec: Template definition, see parse_template()
+        """
+        self.name = name
+        try:
+            self.tree = parse_template(spec)
+        except ValueError as e:
+            raise ValueError(f"Payload template '{name}': {e}") from None
+        self.sources = set()
+        self._collect_sources(self.tree)
+        self._checked_models = set()
+
+        lines = []
+        _generate(self.tree, "out", lines, [0])
+        self.source_code = ("def build(ts, measurement, inverter, model, fields):\n"
+                            "    get = fields.get\n"
+                            "    out = {}\n"
+                            + "".join(f"    {line}\n" for line in lines)
+                            + "    return out\n")
+        namespace = {}
+        exec(compile(self.source_code, f"<template {name}>", "exec"), namespace)
+        self._build = namespace["build"]
+
+    def _collect_sources(self, node):
+        for child in node.values():
+            if isinstance(child, dict):
+                self._collect_sources(child)
+            elif child[0] not in SPECIAL_SOURCES:
+                self.sources.add(child[0])
+
+    def build(self, sample, fields=None):
+        """
+        Builds the payload of a sample.
+        :param sample: Sample
+        :param fields: Fields to use instead of sample.fields (e.g. after report-by-exception)
+        :return: dict
+        """
+        return self._build(sample.time, sample.measurement, sample.inverter, sample.model,
+                           sample.fields if fields is None else fields)
+
+    def check(self, model, fields):
+        """
+        Warns (once per model) about template fields the model does not provide.
+        :param model: Inverter model
+        :param fields: Complete field dict of a sample of this model
+        """
+        if model in self._checked_models:
+            return
+        self._checked_models.add(model)
+        missing = sorted(self.sources.difference(fields))
+        if missing:
+            log.warning(f"Payload template '{self.name}' uses fields that {model} does not provide: "
+                        f"{', '.join(missing)}")
+
+
+def load_templates(settings):
+    """
+    Compiles all templates of the [templates] section.
+    :param settings: RawConfigParser instance
+    :return: dict name -> PayloadTemplate
+    """
+    if not settings.has_section('templates'):
+        return {}
+    return {name: PayloadTemplate(name, spec) for name, spec in settings.items('templates')}
+
+
+def template_from_config(settings, section, templates):
+    """
+    Resolves the 'template' option of an output section.
+    :param settings: RawConfigParser instance
+    :param section: Output section ([mqtt], [mqtt.<name>], [file])
+    :param templates: Result of load_templates()
+    :return: PayloadTemplate or None for the default shape
+    """
+    name = settings.get(section, 'template', fallback=None)
+    if not name:
+        return None
+    # RawConfigParser lowercases the option names of [templates]
+    name = name.strip().lower()
+    if name not in templates:
+        raise ValueError(f"[{section}] uses unknown payload template '{name}'")
+    return templates[name]
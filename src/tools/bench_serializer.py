@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: live data serialization.
+
+Compares the previous path (json.dumps(payload, default=str) on every cycle)
+with the JsonSerializer fast path and orjson (if installed), using a payload
+shaped like a MOD-XH sample. Also checks that all variants decode to the same document.
+
+Usage:
+    python3 tools/bench_serializer.py [--model MOD-XH] [--number 20000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from growatt_2_mqtt.serializer import JsonSerializer, orjson  # noqa: E402
+from growatt_2_mqtt.register_maps.growatt_MOD_TL3_XH_input import (  # noqa: E402
+    REG_INPUT_MOD_TL3_XH_MAP, REG_INPUT_MOD_TL3_XH_BAT_MAP)
+from growatt_2_mqtt.register_maps.growatt_MAX_input_reg import (  # noqa: E402
+    REG_INPUT_MAX_MAP, REG_INPUT_MAX_STRING_MAP, REG_INPUT_MAX_DATA_MAP)
+
+MODELS = {
+    "MOD-XH": (REG_INPUT_MOD_TL3_XH_MAP, REG_INPUT_MOD_TL3_XH_BAT_MAP),
+    "MAX": (REG_INPUT_MAX_MAP, REG_INPUT_MAX_STRING_MAP, REG_INPUT_MAX_DATA_MAP),
+}
+
+
+def build_payload(model):
+    """Builds a payload with realistic value types for every mapped register."""
+    fields = {}
+    for reg_map in MODELS[model]:
+        for name, (_, _, scale, dtype) in reg_map.items():
+            if dtype == "ascii":
+                fields[name] = "GRW1234567"
+            elif scale == 1 and dtype in ("uint", "int"):
+                fields[name] = random.randint(0, 65535)
+            else:
+                fields[name] = round(random.uniform(0, 6500), 1)
+    fields["StatusVal"] = "NormalStatus"
+    fields["StatusMode"] = "Normal (Battery Idle)"
+    return {"time": 1700000000, "measurement": "mod_hybrid", "fields": fields}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialization micro-benchmark")
+    parser.add_argument("--model", choices=sorted(MODELS), default="MOD-XH")
+    parser.add_argument("--number", type=int, default=20000, help="Iterations per variant")
+    args = parser.parse_args()
+
+    payload = build_payload(args.model)
+    reference = json.loads(json.dumps(payload, default=str))
+
+    variants = [("json.dumps(default=str)", lambda: json.dumps(payload, default=str))]
+    fast = JsonSerializer(use_orjson=False)
+    variants.append(("JsonSerializer (stdlib)", lambda: fast.dumps(payload)))
+    if orjson is not None:
+        fast_orjson = JsonSerializer(use_orjson=True)
+        variants.append(("JsonSerializer (orjson)", lambda: fast_orjson.dumps(payload)))
+
+    print(f"Model {args.model}: {len(payload['fields'])} fields, {args.number} iterations")
+    baseline = None
+    for name, func in variants:
+        if json.loads(func()) != reference:
+            print(f"  {name:30s} MISMATCH - output differs from json.dumps")
+            continue
+        seconds = min(timeit.repeat(func, number=args.number, repeat=3))
+        per_call = seconds / args.number * 1e6
+        baseline = baseline or per_call
+        print(f"  {name:30s} {per_call:8.2f} us/call  ({baseline / per_call:4.1f}x)  {len(func())} bytes")
+
+
+if __name__ == "__main__":
+    main()
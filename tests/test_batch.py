@@ -0,0 +1,41 @@
+import pytest
+
+from growatt_2_mqtt.batch import SampleBatcher
+
+
+def test_rows_layout_flushes_when_full():
+    batcher = SampleBatcher(max_samples=2, layout="rows")
+    assert batcher.add("main", "growatt", 1.0, {"Pac": 1}, now=0) is None
+    batch = batcher.add("main", "growatt", 1.5, {"Pac": 2, "Vac1": 230}, now=0.5)
+    assert batch == {
+        'measurement': 'growatt',
+        'samples': [{'time': 1.0, 'fields': {"Pac": 1}},
+                    {'time': 1.5, 'fields': {"Pac": 2, "Vac1": 230}}],
+    }
+    assert batcher.flush_all() == []
+
+
+def test_columns_layout_fills_missing_fields():
+    batcher = SampleBatcher(max_samples=2, layout="columns")
+    batcher.add("main", "growatt", 1.0, {"Pac": 1, "Vac1": 229}, now=0)
+    batch = batcher.add("main", "growatt", 2.0, {"Pac": 2, "Fac": 50.0}, now=1)
+    assert batch == {
+        'measurement': 'growatt',
+        'time': [1.0, 2.0],
+        'fields': {"Pac": [1, 2], "Vac1": [229, None], "Fac": [None, 50.0]},
+    }
+
+
+def test_due_by_age_per_inverter():
+    batcher = SampleBatcher(max_samples=0, max_age_ms=500)
+    batcher.add("a", "growatt", 1.0, {"Pac": 1}, now=0)
+    batcher.add("b", "growatt", 1.0, {"Pac": 1}, now=0.3)
+    assert batcher.due(now=0.4) == []
+    due = batcher.due(now=0.6)
+    assert [key for key, _ in due] == ["a"]
+    assert [key for key, _ in batcher.flush_all()] == ["b"]
+
+
+def test_unknown_layout():
+    with pytest.raises(ValueError):
+        SampleBatcher(layout="matrix")
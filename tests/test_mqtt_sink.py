@@ -0,0 +1,96 @@
+import configparser
+import threading
+
+import paho.mqtt.client as mqtt
+
+from growatt_2_mqtt.mqtt_sink import MqttSink
+
+
+def make_sink(qos=1, max_pending=5, spool_path=None):
+    settings = configparser.RawConfigParser()
+    settings.read_dict({'mqtt': {'qos': str(qos), 'max_pending': str(max_pending)}})
+    if spool_path:
+        settings.read_dict({'spool': {'enabled': 'true', 'path': str(spool_path)}})
+    return MqttSink(settings)
+
+
+def test_disconnected_qos1_is_not_buffered_by_paho():
+    sink = make_sink()
+    try:
+        for i in range(20):
+            assert not sink.send(f"t/{i}", "x")
+        assert len(sink.client._out_messages) == 0
+        assert sink.unpublished == 0
+    finally:
+        sink.close()
+
+
+def test_stale_connection_counts_against_cap():
+    sink = make_sink(max_pending=5)
+    # is_connected() still reports True while paho already refuses with NO_CONN
+    sink.client.is_connected = lambda: True
+    try:
+        for i in range(5):
+            sink.send(f"t/{i}", "x")
+        assert len(sink.client._out_messages) == 5
+        assert sink.unpublished == 5
+
+        waiter = threading.Thread(target=sink._wait_for_paho, daemon=True)
+        waiter.start()
+        waiter.join(0.3)
+        assert waiter.is_alive(), "publisher must wait while max_pending messages are held by paho"
+        sink._closing = True
+        waiter.join(1)
+        assert not waiter.is_alive()
+    finally:
+        sink._closing = False
+        sink.close()
+
+
+def test_qos0_disconnect_releases_pending():
+    sink = make_sink(qos=0, max_pending=1)
+    try:
+        info = mqtt.MQTTMessageInfo(1)
+        sink._pending.append((sink._generation, info))
+        sink._on_disconnect(sink.client, None, 1)
+        sink._wait_for_paho()
+        assert sink.unpublished == 0
+    finally:
+        sink.close()
+
+
+def test_message_kept_by_paho_is_not_spooled(tmp_path):
+    sink = make_sink(spool_path=tmp_path / "spool.db")
+    sink.client.is_connected = lambda: True
+    try:
+        assert sink.send("t/state", "x", store=True, ts=1)
+        # paho resends its own copy after the reconnect; a spooled one would be a duplicate
+        assert len(sink.client._out_messages) == 1
+        assert sink.spool.pending == 0
+    finally:
+        sink.close()
+
+
+def test_disconnected_sample_is_spooled_once(tmp_path):
+    sink = make_sink(spool_path=tmp_path / "spool.db")
+    try:
+        assert sink.send("t/state", "x", store=True, ts=1)
+        assert len(sink.client._out_messages) == 0
+        assert sink.spool.pending == 1
+    finally:
+        sink.close()
+
+
+def test_field_topics_are_resent_after_reconnect():
+    sink = make_sink(qos=0)
+    sent = []
+    sink.send = lambda topic, data, **kwargs: sent.append(topic) or True
+    try:
+        sink._publish_fields("main", {"Pac": 1.0, "Eac_Total": 5.0})
+        sink._publish_fields("main", {"Pac": 1.0, "Eac_Total": 5.0})
+        assert len(sent) == 2
+        sink._on_connect(sink.client, None, {}, 0)
+        sink._publish_fields("main", {"Pac": 1.0, "Eac_Total": 5.0})
+        assert len(sent) == 4
+    finally:
+        sink.close()
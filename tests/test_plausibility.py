@@ -0,0 +1,81 @@
+import pytest
+
+from growatt_2_mqtt.plausibility import DEFAULT_RULES, PlausibilityFilter, parse_rule
+
+
+def baseline(f, value=100.0, now=0):
+    """Feeds two consistent samples so the counter has a confirmed baseline."""
+    for i in range(2):
+        data = {"Eac_Total": value}
+        f.check("main", data, now=now + i)
+    assert data == {"Eac_Total": value}
+
+
+def test_first_value_needs_confirmation():
+    f = PlausibilityFilter(DEFAULT_RULES)
+    data = {"Eac_Total": 9e6, "Pac": 1}
+    assert f.check("main", data, now=0) == ()
+    # Withheld, not published as baseline
+    assert data == {"Pac": 1}
+    data = {"Eac_Total": 100.0}
+    f.check("main", data, now=10)
+    assert data == {}
+    data = {"Eac_Total": 100.2}
+    f.check("main", data, now=20)
+    assert data == {"Eac_Total": 100.2}
+    assert f.total_rejections == 0
+
+
+def test_monotonic_and_rate_hold_last_good_value():
+    f = PlausibilityFilter(DEFAULT_RULES)
+    baseline(f)
+    data = {"Eac_Total": 99.0}
+    assert f.check("main", data, now=10) == ["Eac_Total"]
+    assert data == {"Eac_Total": 100.0}
+    data = {"Eac_Total": 5000.0}
+    assert f.check("main", data, now=20) == ["Eac_Total"]
+    assert f.total_rejections == 2
+
+
+def test_persistent_step_becomes_new_baseline():
+    f = PlausibilityFilter(DEFAULT_RULES, rebase_after=3)
+    baseline(f)
+    for i in range(3):
+        data = {"Eac_Total": 10.0}
+        assert f.check("main", data, now=10 + i) == ["Eac_Total"]
+    data = {"Eac_Total": 10.0}
+    assert f.check("main", data, now=20) == ()
+    assert data == {"Eac_Total": 10.0}
+    data = {"Eac_Total": 10.1}
+    assert f.check("main", data, now=30) == ()
+
+
+def test_out_of_bounds_never_rebases():
+    f = PlausibilityFilter({"pac": "min=0, max=30000"}, rebase_after=1)
+    for now in range(5):
+        data = {"Pac": 65535}
+        assert f.check("main", data, now=now) == ["Pac"]
+        assert data == {}
+
+
+def test_non_final_check_is_not_counted():
+    f = PlausibilityFilter(DEFAULT_RULES)
+    baseline(f)
+    data = {"Eac_Total": 1e6}
+    assert f.check("main", data, now=10, final=False) == ["Eac_Total"]
+    assert data == {"Eac_Total": 1e6} and f.total_rejections == 0
+    data["Eac_Total"] = 100.1
+    assert f.check("main", data, now=10, fields={"Eac_Total"}) == ()
+    assert f.total_rejections == 0
+
+
+def test_drop_action():
+    f = PlausibilityFilter({"pac": "max=100"}, action="drop")
+    data = {"Pac": 200}
+    f.check("main", data, now=0)
+    assert data == {}
+
+
+def test_invalid_rule():
+    with pytest.raises(ValueError):
+        parse_rule("monotonic, speed=3")
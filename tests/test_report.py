@@ -0,0 +1,36 @@
+from growatt_2_mqtt.report import ReportByException
+
+
+def test_deadband_and_keyframe():
+    reporter = ReportByException({"pac": "10"}, default_deadband="1%", keyframe_interval=60)
+    fields, keyframe = reporter.select("main", {"Pac": 100.0, "Vac1": 230.0}, now=0)
+    assert keyframe and fields == {"Pac": 100.0, "Vac1": 230.0}
+    reporter.commit("main", fields, keyframe, now=0)
+
+    fields, keyframe = reporter.select("main", {"Pac": 105.0, "Vac1": 233.0}, now=1)
+    assert not keyframe and fields == {"Vac1": 233.0}
+    reporter.commit("main", fields, keyframe, now=1)
+
+    fields, keyframe = reporter.select("main", {"Pac": 105.0, "Vac1": 233.0}, now=60)
+    assert keyframe
+
+
+def test_uncommitted_fields_are_selected_again():
+    reporter = ReportByException({}, keyframe_interval=60)
+    fields, keyframe = reporter.select("main", {"Pac": 1.0}, now=0)
+    # Publish failed: nothing committed, the keyframe is retried
+    assert reporter.select("main", {"Pac": 1.0}, now=1) == ({"Pac": 1.0}, True)
+    reporter.commit("main", fields, keyframe, now=1)
+
+    changed, _ = reporter.select("main", {"Pac": 2.0}, now=2)
+    assert changed == {"Pac": 2.0}
+    # Not committed, so still changed with the next sample
+    assert reporter.select("main", {"Pac": 2.0}, now=3) == ({"Pac": 2.0}, False)
+
+
+def test_reset_forces_keyframe():
+    reporter = ReportByException({}, keyframe_interval=60)
+    fields, keyframe = reporter.select("main", {"Pac": 1.0}, now=0)
+    reporter.commit("main", fields, keyframe, now=0)
+    reporter.reset()
+    assert reporter.select("main", {"Pac": 1.0}, now=1) == ({"Pac": 1.0}, True)
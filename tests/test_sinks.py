@@ -0,0 +1,78 @@
+import pytest
+
+from growatt_2_mqtt.sinks import Sample, SampleQueue
+
+
+def sample(inverter, t):
+    return Sample(inverter, "MAX", "growatt", t, {"Pac": t})
+
+
+def times(batch):
+    return [(s.inverter, s.time) for s in batch]
+
+
+def test_drop_oldest():
+    q = SampleQueue(2, "drop_oldest")
+    assert q.put(sample("a", 1)) and q.put(sample("a", 2))
+    assert not q.put(sample("a", 3))
+    assert q.dropped == 1
+    assert times(q.get_batch(10)) == [("a", 2), ("a", 3)]
+
+
+def test_drop_newest():
+    q = SampleQueue(2, "drop_newest")
+    q.put(sample("a", 1))
+    q.put(sample("a", 2))
+    assert not q.put(sample("a", 3))
+    assert q.dropped == 1
+    assert times(q.get_batch(10)) == [("a", 1), ("a", 2)]
+
+
+def test_coalesce_keeps_newest_per_inverter_in_place():
+    q = SampleQueue(2, "coalesce")
+    q.put(sample("a", 1))
+    q.put(sample("b", 2))
+    assert not q.put(sample("a", 3))
+    assert q.coalesced == 1 and q.dropped == 0
+    assert len(q) == 2
+    assert times(q.get_batch(10)) == [("a", 3), ("b", 2)]
+
+
+def test_coalesce_overflow_drops_oldest_inverter():
+    q = SampleQueue(1, "coalesce")
+    q.put(sample("a", 1))
+    assert not q.put(sample("b", 2))
+    assert q.dropped == 1
+    assert times(q.get_batch(10)) == [("b", 2)]
+
+
+def test_requeue_respects_limit():
+    q = SampleQueue(2, "drop_oldest")
+    q.put(sample("a", 1))
+    q.put(sample("a", 2))
+    batch = q.get_batch(1)
+    q.put(sample("a", 3))
+    q.requeue(batch)
+    assert q.dropped == 1
+    assert times(q.get_batch(10)) == [("a", 2), ("a", 3)]
+
+
+def test_requeue_coalesce_skips_superseded():
+    q = SampleQueue(5, "coalesce")
+    q.put(sample("a", 1))
+    batch = q.get_batch(1)
+    q.put(sample("a", 2))
+    q.requeue(batch)
+    assert times(q.get_batch(10)) == [("a", 2)]
+
+
+def test_oldest_age():
+    q = SampleQueue(5)
+    assert q.oldest_age(now=10) == 0.0
+    q.put(sample("a", 4))
+    assert q.oldest_age(now=10) == 6
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        SampleQueue(5, "lifo")
@@ -0,0 +1,34 @@
+from growatt_2_mqtt.sparkplug import (BOOLEAN, DOUBLE, INT32, REBIRTH, STRING, UINT16, decode_metrics,
+                                      encode_metric, encode_payload)
+
+
+def test_birth_metric_bytes():
+    # name "Vac1", alias 3, datatype Double (10), double_value 230.5
+    expected = bytes.fromhex("0a04" + b"Vac1".hex() + "1003" + "200a" + "69" + "0000000000d06c40")
+    assert encode_metric(230.5, 3, DOUBLE, name="Vac1") == expected
+
+
+def test_data_metrics_by_alias():
+    # int_value (field 10) without name and datatype
+    assert encode_metric(50, 7, UINT16) == bytes.fromhex("1007" + "5032")
+    # Negative values are two's complement of 32 bit
+    assert encode_metric(-1, 7, INT32) == bytes.fromhex("1007" + "50ffffffff0f")
+    assert encode_metric(None, 7, INT32, timestamp=1) == bytes.fromhex("1007" + "1801" + "3801")
+    assert encode_metric("ok", 1, STRING) == bytes.fromhex("1001" + "7a02" + b"ok".hex())
+
+
+def test_payload_bytes():
+    metric = encode_metric(50, 7, UINT16)
+    expected = bytes.fromhex("08" + "80d095ffbc31" + "12" + "04" + metric.hex() + "1805")
+    assert encode_payload(1700000000000, [metric], seq=5) == expected
+    # NDEATH carries no sequence number
+    assert encode_payload(1700000000000, []) == bytes.fromhex("0880d095ffbc31")
+
+
+def test_decode_command():
+    payload = encode_payload(1, [encode_metric(True, 0, BOOLEAN, name=REBIRTH),
+                                 encode_metric(80, 5, UINT16)], seq=0)
+    assert decode_metrics(payload) == [
+        {'name': REBIRTH, 'alias': 0, 'value': True},
+        {'name': None, 'alias': 5, 'value': 80},
+    ]
@@ -0,0 +1,44 @@
+import configparser
+
+import pytest
+
+from growatt_2_mqtt.sinks import Sample
+from growatt_2_mqtt.templates import load_templates, template_from_config
+
+CONFIG = """
+[templates]
+Grouped =
+    time = $time
+    inverter = $inverter
+    grid.power_kw = Pac * 0.001
+    battery.soc = SOC
+
+[mqtt]
+template = Grouped
+
+[mqtt.other]
+template = missing
+"""
+
+
+def load():
+    settings = configparser.RawConfigParser()
+    settings.read_string(CONFIG)
+    return settings, load_templates(settings)
+
+
+def test_template_name_is_case_insensitive():
+    settings, templates = load()
+    template = template_from_config(settings, 'mqtt', templates)
+    sample = Sample("main", "MAX", "growatt", 1700000000.5, {"Pac": 2500, "Vac1": 230.0})
+    assert template.build(sample, sample.fields) == {
+        "time": 1700000000,
+        "inverter": "main",
+        "grid": {"power_kw": 2.5},
+    }
+
+
+def test_unknown_template_is_rejected():
+    settings, templates = load()
+    with pytest.raises(ValueError):
+        template_from_config(settings, 'mqtt.other', templates)
@@ -0,0 +1,93 @@
+import threading
+
+from growatt_2_mqtt.growatt import Growatt, compile_write_map, write_tables
+
+
+class FakeClient:
+    """Holding registers in a dict; records the writes."""
+
+    def __init__(self, registers=None):
+        self.registers = dict(registers or {})
+        self.writes = []
+
+    def write_register(self, address, value, slave):
+        self.writes.append((address, [value]))
+        self.registers[address] = value
+        return object()
+
+    def write_registers(self, address, values, slave):
+        self.writes.append((address, list(values)))
+        for i, value in enumerate(values):
+            self.registers[address + i] = value
+        return object()
+
+    def read_holding_registers(self, address, count, slave):
+        class Response:
+            registers = [self.registers.get(address + i, 0) for i in range(count)]
+        return Response()
+
+
+def inverter(model="MAX", registers=None, allow_protected=False):
+    return Growatt(FakeClient(registers), "main", 1, model, allow_protected=allow_protected)
+
+
+def test_only_switch_and_number_fields_are_compiled():
+    write_map = compile_write_map(((0, {
+        "OnOff": (0, 1, 1, "uint"),
+        "ActivePowerRate": (3, 1, 1, "uint"),
+        "Year": (45, 1, 1, "uint"),
+        "SerialNumber": (23, 5, 1, "ascii"),
+        "Unknown": (50, 1, 1, "uint"),
+    }),))
+    assert set(write_map) == {"OnOff", "ActivePowerRate"}
+    assert write_map["OnOff"] == (0, 1, 0, 1, False)
+    assert write_map["ActivePowerRate"] == (3, 1, 0, 100, False)
+
+
+def test_protected_fields_need_opt_in():
+    write_maps, write_groups = write_tables()
+    protected_maps, protected_groups = write_tables(allow_protected=True)
+    for field in ("GridVoltHigh", "GridFreqLow", "ModbusAddress", "GridStandard"):
+        assert field not in write_maps["TL3X"]
+        assert field in protected_maps["TL3X"]
+    assert "BatteryType" not in write_maps["SPH"] and "BatteryType" in protected_maps["SPH"]
+    assert "GridLimits" not in write_groups["MAX"] and "GridLimits" in protected_groups["MAX"]
+    # Aliases share the tables of their model
+    assert write_groups["TL_X_MIN"] == write_groups["TL-XH"]
+
+
+def test_range_and_scale():
+    inv = inverter()
+    assert inv.to_raw("VpvStart", 120.5) == 1205
+    assert inv.to_raw("PowerFactor", 1.5) == 15000
+    for field, value in (("ActivePowerRate", 101), ("OnOff", 2), ("VpvStart", 50)):
+        assert not inv.write_command(field, value, threading.Lock())
+    assert inv.client.writes == []
+    assert inv.write_command("ActivePowerRate", 80, threading.Lock())
+    assert inv.client.writes == [(3, [80])]
+
+
+def test_protected_write_is_rejected_by_default():
+    inv = inverter("TL3X")
+    assert not inv.write_command("ModbusAddress", 2, threading.Lock())
+    inv = inverter("TL3X", allow_protected=True)
+    assert not inv.write_command("GridVoltHigh", 300, threading.Lock())
+    assert inv.write_command("GridVoltHigh", 253.5, threading.Lock())
+    assert inv.client.writes == [(16, [2535])]
+
+
+def test_write_group_fills_missing_fields_from_the_inverter():
+    inv = inverter(registers={231: 0, 232: 40})
+    lock = threading.Lock()
+    assert inv.write_group("ExportLimit", {"ExportLimitEnable": 1}, lock)
+    assert inv.client.writes == [(231, [1, 40])]
+    assert inv.read_back("ExportLimit", lock) == {"ExportLimitEnable": 1, "ExportLimitRate": 40}
+
+
+def test_write_group_rejects_bad_values_and_fields():
+    inv = inverter()
+    lock = threading.Lock()
+    assert not inv.write_group("ExportLimit", {"ExportLimitEnable": 2}, lock)
+    assert not inv.write_group("ExportLimit", {"OnOff": 1}, lock)
+    assert not inv.write_group("GridLimits", {"GridVoltHigh": 253}, lock)
+    assert inv.client.writes == []